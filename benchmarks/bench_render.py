@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Per page rasterization cost of each renderer on a PDF whose pages share one large image."""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import PyPDF2
+from synthetic import ensure_pdf
+
+
+def time_pypdf_copy(the_file, pages):
+    """Seconds per page spent only building and serialising the single page PDFs the pypdf renderer uses."""
+    pdf_file = PyPDF2.PdfFileReader(the_file)
+    start = time.perf_counter()
+    size = 0
+    for page_number in range(pages):
+        dst_pdf = PyPDF2.PdfFileWriter()
+        dst_pdf.addPage(pdf_file.getPage(page_number))
+        pdf_bytes = io.BytesIO()
+        dst_pdf.write(pdf_bytes)
+        size += pdf_bytes.tell()
+    return (time.perf_counter() - start) / pages, size / pages
+
+
+def time_renderer(name, the_file, pages, resolution):
+    """Seconds per page to rasterize the first pages pages with renderer name."""
+    from hocrrender import get_renderer
+    renderer = get_renderer(name, the_file, resolution)
+    start = time.perf_counter()
+    for page_number in range(pages):
+        renderer.render(page_number).close()
+    renderer.close()
+    return (time.perf_counter() - start) / pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare renderer cost per page')
+    parser.add_argument('--pages', type=int, default=20, help='Number of pages to render')
+    parser.add_argument('--image-size', type=int, default=3000,
+                        help='Width and height in pixels of the image shared by every page')
+    parser.add_argument('--resolution', type=int, default=300, help='Render DPI')
+    parser.add_argument('--work-dir', default=os.path.join(tempfile.gettempdir(), 'hocr-bench'),
+                        help='Where to keep the generated PDF')
+    parser.add_argument('--copy-only', action='store_true',
+                        help='Only time the PyPDF2 page copy, for machines without ImageMagick')
+    args = parser.parse_args()
+
+    the_file = ensure_pdf(args.work_dir, 'shared-{}-{}.pdf'.format(args.pages, args.image_size),
+                          pages=args.pages, shared_image=args.image_size)
+    print('{}: {} pages, {:.1f} MB'.format(the_file, args.pages, os.path.getsize(the_file) / 1048576))
+
+    (seconds, size) = time_pypdf_copy(the_file, args.pages)
+    print('{:<16} {:>10.1f} ms/page  {:>8.1f} MB/page serialised'.format('pypdf copy', seconds * 1000,
+                                                                          size / 1048576))
+    if args.copy_only:
+        return
+    from hocrrender import renderers
+    for name in renderers:
+        seconds = time_renderer(name, the_file, args.pages, args.resolution)
+        print('{:<16} {:>10.1f} ms/page'.format(name, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""Benchmarks of processing and reviewing, saved as JSON so versions can be compared.
+
+Sections:
+
+    run        Hocr.run pages/s over a synthetic PDF with the stub OCR tool, for each worker count
+    convert    convert_page2png milliseconds per page at each DPI
+    storage    bytes per page and milliseconds to save a 300 DPI page in each page image format
+    displayer  HocrDisplayer milliseconds to open a directory of 10, 1000 and 10000 pages, with and
+               without its cached index
+    preview    milliseconds to fit a page to the preview and to redraw it at each zoom
+    startup    milliseconds for a new interpreter to import hocr and hocreditor, and to find the OCR tool
+               with and without the discovery cache
+
+run, convert and storage need ImageMagick and Ghostscript, without them they are recorded as skipped. Results go in
+benchmarks/results/<time>-<commit>.json; --compare prints how a run differs from an earlier one.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(benchmarks_dir))
+sys.path.insert(0, benchmarks_dir)
+from PIL import Image, ImageDraw
+from synthetic import ensure_pdf
+import stubocr
+
+sections = ('run', 'convert', 'storage', 'displayer', 'preview', 'startup')
+
+
+def is_missing_tool(e):
+    """Does e say ImageMagick, or the Ghostscript it reads PDF files with, is not installed?
+
+    Anything else a section raises is a failure of the benchmark, not a reason to skip it.
+    """
+    if isinstance(e, ImportError):
+        return e.name == 'wand' or 'MagickWand' in str(e)
+    name = type(e).__name__
+    return type(e).__module__ == 'wand.exceptions' and (name.startswith('Delegate') or name.startswith('Policy'))
+
+
+def median_ms(func, repeats):
+    """Median milliseconds of repeats calls of func."""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def bench_run(work_dir, pages, workers_list):
+    """Pages per second and seconds per page in each stage for a whole run."""
+    from hocr import Hocr
+    from hocrevents import ProgressStats
+    the_file = ensure_pdf(work_dir, 'text-{}.pdf'.format(pages), pages=pages)
+    results = {}
+    for workers in workers_list:
+        output_dir = tempfile.mkdtemp(prefix='run', dir=work_dir)
+        try:
+            hocr = Hocr(language='eng', output_directory=output_dir, workers=workers, tool=stubocr)
+            stats = ProgressStats()
+            start = time.perf_counter()
+            hocr.run(the_file, pipe=stats)
+            seconds = time.perf_counter() - start
+        finally:
+            shutil.rmtree(output_dir)
+        results['workers_{}'.format(workers)] = {
+            'pages_per_second': pages / seconds,
+            'stage_seconds_per_page': {stage: total / pages for (stage, total) in stats.stage_seconds.items()},
+            'peak_rss': stats.get_stats()['peak_rss'],
+        }
+    return results
+
+
+def bench_convert(work_dir, resolutions, repeats):
+    """Milliseconds to rasterize a page at each resolution."""
+    import PyPDF2
+    from hocr import Hocr
+    the_file = ensure_pdf(work_dir, 'text-4.pdf', pages=4)
+    hocr = Hocr(tool=stubocr)
+    pdf_file = PyPDF2.PdfFileReader(the_file)
+    return {'dpi_{}'.format(resolution): median_ms(lambda: hocr.convert_page2png(pdf_file, 0, resolution).close(),
+                                                   repeats)
+            for resolution in resolutions}
+
+
+def bench_storage(work_dir, repeats, resolution=300):
+    """Size and milliseconds to save a rasterized page in each image format Hocr can keep pages in."""
+    from hocrrender import PyPdfRenderer, image_formats, save_page_image
+    the_file = ensure_pdf(work_dir, 'text-4.pdf', pages=4)
+    output_dir = tempfile.mkdtemp(prefix='storage', dir=work_dir)
+    results = {}
+    try:
+        with PyPdfRenderer(the_file, resolution).render(0) as page:
+            for image_format in sorted(name for name in image_formats if image_formats[name] is not None):
+                saved = []
+
+                def save():
+                    # Saving changes the image, so each save gets a copy of the page.
+                    with page.clone() as image:
+                        saved.append(save_page_image(image, os.path.join(output_dir, image_format), image_format))
+
+                results[image_format] = {
+                    'encode_ms': median_ms(save, repeats),
+                    'bytes_per_page': os.path.getsize(saved[-1]),
+                }
+    finally:
+        shutil.rmtree(output_dir)
+    return results
+
+
+def page_directory(work_dir, pages):
+    """A directory of pages empty PageN.hocr files, made once."""
+    directory = os.path.join(work_dir, 'pages-{}'.format(pages))
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+        for page_number in range(pages):
+            open(os.path.join(directory, 'Page{}.hocr'.format(page_number)), 'w').close()
+    return directory
+
+
+def bench_displayer(work_dir, sizes, repeats):
+    """Milliseconds to open directories of each size, scanning them and from the cached index."""
+    from hocrdisplayer import HocrDisplayer
+    results = {}
+    for pages in sizes:
+        directory = page_directory(work_dir, pages)
+        index_path = os.path.join(directory, HocrDisplayer.index_filename)
+
+        def cold():
+            if os.path.exists(index_path):
+                os.unlink(index_path)
+            HocrDisplayer(directory)
+
+        results['pages_{}'.format(pages)] = {
+            'scan_ms': median_ms(cold, repeats),
+            'cached_ms': median_ms(lambda: HocrDisplayer(directory), repeats),
+        }
+    return results
+
+
+def page_image(work_dir, size=(2550, 3300)):
+    """A page image the size of a letter page at 300 DPI with lines of word sized blocks, made once."""
+    path = os.path.join(work_dir, 'page-{}x{}.png'.format(*size))
+    if not os.path.exists(path):
+        os.makedirs(work_dir, exist_ok=True)
+        image = Image.new('L', size, 255)
+        draw = ImageDraw.Draw(image)
+        for top in range(150, size[1] - 150, 60):
+            for left in range(150, size[0] - 300, 220):
+                draw.rectangle((left, top, left + 180, top + 30), fill=(left + top) % 128)
+        image.save(path)
+    return path
+
+
+def redraw(cache, path, display_scale, center, canvas_size):
+    """What the preview does to show the part of the page around center at display_scale."""
+    (width, height) = cache.get_size(path)
+    view = canvas_size / display_scale
+    left = min(max(center[0] - view / 2, 0), max(width - view, 0))
+    top = min(max(center[1] - view / 2, 0), max(height - view, 0))
+    box = (left, top, min(left + view, width), min(top + view, height))
+    (level_image, level_scale) = cache.get_level(path, display_scale)
+    crop = level_image.crop(tuple(int(round(coordinate * level_scale)) for coordinate in box))
+    return crop.resize((max(1, int(round((box[2] - box[0]) * display_scale))),
+                        max(1, int(round((box[3] - box[1]) * display_scale)))), Image.BILINEAR)
+
+
+def bench_preview(work_dir, zooms, repeats, canvas_size=1024):
+    """Milliseconds to show a page fitted to the preview, the first time and again, and at each zoom."""
+    from hocrimagecache import ImageCache
+    path = page_image(work_dir)
+    (width, height) = Image.open(path).size
+    fit_scale = canvas_size / max(width, height)
+    center = (width / 2, height / 2)
+    results = {'fit_first_ms': median_ms(lambda: redraw(ImageCache(), path, fit_scale, center, canvas_size), repeats)}
+    cache = ImageCache()
+    redraw(cache, path, fit_scale, center, canvas_size)
+    results['fit_ms'] = median_ms(lambda: redraw(cache, path, fit_scale, center, canvas_size), repeats)
+    for zoom in zooms:
+        results['zoom_{}_ms'.format(zoom)] = median_ms(
+            lambda: redraw(cache, path, fit_scale * zoom, center, canvas_size), repeats)
+    return results
+
+
+def bench_startup(work_dir, repeats):
+    """Milliseconds to start an interpreter and import each module, and to find the OCR tool."""
+    from hocrtools import find_tool
+    repo_dir = os.path.dirname(benchmarks_dir)
+    results = {}
+    for (name, code) in (('python', 'pass'), ('import_hocr', 'import hocr'), ('import_hocreditor', 'import hocreditor')):
+        results[name + '_ms'] = median_ms(lambda: subprocess.run([sys.executable, '-c', code], cwd=repo_dir,
+                                                                 check=True), repeats)
+    cache_file = os.path.join(work_dir, 'tools.json')
+    if find_tool(refresh=True, path=cache_file) is None:
+        results['find_tool'] = {'skipped': 'no OCR tool installed'}
+        return results
+    results['find_tool'] = {
+        'discover_ms': median_ms(lambda: find_tool(refresh=True, path=cache_file), repeats),
+        'cached_ms': median_ms(lambda: find_tool(path=cache_file), repeats),
+    }
+    return results
+
+
+def describe_environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=benchmarks_dir, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = 'unknown'
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def flatten(results, prefix=''):
+    """Every number in the results by its dotted path."""
+    found = {}
+    for (key, value) in results.items():
+        if isinstance(value, dict):
+            found.update(flatten(value, '{}{}.'.format(prefix, key)))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            found[prefix + key] = value
+    return found
+
+
+def compare(old, new):
+    """Print the numbers of two result files side by side."""
+    old_values = flatten({section: old.get(section, {}) for section in sections})
+    new_values = flatten({section: new.get(section, {}) for section in sections})
+    print('{:<52} {:>12} {:>12} {:>8}'.format('', old['environment']['commit'], new['environment']['commit'],
+                                              'ratio'))
+    for key in sorted(set(old_values) | set(new_values)):
+        before = old_values.get(key)
+        after = new_values.get(key)
+        ratio = after / before if before and after is not None else None
+        print('{:<52} {:>12} {:>12} {:>8}'.format(
+            key, '-' if before is None else '{:.3f}'.format(before), '-' if after is None else '{:.3f}'.format(after),
+            '-' if ratio is None else '{:.2f}'.format(ratio)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the benchmarks and save the results')
+    parser.add_argument('--only', action='append', choices=sections, help='Run only this section, can be repeated')
+    parser.add_argument('--quick', action='store_true', help='Smaller runs, for checking the benchmarks work')
+    parser.add_argument('--pages', type=int, default=None, help='Pages in the run benchmark PDF')
+    parser.add_argument('--workers', type=int, action='append', default=None,
+                        help='Worker count for the run benchmark, can be repeated (default: 1 and the CPU count)')
+    parser.add_argument('--work-dir', default=os.path.join(tempfile.gettempdir(), 'hocr-bench'),
+                        help='Where to keep generated PDFs, images and directories')
+    parser.add_argument('--output', default=None, help='Results file (default: benchmarks/results/<time>-<commit>.json)')
+    parser.add_argument('--compare', default=None, help='Earlier results file to compare this run with')
+    args = parser.parse_args()
+
+    repeats = 3 if args.quick else 7
+    pages = args.pages or (4 if args.quick else 40)
+    workers = args.workers or sorted({1, os.cpu_count() or 1})
+    benchmarks = {
+        'run': lambda: bench_run(args.work_dir, pages, workers),
+        'convert': lambda: bench_convert(args.work_dir, (75, 150, 300) if args.quick else (75, 150, 300, 600), repeats),
+        'storage': lambda: bench_storage(args.work_dir, repeats),
+        'displayer': lambda: bench_displayer(args.work_dir, (10, 1000) if args.quick else (10, 1000, 10000), repeats),
+        'preview': lambda: bench_preview(args.work_dir, (1, 4, 16), repeats),
+        'startup': lambda: bench_startup(args.work_dir, repeats),
+    }
+
+    results = {'environment': describe_environment()}
+    for section in sections:
+        if args.only is not None and section not in args.only:
+            continue
+        print('{}...'.format(section), file=sys.stderr)
+        try:
+            results[section] = benchmarks[section]()
+        except Exception as e:
+            if not is_missing_tool(e):
+                raise
+            results[section] = {'skipped': '{}: {}'.format(type(e).__name__, e)}
+        for (key, value) in sorted(flatten(results[section]).items()):
+            print('  {:<50} {:>12.3f}'.format(key, value))
+        if 'skipped' in results[section]:
+            print('  skipped, {}'.format(results[section]['skipped']))
+
+    output = args.output
+    if output is None:
+        output = os.path.join(benchmarks_dir, 'results', '{}-{}.json'.format(
+            time.strftime('%Y%m%d-%H%M%S'), results['environment']['commit']))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as fp:
+        json.dump(results, fp, indent=2, sort_keys=True)
+    print('Saved {}'.format(output), file=sys.stderr)
+
+    if args.compare is not None:
+        with open(args.compare, 'r', encoding='utf-8') as fp:
+            compare(json.load(fp), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""A stand in for the pyocr tool Hocr would pick, for benchmarks.
+
+It has the parts of the pyocr tool interface Hocr uses and returns the same made up lines of words for a
+page of a given size every time, so runs need no Tesseract and give the same output on every machine. It
+reads every pixel of the page once, so the cost still grows with the page size and DPI.
+
+Hand the module to Hocr as its tool: Hocr(tool=stubocr). Pool workers import it again by name, so the
+benchmarks directory has to be on sys.path.
+"""
+import logging
+import pyocr.builders
+
+# The builders Hocr makes ask Tesseract for its version, and warn with a traceback when it isn't installed.
+logging.getLogger('pyocr').setLevel(logging.ERROR)
+
+words = ('lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit', 'sed', 'do',
+         'eiusmod', 'tempor', 'incididunt', 'ut', 'labore', 'et', 'dolore', 'magna', 'aliqua')
+lines_per_page = 40
+words_per_line = 10
+
+
+def get_name():
+    return 'Stub OCR'
+
+
+def get_version():
+    return (1, 0, 0)
+
+
+def get_available_languages():
+    return ['eng']
+
+
+def is_available():
+    return True
+
+
+def image_to_string(image, lang=None, builder=None):
+    """Made up line and word boxes spread over the page, as LineBoxBuilder would give."""
+    # Touch every pixel, a page twice the size costs about twice as much.
+    image.histogram()
+    (width, height) = image.size
+    line_height = max(2, height // (lines_per_page + 2))
+    word_width = max(2, width // (words_per_line + 2))
+    lines = []
+    for line in range(lines_per_page):
+        top = (line + 1) * line_height
+        boxes = []
+        for word in range(words_per_line):
+            left = (word + 1) * word_width
+            text = words[(line * words_per_line + word) % len(words)]
+            boxes.append(pyocr.builders.Box(text, ((left, top), (left + word_width - 1, top + line_height - 1)),
+                                            confidence=90 - (line + word) % 20))
+        lines.append(pyocr.builders.LineBox(boxes, ((word_width, top), (words_per_line * word_width + word_width - 1,
+                                                                        top + line_height - 1))))
+    return lines
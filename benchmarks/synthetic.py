@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Generate synthetic PDFs for the benchmarks without any external tools."""
+import os
+import random
+import zlib
+
+
+def write_pdf(path, objects):
+    """Write objects (a list of bytes, object n being objects[n - 1]) as a PDF with object 1 as catalog."""
+    offsets = []
+    with open(path, 'wb') as fp:
+        fp.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        for number, body in enumerate(objects, start=1):
+            offsets.append(fp.tell())
+            fp.write('{} 0 obj\n'.format(number).encode('ascii'))
+            fp.write(body)
+            fp.write(b'\nendobj\n')
+        xref = fp.tell()
+        fp.write('xref\n0 {}\n0000000000 65535 f \n'.format(len(objects) + 1).encode('ascii'))
+        for offset in offsets:
+            fp.write('{:010d} 00000 n \n'.format(offset).encode('ascii'))
+        fp.write('trailer\n<< /Size {} /Root 1 0 R >>\nstartxref\n{}\n%%EOF\n'.format(
+            len(objects) + 1, xref).encode('ascii'))
+
+
+def stream(dictionary, data):
+    return '<< {} /Length {} >>\nstream\n'.format(dictionary, len(data)).encode('ascii') + data + b'\nendstream'
+
+
+def write_text_pdf(path, pages, lines=40, seed=0, shared_image=0, page_size=(612, 792)):
+    """Write a PDF of pages pages of text, every page also drawing the same shared_image x shared_image
+    pixel noise image (incompressible, so it dominates the file size) when shared_image is not 0."""
+    rng = random.Random(seed)
+    words = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit', 'sed', 'do',
+             'eiusmod', 'tempor', 'incididunt', 'ut', 'labore', 'et', 'dolore', 'magna', 'aliqua']
+    (width, height) = page_size
+    # 1 catalog, 2 page tree, 3 font, 4 shared image, then a page and its content per page.
+    first_page = 5
+    kids = ' '.join('{} 0 R'.format(first_page + 2 * n) for n in range(pages))
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        '<< /Type /Pages /Kids [{}] /Count {} >>'.format(kids, pages).encode('ascii'),
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    if shared_image > 0:
+        pixels = bytes(rng.getrandbits(8) for _ in range(shared_image * shared_image))
+        objects.append(stream('/Type /XObject /Subtype /Image /Width {0} /Height {0} /ColorSpace /DeviceGray '
+                              '/BitsPerComponent 8 /Filter /FlateDecode'.format(shared_image),
+                              zlib.compress(pixels, 1)))
+    else:
+        objects.append(b'null')
+    for n in range(pages):
+        content = []
+        if shared_image > 0:
+            content.append('q {} 0 0 {} 0 0 cm /Im0 Do Q'.format(width // 4, height // 4))
+        content.append('BT /F1 11 Tf 14 TL 72 {} Td'.format(height - 72))
+        for _ in range(lines):
+            content.append('({}) Tj T*'.format(' '.join(rng.choice(words) for _ in range(10))))
+        content.append('ET')
+        resources = '/Font << /F1 3 0 R >>'
+        if shared_image > 0:
+            resources += ' /XObject << /Im0 4 0 R >>'
+        objects.append('<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {} {}] /Resources << {} >> '
+                       '/Contents {} 0 R >>'.format(width, height, resources, first_page + 2 * n + 1).encode('ascii'))
+        objects.append(stream('', '\n'.join(content).encode('ascii')))
+    write_pdf(path, objects)
+    return path
+
+
+def ensure_pdf(directory, name, **kwargs):
+    """Generate the PDF once per set of arguments and reuse it afterwards."""
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        write_text_pdf(path, **kwargs)
+    return path
@@ -8,16 +8,26 @@ if sys.version_info[0] != 3:
 
 import argparse
 import os.path
-from PIL import Image
-import pyocr
-import pyocr.builders
-import wand.image
-import PyPDF2
-import io
 import codecs
+import glob
+import importlib
+import json
 import logging
 import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
 from multiprocessing import Event,Pipe
+from hocrevents import EventLog, EventTee, ProgressStats, page_resources, timed
+from hocrexport import Exporter, formats as export_formats
+from hocrmanifest import Manifest, describe_files
+from hocrpipeline import Pipeline
+from hocrpage import HocrPage
+from hocrdisplayer import find_page_image
+from hocrrender import PyPdfRenderer, get_renderer, image_extensions, image_formats, ink_coverage, max_pixels, modes, \
+    renderers, save_page_image
+from hocrsearch import SearchIndex
+from hocrtools import find_tool
 
 
 class Hocr:
@@ -27,9 +37,30 @@ class Hocr:
     output_dir = None
     logger = None
     running = False
+    workers = None
+    queue_depth = 2
+    renderer = PyPdfRenderer.name
+    save_images = True
+    image_format = 'png'
+    resolution = 300
+    adaptive = False
+    max_resolution = 400
+    mode = 'gray'
+    blank_threshold = None
+    index_text = True
+    executor = None
+    stats = None
+    max_worker_pages = None
+    max_worker_rss = None
+    export = ()
 
-    def __init__(self, logger=None, language=None, output_directory=None):
-        self.prereq()
+    def __init__(self, logger=None, language=None, output_directory=None, workers=None, renderer=None,
+                 save_images=True, tool=None):
+        if tool is not None:
+            # Any module with the pyocr tool functions, pool workers import it again by name.
+            self.image_tool = tool
+        else:
+            self.prereq()
         self.languages = self.image_tool.get_available_languages()
         if logger is not None:
             self.logger = logger
@@ -39,15 +70,19 @@ class Hocr:
             self.set_language(language)
         if output_directory is not None:
             self.set_output_directory(output_directory)
+        self.set_workers(workers)
+        if renderer is not None:
+            self.set_renderer(renderer)
+        self.save_images = save_images
 
-    def prereq(self):
-        """Ensure prerequisites for using this are available."""
-        tools = pyocr.get_available_tools()
-        if len(tools) == 0:
-            raise HocrException("No OCR tool found")
+    def prereq(self, refresh=False):
+        """Ensure prerequisites for using this are available.
 
-        # The tools are returned in the recommended order of usage
-        tool = tools[0]
+        The tool found is remembered on disk (see hocrtools), refresh looks for tools again regardless.
+        """
+        tool = find_tool(refresh)
+        if tool is None:
+            raise HocrException("No OCR tool found")
         self.image_tool = tool
 
     def internal_logger(self):
@@ -69,7 +104,7 @@ class Hocr:
     def set_language(self, language):
         """Set the language for HOCRing"""
         if language.lower() not in [item.lower() for item in self.languages]:
-            raise HocrException("Language {} not one of available ({})".format(language, self.languages.join(', ')))
+            raise HocrException("Language {} not one of available ({})".format(language, ', '.join(self.languages)))
         self.language = language
 
     def get_language(self):
@@ -87,88 +122,1051 @@ class Hocr:
             raise HocrException("Directory {} does not exist or is not writable.".format(output_directory))
         self.output_dir = process_dir
 
-    def run(self, the_file, pipe=None, stop=None, language=None, output_directory=None):
+    def set_workers(self, workers):
+        """Set the number of worker processes, None means one per CPU."""
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if int(workers) < 1:
+            raise HocrException("Number of workers must be at least 1, got {}.".format(workers))
+        self.workers = int(workers)
+
+    def get_workers(self):
+        """Return the number of worker processes."""
+        return self.workers
+
+    def start_workers(self):
+        """Start a pool of worker processes that is kept between runs instead of one pool per run."""
+        if self.executor is None:
+            self.executor = self.__new_executor()
+            # Make every worker start and load the OCR tool now rather than on the first page.
+            wait([self.executor.submit(_worker_ping) for _ in range(self.workers)])
+
+    def stop_workers(self):
+        """Shut down the pool started by start_workers()."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def __new_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_worker_init,
+                                   initargs=(self.image_tool.__name__, self.max_worker_rss))
+
+    def set_worker_limits(self, max_pages=None, max_rss=None):
+        """Replace the worker processes once one has done max_pages pages or has max_rss bytes resident.
+
+        ImageMagick pixel caches and the PDF objects a reader has parsed build up over a long document,
+        new processes start from nothing. With either limit set pages are always done in worker
+        processes, even with one worker.
+        """
+        if max_pages is not None and int(max_pages) < 1:
+            raise HocrException("Pages per worker must be at least 1, got {}.".format(max_pages))
+        if max_rss is not None and int(max_rss) < 1:
+            raise HocrException("Worker memory limit must be positive, got {}.".format(max_rss))
+        self.max_worker_pages = int(max_pages) if max_pages is not None else None
+        self.max_worker_rss = int(max_rss) if max_rss is not None else None
+
+    def is_memory_bounded(self):
+        """Are worker processes replaced as they grow? See set_worker_limits()."""
+        return self.max_worker_pages is not None or self.max_worker_rss is not None
+
+    def __recycle_executor(self, executor):
+        """Shut down the workers of executor and return a pool of new ones in its place."""
+        executor.shutdown(wait=True)
+        new_executor = self.__new_executor()
+        if executor is self.executor:
+            self.executor = new_executor
+        return new_executor
+
+    def set_renderer(self, renderer):
+        """Set the backend used to rasterize pages."""
+        if renderer not in renderers:
+            raise HocrException("Renderer {} not one of available ({})".format(renderer, ', '.join(renderers)))
+        self.renderer = renderer
+
+    def get_renderer(self):
+        """Return the name of the backend used to rasterize pages."""
+        return self.renderer
+
+    def set_resolution(self, resolution, adaptive=False, max_resolution=None):
+        """Rasterize at resolution DPI, or with adaptive pick a resolution per page up to max_resolution.
+
+        An adaptive resolution follows the size of the text and the resolution of scanned images on the
+        page, resolution is then only used for pages with neither.
+        """
+        self.resolution = int(resolution)
+        self.adaptive = adaptive
+        if max_resolution is not None:
+            self.max_resolution = int(max_resolution)
+
+    def set_mode(self, mode):
+        """Rasterize to 'gray' or 'bilevel' (black and white) images."""
+        if mode not in modes:
+            raise HocrException("Mode {} not one of available ({})".format(mode, ', '.join(modes)))
+        self.mode = mode
+
+    def set_image_format(self, image_format):
+        """Keep page images as 'png', 'png-fast', 'tiff-g4', 'webp' or 'none' (see hocrrender.save_page_image).
+
+        Pages kept without images are rasterized again from the source PDF when they are reviewed.
+        """
+        if image_format not in image_formats:
+            raise HocrException("Image format {} not one of available ({})".format(
+                image_format, ', '.join(image_formats)))
+        self.image_format = image_format
+
+    def stored_image_format(self):
+        """The format page images are kept in, None if they are not kept."""
+        if not self.save_images or self.image_format == 'none':
+            return None
+        return self.image_format
+
+    def set_blank_threshold(self, blank_threshold):
+        """Skip OCR of pages with less than this fraction of ink (see ink_coverage), None to OCR every page."""
+        self.blank_threshold = blank_threshold
+
+    def set_export(self, formats):
+        """Also write each document as one hOCR file and/or a searchable PDF, formats being 'hocr' and 'pdf'.
+
+        The files are written as pages are done, see hocrexport.Exporter.
+        """
+        for name in formats:
+            if name not in export_formats:
+                raise HocrException("Export format {} not one of available ({})".format(
+                    name, ', '.join(export_formats)))
+        self.export = tuple(formats)
+
+    def render_options(self):
+        """The options for get_renderer() besides the resolution."""
+        return {'mode': self.mode, 'adaptive': self.adaptive, 'max_resolution': self.max_resolution}
+
+    def page_settings(self):
+        """The settings that affect the output of a page, a page made with other settings is out of date."""
+        settings = {
+            'resolution': 'adaptive {}-{}'.format(self.resolution, self.max_resolution) if self.adaptive
+            else self.resolution,
+            'language': self.language,
+            'tool': '{} {}'.format(self.image_tool.get_name(),
+                                   '.'.join(str(part) for part in self.image_tool.get_version())),
+        }
+        # Only when not the defaults, so pages made before these existed are still current.
+        if self.mode != 'gray':
+            settings['mode'] = self.mode
+        if self.blank_threshold is not None:
+            settings['blank_threshold'] = self.blank_threshold
+        return settings
+
+    def page_outputs(self, page_number):
+        """Names of the files a page should have in its output directory."""
+        outputs = ['Page{}.hocr'.format(page_number)]
+        if self.stored_image_format() is not None:
+            outputs.append('Page{}{}'.format(page_number, image_formats[self.stored_image_format()]))
+        return outputs
+
+    def configure(self, language=None, output_directory=None, workers=None, queue_depth=None, renderer=None,
+                  save_images=None):
+        """Apply the options given to run() or run_batch(), None leaves an option as it is."""
         if language is not None:
             self.set_language(language)
         if output_directory is not None:
             self.set_output_directory(output_directory)
+        if workers is not None and self.executor is None:
+            self.set_workers(workers)
+        if queue_depth is not None:
+            self.queue_depth = max(1, int(queue_depth))
+        if renderer is not None:
+            self.set_renderer(renderer)
+        if save_images is not None:
+            self.save_images = save_images
         if self.language is None or self.output_dir is None:
             raise HocrException("You must choose a language and output directory before processing HOCR.")
 
+    def run(self, the_file, pipe=None, stop=None, language=None, output_directory=None, workers=None,
+            queue_depth=None, renderer=None, save_images=None):
+        self.configure(language, output_directory, workers, queue_depth, renderer, save_images)
         self.running = True
+        try:
+            documents = self.__process([the_file], pipe, stop)
+        finally:
+            if pipe is not None:
+                pipe.close()
+            self.running = False
+        # No document if stopped before it was opened.
+        for document in documents:
+            if document.exception is not None:
+                raise document.exception
+        return True
+
+    def run_batch(self, files, pipe=None, stop=None, language=None, output_directory=None, workers=None,
+                  queue_depth=None, renderer=None, save_images=None):
+        """Process many files, scheduling the pages of all of them on one pool of workers.
 
+        Unlike run() a failing document does not stop the others, returns a Document for each file.
+        """
+        self.configure(language, output_directory, workers, queue_depth, renderer, save_images)
+        self.running = True
+        try:
+            return self.__process(files, pipe, stop)
+        finally:
+            self.running = False
+
+    def output_directory_for(self, the_file, taken=None):
+        """The directory the pages of the_file go in, made unique among the directories in taken."""
         sanitized_filename = "".join(c for c in os.path.basename(the_file) if c.isalnum()).rstrip()
         output_dir = os.path.join(self.output_dir, sanitized_filename)
+        if taken is not None:
+            suffix = 1
+            while output_dir in taken:
+                suffix += 1
+                output_dir = os.path.join(self.output_dir, '{}{}'.format(sanitized_filename, suffix))
+            taken.add(output_dir)
+        return output_dir
 
-        if not os.path.exists(output_dir):
-            os.mkdir(output_dir, 0o775)
+    def prepare_document(self, document):
+        """Create the output directory and work out which pages of a document still need processing."""
+        if not os.path.exists(document.output_dir):
+            os.mkdir(document.output_dir, 0o775)
 
-        pdf_file = PyPDF2.PdfFileReader(the_file)
+        import PyPDF2
+        document.pdf_file = PyPDF2.PdfFileReader(document.the_file)
+        document.total_pages = document.pdf_file.getNumPages()
 
-        page_counter = 0
-        total_pages = len(pdf_file.pages)
-        for page in pdf_file.pages:
-            if stop is not None and stop.is_set():
-                break
-            page_counter += 1
-            if pipe is not None:
-                pipe.send([page_counter, total_pages])
-            page_number = pdf_file.getPageNumber(page)
-            png = self.convert_page2png(pdf_file, page_number)
-            temp_image = os.path.join(output_dir, 'Page{}.png'.format(page_number))
-            png.save(filename=temp_image)
-            with open(temp_image, 'rb') as fp:
-                line_and_word_boxes = self.image_tool.image_to_string(
-                    Image.open(fp), lang=language,
-                    builder=pyocr.builders.LineBoxBuilder()
-                )
-
-            temp_hocr = os.path.join(output_dir, 'Page{}.hocr'.format(page_number))
-            with codecs.open(temp_hocr, 'w', encoding='utf-8') as file_descriptor:
-                pyocr.builders.LineBoxBuilder().write_file(file_descriptor, line_and_word_boxes)
-
-        if pipe is not None:
-            pipe.close()
-        self.running = False
-        return True
+        document.manifest = Manifest(document.output_dir)
+        document.manifest.set_source(document.the_file)
+        settings = self.page_settings()
+        document.pages = [page_number for page_number in range(document.total_pages)
+                          if not document.manifest.is_current(page_number, settings, self.page_outputs(page_number))]
+        document.skipped = document.total_pages - len(document.pages)
+        if self.index_text:
+            document.search_index = SearchIndex(document.output_dir)
+            # Pages processed before there was a search index, or with the index turned off.
+            to_do = set(document.pages)
+            for page_number in range(document.total_pages):
+                if page_number not in to_do and not document.search_index.has_page(page_number):
+                    document.index_page(page_number)
+        if len(self.export) > 0:
+            document.exporter = Exporter(
+                document.output_dir, range(document.total_pages),
+                os.path.join(document.output_dir, Exporter.hocr_filename) if 'hocr' in self.export else None,
+                os.path.join(document.output_dir, Exporter.pdf_filename) if 'pdf' in self.export else None,
+                document.manifest, self.resolution)
+            to_do = set(document.pages)
+            for page_number in range(document.total_pages):
+                if page_number not in to_do:
+                    document.exporter.ready(page_number)
+        if document.skipped > 0:
+            self.logger.info("Skipping {} of {} pages of {} already processed".format(
+                document.skipped, document.total_pages, document.the_file))
+
+    def __process(self, files, pipe=None, stop=None):
+        """Process files one after the other, or their pages all together on a pool of workers."""
+        documents = []
+        taken = set()
+
+        def prepared():
+            for the_file in files:
+                if stop is not None and stop.is_set():
+                    return
+                document = Document(the_file, self.output_directory_for(the_file, taken), pipe)
+                documents.append(document)
+                try:
+                    self.prepare_document(document)
+                except Exception as e:
+                    self.logger.exception("Could not open {}".format(the_file))
+                    document.fail(e)
+                    document.finish()
+                    continue
+                document.send_progress('document', output_directory=document.output_dir, skipped=document.skipped)
+                if len(document.pages) == 0:
+                    document.finish()
+                    continue
+                yield document
+
+        if self.workers > 1 or self.executor is not None or self.is_memory_bounded():
+            self.__run_pool(prepared(), stop)
+        else:
+            for document in prepared():
+                try:
+                    self.__run_pipeline(document, stop)
+                except Exception as e:
+                    self.logger.exception("Failed processing {}".format(document.the_file))
+                    document.fail(e)
+                finally:
+                    # Only counts as stopped if pages are left, stopped or interrupted they are left for next time.
+                    document.finish(stopped=True)
+        return documents
+
+    def __run_pipeline(self, document, stop=None):
+        """Overlap rasterizing, OCR and writing of consecutive pages in one process."""
+        settings = self.page_settings()
+        output_dir = document.output_dir
+        image_format = self.stored_image_format()
+        renderer = get_renderer(self.renderer, document.the_file, self.resolution, document.pdf_file,
+                                **self.render_options())
+        renderer.set_pages(document.pages)
+
+        # A page that fails is passed on with its error rather than stopping the pipeline, the write stage
+        # records it as failed and the other pages carry on.
+        def render(page_number):
+            timings = {}
+            try:
+                page_info = {'resolution': renderer.resolution_for(page_number)}
+                png = timed(timings, 'render', renderer.render, page_number, page_info['resolution'])
+            except Exception as e:
+                return page_number, None, timings, None, e
+            return page_number, png, timings, page_info, None
+
+        def ocr(item):
+            (page_number, png, timings, page_info, error) = item
+            line_and_word_boxes = None
+            if error is None:
+                try:
+                    # Handing the pixels over is part of rasterizing.
+                    with timed(timings, 'render', wand_to_pil, png) as image:
+                        line_and_word_boxes = timed(timings, 'ocr', ocr_page_unless_blank, self.image_tool, image,
+                                                    self.language, self.blank_threshold, page_info)
+                except Exception as e:
+                    png.close()
+                    (png, error) = (None, e)
+            return page_number, png, timings, page_info, line_and_word_boxes, error
+
+        def write(item):
+            (page_number, png, timings, page_info, line_and_word_boxes, error) = item
+            if error is None:
+                try:
+                    written = []
+                    with png:
+                        if image_format is not None:
+                            written.append(timed(timings, 'save_image', save_image, png, output_dir, page_number,
+                                                 image_format))
+                    written.append(timed(timings, 'write_hocr', write_hocr, output_dir, page_number,
+                                         line_and_word_boxes))
+                    outputs = describe_files(written)
+                except Exception as e:
+                    error = e
+            if error is not None:
+                self.logger.error("Failed page {} of {}: {}".format(page_number, document.the_file, error))
+                document.page_failed(page_number, error)
+                return
+            self.__page_done(document, page_number, settings, outputs,
+                             dict(timings=timings, page_info=page_info, **page_resources(outputs)))
+
+        def drop(item):
+            # Rendered pages left in the queues when stopping.
+            png = item[1]
+            if png is not None:
+                png.close()
+
+        pipeline = Pipeline(self.logger)
+        pipeline.add_stage('render', render, self.queue_depth)
+        pipeline.add_stage('ocr', ocr, self.queue_depth, drop)
+        pipeline.add_stage('write', write, self.queue_depth, drop)
+        try:
+            pipeline.run(document.pages, stop)
+        finally:
+            renderer.close()
+            self.stats = pipeline.get_stats()
+
+    def __run_pool(self, documents, stop=None):
+        """Fan the pages of the documents out across one pool of worker processes.
+
+        Pages are queued in document order, so as soon as the last pages of one document are handed out
+        the first pages of the next one are, and no worker waits for a document to finish. The pool from
+        start_workers() is used if there is one, otherwise a pool is started for this call.
+
+        With set_worker_limits() a pool is handed max_pages pages per worker, or fewer if a worker reports
+        more than max_rss resident, then no more pages are handed out until those being done are in and
+        the pool is replaced. Pages are recorded as they come in, so nothing done is lost. A worker dying
+        (the OOM killer, say) breaks the pool, which is replaced whatever the limits. There is no telling
+        which of the pages that were on it killed the worker, so they are tried again one at a time on the
+        new pool, and only a page that kills its worker when it is alone is recorded as failed.
+        """
+        settings = self.page_settings()
+        self.logger.info("Processing with {} workers".format(self.workers))
+        # Only keep a couple of pages per worker queued so a stop request does not wait on the whole document.
+        max_pending = self.workers * 2
+        jobs = ((document, page_number) for document in documents for page_number in document.pages)
+        pending = {}
+        started = []
+        # Pages put back without having been tried, pages that were on a pool that broke and the one of
+        # those on the pool by itself.
+        requeued = []
+        suspects = []
+        alone = None
+        # Pages handed to the current pool, and whether it is to be replaced once they are in.
+        pool_pages = 0
+        recycle = False
+        executor = self.executor if self.executor is not None else self.__new_executor()
+        try:
+            while True:
+                if recycle and len(pending) == 0 and not (stop is not None and stop.is_set()):
+                    self.logger.info("Replacing workers after {} pages".format(pool_pages))
+                    executor = self.__recycle_executor(executor)
+                    pool_pages = 0
+                    recycle = False
+                while len(pending) < max_pending and alone is None and not recycle \
+                        and not (stop is not None and stop.is_set()):
+                    if len(suspects) > 0:
+                        if len(pending) > 0:
+                            break
+                        (document, page_number) = alone = suspects.pop(0)
+                    else:
+                        if self.max_worker_pages is not None and pool_pages >= self.workers * self.max_worker_pages:
+                            recycle = True
+                            break
+                        (document, page_number) = requeued.pop(0) if len(requeued) > 0 else next(jobs, (None, None))
+                        if document is None:
+                            break
+                    pool_pages += 1
+                    if len(started) == 0 or started[-1] is not document:
+                        started.append(document)
+                    try:
+                        future = executor.submit(_worker_process_page, document.the_file, page_number,
+                                                 document.output_dir, self.language, self.stored_image_format(),
+                                                 self.renderer,
+                                                 self.resolution, self.render_options(), self.blank_threshold)
+                    except BrokenProcessPool:
+                        # A worker died since the pool was last looked at, this page had nothing to do with it.
+                        if alone is not None:
+                            suspects.insert(0, alone)
+                            alone = None
+                        else:
+                            requeued.insert(0, (document, page_number))
+                        recycle = True
+                        break
+                    pending[future] = (document, page_number)
+                if len(pending) == 0:
+                    break
+                (finished, _) = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    (document, page_number) = pending.pop(future)
+                    was_alone = (document, page_number) == alone
+                    if was_alone:
+                        alone = None
+                    if future.cancelled():
+                        continue
+                    try:
+                        (page_number, outputs, details) = future.result()
+                    except BrokenProcessPool as e:
+                        # The pool is no use once a worker has died, it is replaced when its pages are in.
+                        recycle = True
+                        if was_alone:
+                            self.logger.error("Failed page {} of {}: {}".format(page_number, document.the_file, e))
+                            document.page_failed(page_number, e)
+                        else:
+                            self.logger.warning("Worker died with page {} of {} on the pool, trying it again on "
+                                                "its own".format(page_number, document.the_file))
+                            suspects.append((document, page_number))
+                    except Exception as e:
+                        self.logger.error("Failed page {} of {}: {}".format(page_number, document.the_file, e))
+                        document.page_failed(page_number, e)
+                    else:
+                        self.__page_done(document, page_number, settings, outputs, details)
+                        if self.max_worker_rss is not None and (details.get('rss') or 0) >= self.max_worker_rss:
+                            recycle = True
+                    if document.is_complete():
+                        document.finish()
+                if stop is not None and stop.is_set():
+                    for future in pending:
+                        future.cancel()
+        finally:
+            if executor is not self.executor:
+                executor.shutdown(wait=True)
+            elif recycle:
+                # Don't leave a broken pool behind for the next run.
+                self.__recycle_executor(executor)
+            for document in started:
+                if document.finished is None:
+                    document.finish(stopped=True)
+
+    def __page_done(self, document, page_number, settings, outputs, details):
+        """Record a page as done, or as failed if recording it does not work out."""
+        try:
+            document.page_done(page_number, settings, outputs, **details)
+        except Exception as e:
+            self.logger.exception("Failed recording page {} of {}".format(page_number, document.the_file))
+            document.page_failed(page_number, e)
 
     def convert_page2png(self, pdffile, pagenum, resolution=300):
-        dst_pdf = PyPDF2.PdfFileWriter()
-        dst_pdf.addPage(pdffile.getPage(pagenum))
+        return PyPdfRenderer(None, resolution, pdffile).render(pagenum)
+
+    def reocr_regions(self, output_dir, regions, resolution=None, language=None):
+        """OCR regions of pages of an output directory again and splice the words found into their HOCR.
+
+        regions maps page numbers to a box (x0, y0, x1, y1) in the coordinates of the page's HOCR, or a
+        list of them. The regions are cut from PageN.png, or with resolution (or no page image) from the
+        page rasterized again from the source PDF at that resolution, and the crops go to the OCR tool
+        stitched into as few images as max_pixels allows. The words in each region are replaced by those
+        found there, see HocrPage.replace_words(). The manifest is brought up to date and the pages are
+        added to the search log, which is left for the next run or hocrsearch.py to compact.
+
+        Each page is read in the language and rasterized in the mode the manifest says it was made with,
+        language overrides the language.
+
+        Returns the number of words found on each page.
+        """
+        manifest = Manifest(output_dir)
+        # A renderer for each mode, and the crops to OCR in each language.
+        renderers = {}
+        crops = {}
+        try:
+            for (page_number, boxes) in sorted(regions.items()):
+                settings = manifest.get_settings(page_number)
+                page_language = language or (settings or {}).get('language') or self.language
+                if page_language is None:
+                    raise HocrException("You must choose a language before processing HOCR.")
+                # Pages are only recorded with a mode when it is not gray.
+                mode = settings.get('mode', 'gray') if settings is not None else self.mode
+                page_resolution = manifest.get_resolution(page_number, self.resolution)
+                image_file = find_page_image(output_dir, page_number)
+                if resolution is None and image_file is not None:
+                    from PIL import Image
+                    scale = 1.0
+                    page_image = Image.open(image_file).convert('L')
+                else:
+                    if mode not in renderers:
+                        source = manifest.get_source()
+                        if source is None or not os.path.exists(source):
+                            raise HocrException("The source PDF of {} is not known or is gone.".format(output_dir))
+                        renderers[mode] = get_renderer(self.renderer, source, page_resolution, mode=mode)
+                    scale = (resolution or page_resolution) / page_resolution
+                    with renderers[mode].render(page_number, resolution or page_resolution) as png:
+                        page_image = wand_to_pil(png)
+                with page_image:
+                    for box in region_boxes(boxes):
+                        # Kept inside the page, PIL fills what is outside with black.
+                        box = (max(0, int(box[0])), max(0, int(box[1])),
+                               min(int(page_image.width / scale), int(box[2])),
+                               min(int(page_image.height / scale), int(box[3])))
+                        if box[2] <= box[0] or box[3] <= box[1]:
+                            continue
+                        crop = page_image.crop(tuple(int(round(coordinate * scale)) for coordinate in box))
+                        crops.setdefault(page_language, []).append((page_number, box, scale, crop))
+        finally:
+            for renderer in renderers.values():
+                renderer.close()
+
+        found = {page_number: [] for page_number in regions}
+        for (page_language, language_crops) in sorted(crops.items()):
+            for batch in batch_crops(language_crops):
+                (montage, tops) = stitch_crops([crop for (page_number, box, scale, crop) in batch])
+                with montage:
+                    lines = ocr_page(self.image_tool, montage, page_language)
+                for (number, lines_found) in enumerate(split_lines(lines, tops,
+                                                                   [crop.size for (_, _, _, crop) in batch])):
+                    (page_number, box, scale, crop) = batch[number]
+                    found[page_number].append((box, [place_line(line, box, scale) for line in lines_found]))
+                    crop.close()
+
+        search_index = SearchIndex(output_dir) if self.index_text else None
+        counts = {}
+        try:
+            for (page_number, replacements) in sorted(found.items()):
+                hocr_file = os.path.join(output_dir, 'Page{}.hocr'.format(page_number))
+                page = HocrPage.load(hocr_file) if os.path.exists(hocr_file) else HocrPage()
+                write_hocr(output_dir, page_number, page_boxes(page.replace_words(replacements)))
+                manifest.update_outputs(page_number, describe_files([hocr_file]))
+                if search_index is not None:
+                    search_index.add_file(page_number, hocr_file)
+                counts[page_number] = sum(len(words) for (region, lines) in replacements for (bbox, words) in lines)
+        finally:
+            manifest.save()
+            if search_index is not None:
+                search_index.close()
+        return counts
+
+
+
+class Document:
+    """A file given to Hocr.run() or Hocr.run_batch() and what became of it."""
+
+    def __init__(self, the_file, output_dir, pipe=None):
+        self.the_file = the_file
+        self.output_dir = output_dir
+        self.pipe = pipe
+        self.pdf_file = None
+        self.manifest = None
+        self.search_index = None
+        self.exporter = None
+        self.total_pages = 0
+        self.pages = []
+        self.skipped = 0
+        self.processed = 0
+        self.failed = {}
+        self.exception = None
+        self.stopped = False
+        self.started = time.time()
+        self.finished = None
+
+    def page_done(self, page_number, settings, outputs, **details):
+        """Record a page as processed, details (timings and such) go in its progress event.
+
+        The page_info detail (the resolution used and whether the page was blank) is kept in the manifest.
+        """
+        self.manifest.record_page(page_number, settings, outputs, **details.get('page_info', {}))
+        self.index_page(page_number)
+        if self.exporter is not None:
+            self.exporter.ready(page_number)
+        self.processed += 1
+        self.send_progress('page', page=page_number, status='done', **details)
 
-        pdf_bytes = io.BytesIO()
-        dst_pdf.write(pdf_bytes)
-        pdf_bytes.seek(0)
+    def index_page(self, page_number):
+        """Add the words of a page's HOCR file to the search index, if we are keeping one."""
+        if self.search_index is not None:
+            self.search_index.add_file(page_number, os.path.join(self.output_dir, 'Page{}.hocr'.format(page_number)))
 
-        img = wand.image.Image(file=pdf_bytes, resolution=resolution)
-        img.convert("png")
-        img.type = 'grayscale'
+    def page_failed(self, page_number, exception):
+        """Record a page as failed, the document carries on with its other pages."""
+        self.failed[page_number] = str(exception)
+        if self.exporter is not None:
+            self.exporter.ready(page_number, failed=True)
+        if self.exception is None:
+            self.exception = exception
+        self.send_progress('page', page=page_number, status='failed', error=str(exception))
+
+    def fail(self, exception):
+        """Record the document as failed as a whole."""
+        if self.exception is None:
+            self.exception = exception
+
+    def is_complete(self):
+        """Has every page that needed processing been processed or failed?"""
+        return self.processed + len(self.failed) >= len(self.pages)
+
+    def send_progress(self, event, **fields):
+        """Send an event (see hocrevents) through the pipe, with how far along the document is."""
+        if self.pipe is not None:
+            message = {
+                'event': event,
+                'file': self.the_file,
+                'done': self.skipped + self.processed + len(self.failed),
+                'total': self.total_pages,
+                'time': time.time(),
+            }
+            message.update(fields)
+            self.pipe.send(message)
+
+    def finish(self, stopped=False):
+        """Save the manifest, search index and exports and let go of what was kept open for processing.
+
+        The exports of a stopped document are thrown away rather than replace earlier, complete ones.
+        """
+        self.stopped = stopped and not self.is_complete()
+        if self.exporter is not None and self.stopped:
+            self.exporter.discard()
+        elif self.exporter is not None:
+            try:
+                self.exporter.close()
+                if len(self.exporter.errors) > 0:
+                    raise HocrException("Pages {} could not be exported: {}".format(
+                        ', '.join(str(page_number) for page_number in sorted(self.exporter.errors)),
+                        next(iter(self.exporter.errors.values()))))
+            except Exception as e:
+                # The pages themselves are done, only the export is wanting.
+                self.fail(e)
+        self.exporter = None
+        if self.manifest is not None:
+            self.manifest.save()
+        self.manifest = None
+        if self.search_index is not None:
+            self.search_index.compact()
+            self.search_index.close()
+        self.search_index = None
+        self.pdf_file = None
+        self.finished = time.time()
+        self.send_progress('finished', result=self.get_result())
+
+    def get_status(self):
+        if self.exception is not None:
+            return 'failed'
+        if self.stopped:
+            return 'stopped'
+        return 'ok'
+
+    def get_result(self):
+        """A summary of the document that can be written out as JSON."""
+        return {
+            'file': self.the_file,
+            'output_directory': self.output_dir,
+            'status': self.get_status(),
+            'error': str(self.exception) if self.exception is not None else None,
+            'total_pages': self.total_pages,
+            'skipped_pages': self.skipped,
+            'processed_pages': self.processed,
+            'failed_pages': {str(page_number): error for (page_number, error) in sorted(self.failed.items())},
+            'seconds': (self.finished or time.time()) - self.started,
+        }
+
+
+def wand_to_pil(png):
+    """Hand the pixels of a rasterized page to PIL without encoding and decoding an image file.
+
+    The raw 8 bit gray blob is the only copy made, PIL reads the blob in place.
+    """
+    import wand.color
+    from PIL import Image
+    if png.alpha_channel:
+        png.background_color = wand.color.Color('white')
+        png.alpha_channel = 'remove'
+    png.depth = 8
+    blob = png.make_blob('gray')
+    return Image.frombuffer('L', (png.width, png.height), blob, 'raw', 'L', 0, 1)
+
+
+def save_image(png, output_dir, page_number, image_format='png'):
+    """Save a rasterized page as PageN with the extension of image_format, returns the image path.
+
+    An image of the page in another format, from a run with other settings, is removed so there is only
+    the one image of a page.
+    """
+    path_base = os.path.join(output_dir, 'Page{}'.format(page_number))
+    for extension in image_extensions:
+        if extension != image_formats[image_format] and os.path.exists(path_base + extension):
+            os.unlink(path_base + extension)
+    return save_page_image(png, path_base, image_format)
+
+
+def ocr_page(image_tool, image, language):
+    """Run the OCR tool over a page image, returns the line and word boxes."""
+    import pyocr.builders
+    return image_tool.image_to_string(
+        image, lang=language,
+        builder=pyocr.builders.LineBoxBuilder()
+    )
+
+
+def ocr_page_unless_blank(image_tool, image, language, blank_threshold=None, page_info=None):
+    """Run the OCR tool over a page image, unless less than blank_threshold of it has ink on it.
+
+    Returns the line and word boxes, none for a blank page. The ink found and whether the page was taken
+    as blank go in the page_info dict, if given.
+    """
+    if blank_threshold is not None:
+        ink = ink_coverage(image)
+        if page_info is not None:
+            page_info['ink'] = round(ink, 6)
+            page_info['blank'] = ink < blank_threshold
+        if ink < blank_threshold:
+            return []
+    return ocr_page(image_tool, image, language)
+
+
+def write_hocr(output_dir, page_number, line_and_word_boxes):
+    """Write the boxes of a page to PageN.hocr, returns the hOCR path."""
+    import pyocr.builders
+    hocr_file = os.path.join(output_dir, 'Page{}.hocr'.format(page_number))
+    with codecs.open(hocr_file, 'w', encoding='utf-8') as file_descriptor:
+        pyocr.builders.LineBoxBuilder().write_file(file_descriptor, line_and_word_boxes)
+    return hocr_file
+
+
+# White space between the crops stitched into one image, in pixels.
+region_gap = 40
+
+
+def region_boxes(boxes):
+    """A box (x0, y0, x1, y1) or list of them as a list of boxes."""
+    if len(boxes) == 4 and all(isinstance(value, (int, float)) for value in boxes):
+        return [tuple(boxes)]
+    return [tuple(box) for box in boxes]
+
+
+def batch_crops(crops, gap=region_gap):
+    """Split crops (lists ending in a PIL image) into runs whose stitched image stays under max_pixels."""
+    batch = []
+    width = height = 0
+    for crop in crops:
+        (crop_width, crop_height) = crop[-1].size
+        if len(batch) > 0 and max(width, crop_width + 2 * gap) * (height + crop_height + gap) > max_pixels:
+            yield batch
+            batch = []
+            width = height = 0
+        batch.append(crop)
+        width = max(width, crop_width + 2 * gap)
+        height = (height or gap) + crop_height + gap
+    if len(batch) > 0:
+        yield batch
+
+
+def stitch_crops(images, gap=region_gap):
+    """Stack images one above the other on white, gap pixels apart, so one OCR run reads them all.
+
+    Returns the stitched image and the top of each image in it.
+    """
+    from PIL import Image
+    width = max(image.width for image in images) + 2 * gap
+    height = sum(image.height + gap for image in images) + gap
+    montage = Image.new('L', (width, height), 255)
+    tops = []
+    top = gap
+    for image in images:
+        montage.paste(image, (gap, top))
+        tops.append(top)
+        top += image.height + gap
+    return montage, tops
+
+
+def split_lines(lines, tops, sizes, gap=region_gap):
+    """Hand the lines read from a stitched image back to the crops they are in, as lists of pyocr LineBoxes.
+
+    Word boxes are made relative to their crop. A line is split if its words are in more than one crop.
+    """
+    import pyocr.builders
+    found = [[] for _ in tops]
+    for line in lines:
+        parts = {}
+        for word in line.word_boxes:
+            ((x0, y0), (x1, y1)) = word.position
+            middle = (y0 + y1) / 2
+            number = max(0, min(len(tops) - 1, sum(1 for top in tops if top <= middle + gap / 2) - 1))
+            (width, height) = sizes[number]
+            position = ((min(max(x0 - gap, 0), width), min(max(y0 - tops[number], 0), height)),
+                        (min(max(x1 - gap, 0), width), min(max(y1 - tops[number], 0), height)))
+            parts.setdefault(number, []).append(pyocr.builders.Box(word.content, position, word.confidence))
+        for (number, words) in sorted(parts.items()):
+            found[number].append(pyocr.builders.LineBox(words, (
+                (min(word.position[0][0] for word in words), min(word.position[0][1] for word in words)),
+                (max(word.position[1][0] for word in words), max(word.position[1][1] for word in words)))))
+    return found
+
+
+def place_line(line, box, scale):
+    """A LineBox of a crop of region box taken at scale as the (bbox, words) of HocrPage.replace_words()."""
+    def place(position):
+        ((x0, y0), (x1, y1)) = position
+        return (box[0] + int(round(x0 / scale)), box[1] + int(round(y0 / scale)),
+                box[0] + int(round(x1 / scale)), box[1] + int(round(y1 / scale)))
+    return place(line.position), [(word.content, place(word.position), word.confidence) for word in line.word_boxes]
+
+
+def page_boxes(page):
+    """The lines of a HocrPage as pyocr LineBoxes, for write_hocr()."""
+    import pyocr.builders
+    lines = []
+    for line in range(page.line_count()):
+        (x0, y0, x1, y1) = page.get_line_bbox(line)
+        words = []
+        for word in page.get_line_words(line):
+            words.append(pyocr.builders.Box(page.word_text[word], ((page.word_x0[word], page.word_y0[word]),
+                                                                   (page.word_x1[word], page.word_y1[word])),
+                                            page.word_confidence[word]))
+        lines.append(pyocr.builders.LineBox(words, ((x0, y0), (x1, y1))))
+    return lines
+
+
+def process_page(image_tool, renderer, page_number, output_dir, language, image_format='png', timings=None,
+                 blank_threshold=None, page_info=None):
+    """Rasterize, OCR and write the page image and PageN.hocr for one page, returns the paths written.
+
+    The image (none if image_format is None) is encoded and written in a background thread while the OCR
+    tool works on the in memory image. The seconds spent on each stage are added to the timings dict and
+    the resolution used and the blank page check (see ocr_page_unless_blank) go in the page_info dict, if
+    given.
+    """
+    if timings is None:
+        timings = {}
+    if page_info is None:
+        page_info = {}
+    page_info['resolution'] = renderer.resolution_for(page_number)
+    # The page's pixels are let go of as soon as it is done, not when the next page replaces them.
+    with timed(timings, 'render', renderer.render, page_number, page_info['resolution']) as png:
+        with timed(timings, 'render', wand_to_pil, png) as image, ThreadPoolExecutor(max_workers=1) as writer:
+            saved = None
+            if image_format is not None:
+                saved = writer.submit(timed, timings, 'save_image', save_image, png, output_dir, page_number,
+                                      image_format)
+            line_and_word_boxes = timed(timings, 'ocr', ocr_page_unless_blank, image_tool, image, language,
+                                        blank_threshold, page_info)
+            written = [saved.result()] if saved is not None else []
+    written.append(timed(timings, 'write_hocr', write_hocr, output_dir, page_number, line_and_word_boxes))
+    return written
+
+
+# State of a pool worker process, set up once by _worker_init.
+_worker_tool = None
+_worker_renderer = None
+_worker_render_options = None
+
+
+def _worker_init(tool_name, max_rss=None):
+    """Load the OCR tool chosen by the parent so workers do not probe for tools again.
+
+    With max_rss ImageMagick is told to keep its pixel caches to half of it, past that it uses disk.
+    """
+    global _worker_tool
+    _worker_tool = importlib.import_module(tool_name)
+    if max_rss is not None:
+        import wand.resource
+        wand.resource.limits['memory'] = max_rss // 2
+        wand.resource.limits['map'] = max_rss // 2
+
+
+def _worker_ping():
+    """Do nothing, used to get a worker process started."""
+    return os.getpid()
+
+
+def _worker_process_page(the_file, page_number, output_dir, language, image_format='png', renderer_name='pypdf',
+                         resolution=300, render_options=None, blank_threshold=None):
+    """Process one page in a pool worker, reusing the renderer between pages of the same file.
+
+    Returns the page number, the manifest description of the files written and the details for the
+    page's progress event.
+    """
+    global _worker_renderer, _worker_render_options
+    render_options = render_options or {}
+    if _worker_renderer is None or _worker_renderer.the_file != the_file or _worker_renderer.name != renderer_name \
+            or _worker_renderer.resolution != resolution or _worker_render_options != render_options:
+        if _worker_renderer is not None:
+            _worker_renderer.close()
+        # Workers are handed scattered pages so rendering ahead would be wasted.
+        _worker_renderer = get_renderer(renderer_name, the_file, resolution, batch=1, **render_options)
+        _worker_render_options = render_options
+    timings = {}
+    page_info = {}
+    written = process_page(_worker_tool, _worker_renderer, page_number, output_dir, language, image_format, timings,
+                           blank_threshold, page_info)
+    outputs = describe_files(written)
+    details = page_resources(outputs)
+    details['timings'] = timings
+    details['page_info'] = page_info
+    return page_number, outputs, details
 
-        return img
 
 class HocrException(Exception):
 
     def __init__(self, *args, **kwargs):
-        Exception.__init__(*args, **kwargs)
+        Exception.__init__(self, *args, **kwargs)
+
+
+def find_files(inputs):
+    """Expand files, directories (searched recursively for PDFs) and glob patterns into a sorted list of files.
+
+    Returns the files and the inputs that matched nothing.
+    """
+    found = set()
+    missing = []
+    for pattern in inputs:
+        matches = glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else [pattern]
+        matched = False
+        for match in matches:
+            if os.path.isdir(match):
+                for (root, dirs, files) in os.walk(match):
+                    for name in files:
+                        if name.lower().endswith('.pdf'):
+                            found.add(os.path.realpath(os.path.join(root, name)))
+                            matched = True
+            elif os.path.isfile(match):
+                found.add(os.path.realpath(match))
+                matched = True
+        if not matched:
+            missing.append(pattern)
+    return sorted(found), missing
+
 
 if __name__ == '__main__':
 
     hocr = Hocr()
-    langs = hocr.get_langugages()
+    langs = hocr.get_languages()
 
-    parser = argparse.ArgumentParser(description='View edit HOCR from PDF/image file')
+    parser = argparse.ArgumentParser(description='HOCR PDF files into images and HOCR files')
     parser.add_argument('-l', '--lang', dest='language', default=langs[0], choices=langs, help='Language to use for HOCR')
     parser.add_argument('-o', '--output-dir', dest='output_dir', default=None, required=True, help='Directory to place image and HOCR files')
-    parser.add_argument('file', help='The PDF file to parse.')
+    parser.add_argument('-w', '--workers', dest='workers', type=int, default=None,
+                        help='Number of worker processes shared by all files (default: number of CPUs)')
+    parser.add_argument('-r', '--renderer', dest='renderer', default=None, choices=sorted(renderers),
+                        help='Backend used to rasterize pages')
+    parser.add_argument('--no-images', dest='save_images', action='store_false',
+                        help='Do not keep the page images, only the HOCR files')
+    parser.add_argument('--image-format', dest='image_format', default='png', choices=list(image_formats),
+                        help='How to keep page images: png, png-fast (quicker, larger), tiff-g4 (black and white), '
+                             'webp (lossless) or none (default: png)')
+    parser.add_argument('--resolution', dest='resolution', type=int, default=300,
+                        help='DPI to rasterize at, with --adaptive only for pages with no text or images to go by')
+    parser.add_argument('--adaptive', dest='max_resolution', type=int, nargs='?', const=400, default=None,
+                        help='Pick the DPI of each page from its text size and scanned images, up to this (default: 400)')
+    parser.add_argument('--bilevel', dest='mode', action='store_const', const='bilevel', default='gray',
+                        help='Rasterize to black and white rather than grayscale')
+    parser.add_argument('--skip-blank', dest='blank_threshold', type=float, nargs='?', const=0.001, default=None,
+                        help='Do not OCR pages with less than this fraction of ink on them (default: 0.001)')
+    parser.add_argument('--max-worker-pages', dest='max_worker_pages', type=int, default=None,
+                        help='Replace each worker process after it has done this many pages')
+    parser.add_argument('--max-worker-rss', dest='max_worker_rss', type=int, default=None,
+                        help='Replace worker processes that have more than this many MB resident')
+    parser.add_argument('--export', dest='export', action='append', default=[], choices=export_formats,
+                        help='Also write each file as one HOCR file or a searchable PDF, can be repeated')
+    parser.add_argument('--report', dest='report', default=None,
+                        help='Write a JSON report of every file to this path, - for standard output')
+    parser.add_argument('--stats', dest='stats', action='store_true',
+                        help='Print where the time went: seconds per stage, bytes written and peak memory')
+    parser.add_argument('--events', dest='events', default=None,
+                        help='Append progress events as JSON lines to this path, - for standard output')
+    parser.add_argument('files', nargs='+', help='PDF files, directories of PDF files or glob patterns to parse.')
     args = parser.parse_args()
 
     try:
         hocr.set_language(args.language)
         hocr.set_output_directory(args.output_dir)
+        hocr.set_workers(args.workers)
+        if args.renderer is not None:
+            hocr.set_renderer(args.renderer)
+        hocr.set_resolution(args.resolution, args.max_resolution is not None, args.max_resolution)
+        hocr.set_mode(args.mode)
+        hocr.set_blank_threshold(args.blank_threshold)
+        hocr.set_image_format(args.image_format)
+        hocr.set_export(args.export)
+        hocr.set_worker_limits(args.max_worker_pages,
+                               args.max_worker_rss * 1000000 if args.max_worker_rss is not None else None)
     except HocrException as e:
         parser.error(e)
+    hocr.save_images = args.save_images
 
-    if not os.path.exists(os.path.abspath(os.path.realpath(args.file))):
-        parser.error('File {} not found'.format(args.file))
+    (files, missing) = find_files(args.files)
+    for pattern in missing:
+        print('No files found for {}'.format(pattern), file=sys.stderr)
+    if len(files) == 0:
+        parser.error('No files to process')
+
+    stats = ProgressStats() if args.stats else None
+    events = EventTee(stats, EventLog(args.events) if args.events is not None else None)
+    start = time.time()
+    try:
+        documents = hocr.run_batch(files, pipe=events)
+    except KeyboardInterrupt:
+        sys.exit(130)
+    finally:
+        events.close()
+    seconds = time.time() - start
+
+    results = [document.get_result() for document in documents]
+    pages = sum(result['processed_pages'] for result in results)
+    failed = [result for result in results if result['status'] != 'ok']
+    # Standard output is kept for the JSON when the report or events go there.
+    out = sys.stderr if '-' in (args.report, args.events) else sys.stdout
+    for result in results:
+        print('{:<8} {:>6} pages {:>9.1f}s  {}'.format(result['status'], result['processed_pages'],
+                                                       result['seconds'], result['file']), file=out)
+        if result['error'] is not None:
+            print('         {}'.format(result['error']), file=out)
+    print('{} files, {} pages in {:.1f}s, {:.2f} pages/s, {} failed'.format(
+        len(results), pages, seconds, pages / seconds if seconds > 0 else 0.0, len(failed) + len(missing)), file=out)
+    if stats is not None:
+        print(stats.describe(), file=out)
+
+    if args.report is not None:
+        report = {
+            'files': results,
+            'missing': missing,
+            'pages': pages,
+            'seconds': seconds,
+            'pages_per_second': pages / seconds if seconds > 0 else 0.0,
+        }
+        if stats is not None:
+            report['stats'] = stats.get_stats()
+        if args.report == '-':
+            json.dump(report, sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.report, 'w', encoding='utf-8') as fp:
+                json.dump(report, fp, indent=2)
 
-    hocr.process_file(args.file)
+    sys.exit(1 if len(failed) > 0 or len(missing) > 0 else 0)
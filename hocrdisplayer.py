@@ -1,34 +1,172 @@
 #!/usr/bin/env python3
+import bisect
+import json
 import os
 import os.path
 import re
+from hocrrender import image_extensions
+
 
 class HocrDisplayer:
+    """Catalogue of the pages in a directory of HOCR output, in page order.
+
+    The page numbers found are cached in an index file in the directory, which is trusted for as long as
+    the directory's modification time is unchanged, so reopening a large directory does not scan it again.
+    refresh() picks up pages added since, for watching a directory that is still being written to.
+
+    Page images may be stored in any of the image_extensions or not at all. missing_image, if given, is
+    called with the page number of a page without an image for the path to show instead.
+    """
 
-    file_map = {}
+    index_filename = '.hocrindex.json'
+    index_version = 2
 
-    def __init__(self, directory):
+    def __init__(self, directory, missing_image=None):
         if not os.path.exists(directory) or not os.path.isdir(directory):
             raise HocrDisplayerException("{} does not exist or is not a directory.".format(directory))
         self.directory = directory
+        self.missing_image = missing_image
         self.file_regex = re.compile(r'^Page(\d+)\.hocr$')
+        self.image_regex = re.compile(r'^Page(\d+)({})$'.format('|'.join(re.escape(extension)
+                                                                         for extension in image_extensions)))
+        self.pages = []
+        # The image extension of each page with an image, by page number as a string as in the index.
+        self.images = {}
+        self.mtime = None
+        self.file_map = None
+        self.image_paths = None
         self.__load_directory()
 
     def __load_directory(self):
-        self.file_map.clear()
-        for file in os.listdir(self.directory):
-            if self.file_regex.match(file):
-                matches = self.file_regex.match(file)
-                page_num = int(matches[1])
-                display_pagenum = page_num + 1
-                self.file_map['Page {}'.format(str(display_pagenum))] = {
-                    'image_file': 'Page{}.png'.format(str(page_num)),
-                    'ocr_file': 'Page{}.hocr'.format(str(page_num))
-                }
+        mtime = os.stat(self.directory).st_mtime_ns
+        index = self.__read_index()
+        if index is not None and index.get('mtime') == mtime:
+            self.pages = index['pages']
+            self.images = index['images']
+            self.mtime = mtime
+        else:
+            self.__scan()
+
+    def __scan(self):
+        """List the directory, returns the pages not known before."""
+        # Take the time before listing, a page written while we list will then be found by the next refresh.
+        mtime = os.stat(self.directory).st_mtime_ns
+        pages = []
+        images = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                matches = self.file_regex.match(entry.name)
+                if matches:
+                    pages.append(int(matches[1]))
+                    continue
+                matches = self.image_regex.match(entry.name)
+                if matches:
+                    key = str(int(matches[1]))
+                    # Should there be more than one, the first of image_extensions.
+                    if key not in images or image_extensions.index(matches[2]) < image_extensions.index(images[key]):
+                        images[key] = matches[2]
+        pages.sort()
+        known = set(self.pages)
+        added = [page_num for page_num in pages if page_num not in known]
+        if pages != self.pages or images != self.images:
+            self.file_map = None
+            self.image_paths = None
+        self.pages = pages
+        self.images = images
+        self.mtime = mtime
+        self.__write_index()
+        return added
+
+    def refresh(self):
+        """Pick up pages written since the directory was last read, returns the page numbers added."""
+        if os.stat(self.directory).st_mtime_ns == self.mtime:
+            return []
+        return self.__scan()
+
+    def __read_index(self):
+        try:
+            with open(os.path.join(self.directory, self.index_filename), 'r', encoding='utf-8') as fp:
+                index = json.load(fp)
+        except (OSError, ValueError):
+            return None
+        if index.get('version') != self.index_version:
+            return None
+        return index
+
+    def __write_index(self):
+        index_path = os.path.join(self.directory, self.index_filename)
+        try:
+            # Creating the index changes the directory's modification time, so create it first, then
+            # record the time and rewrite the file in place, which leaves the directory as it is.
+            if not os.path.exists(index_path):
+                open(index_path, 'a').close()
+                self.mtime = os.stat(self.directory).st_mtime_ns
+            with open(index_path, 'r+', encoding='utf-8') as fp:
+                json.dump({'version': self.index_version, 'mtime': self.mtime, 'pages': self.pages,
+                           'images': self.images}, fp)
+                fp.truncate()
+        except OSError:
+            # A directory we can't write to is just scanned every time.
+            pass
+
+    def get_page_count(self):
+        return len(self.pages)
+
+    def get_page_number(self, index):
+        """The page number (as in PageN.hocr) of the index'th page in order."""
+        return self.pages[index]
+
+    def find_page(self, page_num):
+        """The index of page number page_num, None if there is no such page."""
+        index = bisect.bisect_left(self.pages, page_num)
+        if index < len(self.pages) and self.pages[index] == page_num:
+            return index
+        return None
+
+    def get_label(self, index):
+        """The name the index'th page is displayed as."""
+        return 'Page {}'.format(str(self.pages[index] + 1))
+
+    def get_files(self, index):
+        """The image and HOCR file names of the index'th page, the image None if it has none."""
+        page_num = self.pages[index]
+        extension = self.images.get(str(page_num))
+        return {
+            'image_file': 'Page{}{}'.format(str(page_num), extension) if extension is not None else None,
+            'ocr_file': 'Page{}.hocr'.format(str(page_num))
+        }
+
+    def get_image_path(self, index):
+        """Full path of the index'th page's image, from missing_image if it has none (None without it)."""
+        image_file = self.get_files(index)['image_file']
+        if image_file is not None:
+            return os.path.join(self.directory, image_file)
+        if self.missing_image is not None:
+            return self.missing_image(self.pages[index])
+        return None
+
+    def get_image_paths(self):
+        """Full paths of the page images in page order."""
+        if self.image_paths is None:
+            self.image_paths = [self.get_image_path(index) for index in range(len(self.pages))]
+        return self.image_paths
+
     def get_file_listing(self):
+        """Every page by display name, in page order."""
+        if self.file_map is None:
+            self.file_map = {self.get_label(index): self.get_files(index) for index in range(len(self.pages))}
         return self.file_map
 
 
+def find_page_image(directory, page_number):
+    """The path of the stored image of a page, None if it has none."""
+    for extension in image_extensions:
+        path = os.path.join(directory, 'Page{}{}'.format(page_number, extension))
+        if os.path.exists(path):
+            return path
+    return None
+
+
 class HocrDisplayerException(Exception):
     def __init__(self, *args, **kwargs):
-        Exception.__init__(*args, **kwargs)
\ No newline at end of file
+        Exception.__init__(self, *args, **kwargs)
@@ -12,10 +12,16 @@ from tkinter import messagebox
 from multiprocessing import Process, Pipe, Event
 import threading
 import os.path
-from PIL import Image, ImageTk
 sys.path.append(os.path.dirname(__file__))
-from hocr import Hocr
+from hocr import Hocr, HocrException
 from hocrdisplayer import HocrDisplayer
+from hocrimagecache import ImageCache, PagePrefetcher, PageRenderCache
+from hocroverlay import BoxOverlay
+from hocrpage import HocrPage
+from hocrsearch import SearchIndex, index_directory
+from hocrevents import ProgressStats
+from hocrserver import HocrClient, Job
+from hocrwidgets import VirtualListbox
 
 
 class HocrEditor(ttk.Frame):
@@ -23,17 +29,45 @@ class HocrEditor(ttk.Frame):
     child_pipe = None
     stop_event = None
     process = None
-    hocr_progress = 0
+    hocr_progress = None
+    hocr_rate = None
+    progress_stats = None
+    progress_window = None
+    client = None
+    job_id = None
+    server_timeout = 2
     hocr = None
     thread = None
     gui = {}
     display_hocr = None
     display_hocr_current_page = None
+    polling = False
+    refresh_interval = 2000
+    last_refresh = 0
     test_canvas = None
     scale = 1.0
+    min_scale = 0.25
+    max_scale = 16.0
     image_size = 1024
     image = None
     image_id = None
+    image_cache = None
+    prefetcher = None
+    prefetch_distance = 2
+    page_renders = None
+    image_path = None
+    fit_scale = 1.0
+    view_center = None
+    view_origin = (0, 0)
+    drag_from = None
+    region_from = None
+    region_item = None
+    overlay = None
+    hocr_page = None
+    search_index = None
+    search_hits = []
+    search_current = ()
+    pending_hit = None
 
     def __init__(self):
         master = self.master = tk.Tk()
@@ -43,7 +77,12 @@ class HocrEditor(ttk.Frame):
         master.title("HocrEditor")
         master.wm_geometry("300x300+10+10")
 
-        self.hocr = Hocr()
+        # Finding the OCR tool can take a while, so the window comes up first.
+        self.hocr = None
+        self.hocr_error = None
+        threading.Thread(target=self.__find_tool, daemon=True).start()
+        self.image_cache = ImageCache()
+        self.prefetcher = PagePrefetcher(self.image_cache, self.prefetch_distance)
 
         self.inputFile = None  # The input filename
         self.outputDir = None  # The output directory
@@ -78,6 +117,9 @@ class HocrEditor(ttk.Frame):
 
         self.run_btn = tk.Button(self.gui['hocr_frame'], text="Run Hocr", command=self.start_hocr, state=tk.DISABLED)
         self.run_btn.pack()
+        self.tool_str = tk.StringVar(value="Looking for OCR tools...")
+        tool_lbl = tk.Label(self.gui['hocr_frame'], textvariable=self.tool_str)
+        tool_lbl.pack()
         self.exit_btn = tk.Button(self.gui['hocr_frame'], text="Exit", command=self.quitter)
         self.exit_btn.pack()
         self.gui['notebook'].add(self.gui['hocr_frame'], text="Process")
@@ -90,8 +132,23 @@ class HocrEditor(ttk.Frame):
         outputDir_btn2 = ttk.Button(reviewDir_lbl, text="Choose directory", command=self.ask_correct_dir)
         outputDir_btn2.pack()
         reviewDir_lbl.pack()
-        self.gui['hocr_list'] = tk.Listbox(self.gui['correct_frame'], selectmode=tk.SINGLE)
+        self.gui['hocr_list'] = VirtualListbox(self.gui['correct_frame'], height=10)
         self.gui['hocr_list'].pack()
+        self.show_boxes = tk.BooleanVar(value=True)
+        show_boxes_btn = tk.Checkbutton(self.gui['correct_frame'], text="Show OCR boxes", variable=self.show_boxes,
+                                        command=self.toggle_boxes)
+        show_boxes_btn.pack()
+        search_frame = tk.LabelFrame(self.gui['correct_frame'], text="Search", padx=2, pady=2)
+        self.search_str = tk.StringVar()
+        search_entry = tk.Entry(search_frame, textvariable=self.search_str)
+        search_entry.bind('<Return>', self.search)
+        search_entry.pack()
+        ttk.Button(search_frame, text="Find", command=self.search).pack()
+        self.search_result_str = tk.StringVar()
+        tk.Label(search_frame, textvariable=self.search_result_str).pack()
+        self.gui['search_list'] = VirtualListbox(search_frame, self.__hit_label, height=5)
+        self.gui['search_list'].pack()
+        search_frame.pack()
         self.close_preview_btn = ttk.Button(self.gui['correct_frame'], text="Close Preview", command=self.preview_close,
                                             state=tk.DISABLED)
         self.close_preview_btn.pack()
@@ -103,12 +160,19 @@ class HocrEditor(ttk.Frame):
         self.stop_event = Event()
 
         master.config(menu=menubar)
+        self.after(100, self.__wait_for_tool)
 
     def quitter(self):
         """Quit button stops processing if the program is running, otherwise it closes the whole application"""
-        if self.running:
+        if self.running and self.job_id is not None:
+            try:
+                self.client.cancel(self.job_id)
+            except (OSError, ValueError, HocrException):
+                pass
+        elif self.running:
             self.stop_event.set()
         else:
+            self.prefetcher.stop()
             self.master.destroy()
 
     def run(self):
@@ -152,6 +216,8 @@ class HocrEditor(ttk.Frame):
             if self.image_id is not None:
                 self.test_canvas.delete(self.image_id)
             self.preview.destroy()
+            self.overlay.forget()
+            self.overlay = None
             self.test_canvas = None
             self.preview = None
             self.close_preview_btn.config({'state': tk.DISABLED})
@@ -159,19 +225,43 @@ class HocrEditor(ttk.Frame):
     def __load_processed_files(self):
         """Update the list with the pages available."""
         if self.correctDir.get() is not None and self.display_hocr is not None:
-            self.gui['hocr_list'].delete(0, tk.END)
-            for k, v in self.display_hocr.get_file_listing().items():
-                self.gui['hocr_list'].insert(tk.END, k)
-            self.__poll_processed_list()
+            self.display_hocr_current_page = None
+            self.gui['hocr_list'].selection_clear()
+            self.gui['hocr_list'].set_items(self.display_hocr.get_page_count(), self.display_hocr.get_label)
+            if not self.polling:
+                self.polling = True
+                self.__poll_processed_list()
 
     def __poll_processed_list(self):
-        """Has a new page been selected?"""
+        """Has a new page been selected, or have pages been added to the directory?"""
+        self.last_refresh += 250
+        if self.last_refresh >= self.refresh_interval:
+            self.last_refresh = 0
+            self.__refresh_processed_list()
         now = self.gui['hocr_list'].curselection()
         if now != self.display_hocr_current_page:
             self.__list_has_changed(now)
             self.display_hocr_current_page = now
+        now = self.gui['search_list'].curselection()
+        if now != self.search_current:
+            self.search_current = now
+            if len(now) > 0:
+                self.__show_hit(self.search_hits[now[0]])
         self.after(250, self.__poll_processed_list)
 
+    def __refresh_processed_list(self):
+        """Add pages written since the directory was opened, keeping the same page selected."""
+        selection = self.gui['hocr_list'].curselection()
+        selected_page = self.display_hocr.get_page_number(selection[0]) if len(selection) > 0 else None
+        if len(self.display_hocr.refresh()) == 0:
+            return
+        self.gui['hocr_list'].set_items(self.display_hocr.get_page_count())
+        if selected_page is not None:
+            index = self.display_hocr.find_page(selected_page)
+            if index is not None:
+                self.gui['hocr_list'].select(index)
+                self.display_hocr_current_page = (index, )
+
     def __list_has_changed(self, pages):
         """Chose a new page, show it on the canvas."""
         if pages is not None and len(pages) > 0:
@@ -181,51 +271,226 @@ class HocrEditor(ttk.Frame):
             elif self.test_canvas is None:
                 self.preview = tk.Toplevel(self.master)
                 self.test_canvas = tk.Canvas(master=self.preview, height=self.image_size + 10, width=self.image_size + 10)
-            file_map = self.display_hocr.get_file_listing()
-            image_selection = file_map.get(self.gui['hocr_list'].get(page))
-            back_image = image_selection.get('image_file')
+                self.overlay = BoxOverlay(self.test_canvas)
+                self.overlay.set_visible(self.show_boxes.get())
+            image_selection = self.display_hocr.get_files(page)
             self.scale = 1.0
 
-            self.original_image = Image.open(os.path.join(self.display_hocr.directory, back_image))
-            original_width = self.original_image.width
-            original_height = self.original_image.height
+            # Pages kept without an image are rasterized again from the source PDF.
+            self.image_path = self.display_hocr.get_image_path(page)
+            self.master.config(cursor='watch')
+            self.master.update_idletasks()
+            try:
+                (original_width, original_height) = self.image_cache.get_size(self.image_path)
+            except OSError as e:
+                tk.messagebox.showinfo(title="No page image", message=str(e), icon='warning')
+                return
+            finally:
+                self.master.config(cursor='')
             (new_height, new_width) = self.__resize_image(original_height, original_width, self.image_size)
-            image_new = self.original_image.resize((new_width, new_height), Image.ANTIALIAS)  # best down-sizing filter
+            self.fit_scale = new_width / original_width
+            self.view_center = (original_width / 2, original_height / 2)
+            # Usually ready already from when a neighbouring page was shown.
+            image_new = self.prefetcher.show(self.display_hocr.get_image_paths(), page, self.image_size)
+            from PIL import ImageTk
             self.image = ImageTk.PhotoImage(image_new)
             self.image_id = self.test_canvas.create_image(0, 0, image=self.image, anchor=tk.NW)
+            self.view_origin = (0, 0)
+            try:
+                self.hocr_page = HocrPage.load(os.path.join(self.display_hocr.directory,
+                                                            image_selection.get('ocr_file')))
+            except OSError:
+                self.hocr_page = None
+            self.overlay.set_page(self.hocr_page)
+            self.__draw_overlay()
+            if self.pending_hit is not None and self.pending_hit.page == self.display_hocr.get_page_number(page):
+                self.__highlight_hit(self.pending_hit)
+            self.pending_hit = None
             self.test_canvas.bind("<MouseWheel>", self.zoom)
+            self.test_canvas.bind("<Button-4>", self.zoom)
+            self.test_canvas.bind("<Button-5>", self.zoom)
+            self.test_canvas.bind("<ButtonPress-1>", self.start_pan)
+            self.test_canvas.bind("<B1-Motion>", self.pan)
+            # Shift drag outlines a part of the page to OCR again.
+            self.test_canvas.bind("<Shift-ButtonPress-1>", self.start_region)
+            self.test_canvas.bind("<Shift-B1-Motion>", self.drag_region)
+            self.test_canvas.bind("<Shift-ButtonRelease-1>", self.reocr_region)
             self.test_canvas.pack()
             self.test_canvas.focus()
             self.close_preview_btn.config({'state':tk.NORMAL})
 
-    def redraw_image(self, x=0, y=0):
-        """Redraw the image, usually with adjusted scale."""
-        if self.image_id and self.original_image:
+    def redraw_image(self):
+        """Redraw the visible part of the image at the current scale.
+
+        Only the part of the page inside the canvas is cropped and resampled, from the smallest
+        pre-scaled level with enough resolution for the current zoom.
+        """
+        if self.image_id is not None:
             self.test_canvas.delete(self.image_id)
-        iw, ih = self.original_image.size
-        # crop rectangle
-        cw, ch = iw / self.scale, ih / self.scale
-        if cw > iw or ch > ih:
-            cw = iw
-            ch = ih
-        # crop it
-        _x = int(iw / 2 - cw / 2)
-        _y = int(ih / 2 - ch / 2)
-        tmp_image = self.original_image.crop((_x, _y, _x + int(cw), _y + int(ch)))
-        size = int(cw * self.scale), int(ch * self.scale)
-        self.image = ImageTk.PhotoImage(tmp_image.resize(size))
-        self.image_id = self.test_canvas.create_image(x, y, image=self.image, anchor=tk.CENTER)
-
-        # tell the canvas to scale up/down the vector objects as well
-        self.test_canvas.scale(tk.ALL, x, y, self.scale, self.scale)
+        (iw, ih) = self.image_cache.get_size(self.image_path)
+        canvas_width = int(self.test_canvas.cget('width'))
+        canvas_height = int(self.test_canvas.cget('height'))
+        display_scale = self.fit_scale * self.scale
+        # The part of the full size page that fits in the canvas, kept inside the page where possible.
+        view_width = canvas_width / display_scale
+        view_height = canvas_height / display_scale
+        left = min(max(self.view_center[0] - view_width / 2, 0), max(iw - view_width, 0))
+        top = min(max(self.view_center[1] - view_height / 2, 0), max(ih - view_height, 0))
+        self.view_center = (left + view_width / 2, top + view_height / 2)
+        box = (left, top, min(left + view_width, iw), min(top + view_height, ih))
+
+        from PIL import Image, ImageTk
+        (level_image, level_scale) = self.image_cache.get_level(self.image_path, display_scale)
+        crop = level_image.crop(tuple(int(round(coordinate * level_scale)) for coordinate in box))
+        size = (max(1, int(round((box[2] - box[0]) * display_scale))),
+                max(1, int(round((box[3] - box[1]) * display_scale))))
+        self.image = ImageTk.PhotoImage(crop.resize(size, Image.BILINEAR))
+        self.image_id = self.test_canvas.create_image(0, 0, image=self.image, anchor=tk.NW)
+        self.view_origin = (left, top)
+        self.__draw_overlay()
+
+    def __draw_overlay(self):
+        """Draw the OCR boxes that are in view over the image."""
+        if self.overlay is None:
+            return
+        self.overlay.draw(self.view_origin[0], self.view_origin[1], self.fit_scale * self.scale,
+                          int(self.test_canvas.cget('width')), int(self.test_canvas.cget('height')))
+
+    def search(self, event=None):
+        """Look up the word in the search box, listing every page it is on."""
+        if self.display_hocr is None or self.search_str.get().strip() == '':
+            return
+        if self.search_index is None:
+            # Pages written before there was a search index are indexed now, once.
+            self.master.config(cursor='watch')
+            self.master.update_idletasks()
+            try:
+                self.search_index = index_directory(self.display_hocr.directory, SearchIndex(self.display_hocr.directory))
+            finally:
+                self.master.config(cursor='')
+        self.search_hits = self.search_index.search(self.search_str.get())
+        self.search_current = ()
+        self.gui['search_list'].selection_clear()
+        self.gui['search_list'].set_items(len(self.search_hits))
+        if len(self.search_hits) == 0:
+            self.search_result_str.set("No matches")
+        else:
+            self.search_result_str.set("{} matches on {} pages".format(
+                len(self.search_hits), len(set(hit.page for hit in self.search_hits))))
+
+    def __hit_label(self, index):
+        hit = self.search_hits[index]
+        return 'Page {}: {}'.format(hit.page + 1, hit.term)
+
+    def __show_hit(self, hit):
+        """Go to the page of a search hit and highlight the word."""
+        index = self.display_hocr.find_page(hit.page)
+        if index is None:
+            self.display_hocr.refresh()
+            index = self.display_hocr.find_page(hit.page)
+            if index is None:
+                return
+            self.gui['hocr_list'].set_items(self.display_hocr.get_page_count())
+        if self.display_hocr_current_page == (index, ) and self.test_canvas is not None:
+            self.__highlight_hit(hit)
+        else:
+            # Highlighted once the poll has loaded the page.
+            self.pending_hit = hit
+            self.gui['hocr_list'].select(index)
+
+    def __highlight_hit(self, hit):
+        """Outline the word of a hit and zoom in around it."""
+        self.overlay.highlight([hit.word])
+        (x0, y0, x1, y1) = hit.bbox
+        self.view_center = ((x0 + x1) / 2, (y0 + y1) / 2)
+        self.scale = max(self.scale, 2.0)
+        self.redraw_image()
+
+    def toggle_boxes(self):
+        """Show or hide the OCR boxes."""
+        if self.overlay is not None:
+            self.overlay.set_visible(self.show_boxes.get())
+            self.__draw_overlay()
 
     def zoom(self, event):
-        """Zoom bound to mouse wheel event."""
-        if event.delta > 0:
-            self.scale *= 2
-        elif event.delta < 0:
-            self.scale *= 0.5
-        self.redraw_image(event.x, event.y)
+        """Zoom bound to mouse wheel event, keeping the point under the pointer where it is."""
+        if event.num == 4 or event.delta > 0:
+            factor = 2.0
+        elif event.num == 5 or event.delta < 0:
+            factor = 0.5
+        else:
+            return
+        new_scale = min(max(self.scale * factor, self.min_scale), self.max_scale)
+        if new_scale == self.scale:
+            return
+        (x, y) = self.__canvas_to_image(event.x, event.y)
+        (cx, cy) = self.view_center
+        ratio = self.scale / new_scale
+        self.view_center = (x - (x - cx) * ratio, y - (y - cy) * ratio)
+        self.scale = new_scale
+        self.redraw_image()
+
+    def start_pan(self, event):
+        self.drag_from = (event.x, event.y)
+
+    def pan(self, event):
+        """Drag the page around with the mouse."""
+        if self.drag_from is None:
+            return
+        display_scale = self.fit_scale * self.scale
+        (cx, cy) = self.view_center
+        self.view_center = (cx - (event.x - self.drag_from[0]) / display_scale,
+                            cy - (event.y - self.drag_from[1]) / display_scale)
+        self.drag_from = (event.x, event.y)
+        self.redraw_image()
+
+    def start_region(self, event):
+        self.region_from = self.__canvas_to_image(event.x, event.y)
+        self.region_item = self.test_canvas.create_rectangle(event.x, event.y, event.x, event.y,
+                                                             outline='#ff1f1f', dash=(4, 2))
+
+    def drag_region(self, event):
+        """Stretch the outline of the region to the pointer."""
+        if self.region_item is None:
+            return
+        (x0, y0, x1, y1) = self.test_canvas.coords(self.region_item)
+        self.test_canvas.coords(self.region_item, x0, y0, event.x, event.y)
+
+    def reocr_region(self, event):
+        """OCR the outlined part of the page again and show the words found."""
+        if self.region_item is None:
+            return
+        self.test_canvas.delete(self.region_item)
+        self.region_item = None
+        (x0, y0) = self.region_from
+        (x1, y1) = self.__canvas_to_image(event.x, event.y)
+        box = (int(min(x0, x1)), int(min(y0, y1)), int(max(x0, x1)) + 1, int(max(y0, y1)) + 1)
+        if box[2] - box[0] < 4 or box[3] - box[1] < 4:
+            return
+        if self.hocr is None:
+            tk.messagebox.showinfo(title="No OCR tool", message="No OCR tool has been found yet.", icon='warning')
+            return
+        (index, ) = self.display_hocr_current_page
+        page_number = self.display_hocr.get_page_number(index)
+        self.master.config(cursor='watch')
+        self.master.update_idletasks()
+        try:
+            self.hocr.reocr_regions(self.display_hocr.directory, {page_number: box})
+        except HocrException as e:
+            tk.messagebox.showinfo(title="Could not OCR the region", message=str(e), icon='warning')
+            return
+        finally:
+            self.master.config(cursor='')
+        # The page went into the search log, which the search index reads when next searched.
+        self.hocr_page = HocrPage.load(os.path.join(self.display_hocr.directory,
+                                                    self.display_hocr.get_files(index).get('ocr_file')))
+        self.overlay.set_page(self.hocr_page)
+        self.__draw_overlay()
+
+    def __canvas_to_image(self, x, y):
+        """Convert canvas coordinates to full size image coordinates."""
+        display_scale = self.fit_scale * self.scale
+        return self.view_origin[0] + x / display_scale, self.view_origin[1] + y / display_scale
 
     def __resize_image(self, height, width, max_size):
         """Figure out the resized image."""
@@ -236,16 +501,20 @@ class HocrEditor(ttk.Frame):
             else:
                 new_width = max_size
                 new_height = int((max_size / width) * height)
-        return (new_height, new_width)
+            return (new_height, new_width)
+        return (height, width)
 
     def ask_correct_dir(self):
         """ask for a directory"""
         output_dir = fd.askdirectory(initialdir=os.path.dirname(__file__), title="Choose the directory of processed files.")
         if output_dir is not None:
             if os.path.exists(output_dir) and os.access(output_dir, os.R_OK):
-                self.display_hocr = HocrDisplayer(output_dir)
-                files = self.display_hocr.get_file_listing()
-                if len(files) == 0:
+                if self.page_renders is not None:
+                    self.page_renders.close()
+                self.page_renders = PageRenderCache(output_dir)
+                self.image_cache.set_regenerate(self.page_renders.make)
+                self.display_hocr = HocrDisplayer(output_dir, self.page_renders.path_for)
+                if self.display_hocr.get_page_count() == 0:
                     tk.messagebox.showinfo(
                         title="Choose a directory of processed files.",
                         icon="warning",
@@ -254,6 +523,13 @@ class HocrEditor(ttk.Frame):
                     self.ask_correct_dir()
                 else:
                     self.correctDir.set(output_dir)
+                    if self.search_index is not None:
+                        self.search_index.close()
+                    self.search_index = None
+                    self.search_hits = []
+                    self.search_current = ()
+                    self.search_result_str.set("")
+                    self.gui['search_list'].set_items(0)
                     self.__load_processed_files()
 
             else:
@@ -263,36 +539,82 @@ class HocrEditor(ttk.Frame):
                     message="The directory {} does not exist or we can't write to it. Please choose another directory.".format(output_dir))
                 self.ask_correct_dir()
 
+    def __find_tool(self):
+        """Runs in the background, Tk is left to the main thread."""
+        try:
+            self.hocr = Hocr()
+        except HocrException as e:
+            self.hocr_error = e
+
+    def __wait_for_tool(self):
+        """Show the OCR tool once it is found."""
+        if self.hocr_error is not None:
+            self.tool_str.set("No OCR tool found")
+            tk.messagebox.showinfo(title="No OCR tool", message=str(self.hocr_error), icon='warning')
+        elif self.hocr is None:
+            self.after(100, self.__wait_for_tool)
+        else:
+            self.tool_str.set("{} {}, {} languages".format(
+                self.hocr.image_tool.get_name(), '.'.join(str(part) for part in self.hocr.image_tool.get_version()),
+                len(self.hocr.get_languages())))
+            self.check_hocr()
+
     def check_hocr(self):
-        if self.inputFile_str.get() != "" and self.outputDir_str.get() != "":
+        if self.hocr is not None and self.inputFile_str.get() != "" and self.outputDir_str.get() != "":
             self.run_btn.config({'state': tk.NORMAL})
         else:
             self.run_btn.config({'state': tk.DISABLED})
 
     def start_hocr(self):
+        if self.hocr is None:
+            tk.messagebox.showinfo(title="No OCR tool", message="No OCR tool has been found yet.", icon='warning')
+            return
         if self.inputFile_str.get() is None:
             tk.messagebox.showinfo(title="No file", message="Choose a file to process.", icon='warning')
             return
         if self.outputDir_str.get() is None:
             tk.messagebox.showinfo(title="No directory", message="Choose an output directory.", icon='warning')
             return
-        self.hocr_progress = 0
-        window = tk.Toplevel(self)
+        self.hocr_progress = tk.DoubleVar(value=0)
+        self.hocr_rate = tk.StringVar(value="Starting")
+        self.progress_stats = ProgressStats()
+        window = self.progress_window = tk.Toplevel(self)
         window.wm_title("HOCR Progress")
         window.attributes("-topmost", True)
-        progress = ttk.Progressbar(window, variable=self.hocr_progress)
+        progress = ttk.Progressbar(window, variable=self.hocr_progress, maximum=100, length=250)
         progress.pack()
+        rate_lbl = tk.Label(window, textvariable=self.hocr_rate)
+        rate_lbl.pack()
         btn = tk.Button(window, text="Cancel", command=self.quitter)
         btn.pack()
         window.focus()
 
+        # Queue the file on a running HocrServer, so it takes its turn with the server's other jobs.
+        self.client = HocrClient(timeout=self.server_timeout)
+        try:
+            job = self.client.submit(self.inputFile_str.get(), self.outputDir_str.get(), 'eng')
+        except HocrException as e:
+            window.destroy()
+            tk.messagebox.showinfo(title="Not queued", message=str(e), icon='warning')
+            return
+        except (OSError, ValueError):
+            # No server is listening, do the work here.
+            job = None
+        if job is not None:
+            self.job_id = job['id']
+            self.running = True
+            self.after(1000, self.check_job)
+            return
+
+        # A Cancel of an earlier run left it set.
+        self.stop_event.clear()
         keyword_args = {'language': 'eng', 'output_directory': self.outputDir_str.get(), 'pipe': self.child_pipe,
                         'stop': self.stop_event}
         self.process = Process(target=self.hocr.run, args=[self.inputFile_str.get()], kwargs=keyword_args)
         ThreadedTask(self.process, self.running).start()
+        self.running = True
 
-        self.after(1000, self.check_process())
-        window.destroy()
+        self.after(1000, self.check_process)
 
     def start_and_wait_for_task(self):
         self.running = True
@@ -302,13 +624,43 @@ class HocrEditor(ttk.Frame):
         self.stop_event.set()
 
     def check_process(self):
-        if self.parent_pipe.poll(10):
-            (current_page, total_pages) = self.parent_pipe.recv()
-            self.hocr_progress = current_page / total_pages
+        """Take in the progress events sent since the last check and show the rate and time left."""
+        while self.parent_pipe.poll():
+            self.progress_stats.send(self.parent_pipe.recv())
+        stats = self.progress_stats
+        self.show_progress(stats.get_done(), stats.get_total(), stats.pages_per_second(), stats.eta())
         if not self.process.is_alive():
             self.running = False
+            self.progress_window.destroy()
         else:
-            self.after(1000, self.check_process())
+            self.after(1000, self.check_process)
+
+    def check_job(self):
+        """Show the progress of the job queued on the server, until it is done, failed or cancelled."""
+        try:
+            job = self.client.job(self.job_id)
+        except (OSError, ValueError, HocrException) as e:
+            job = {'status': Job.failed, 'error': "Lost the server: {}".format(e)}
+        if job['status'] in (Job.queued, Job.running):
+            if job['status'] == Job.queued:
+                self.hocr_rate.set("Waiting for the server")
+            else:
+                (done, total) = job['progress']
+                self.show_progress(done, total, job['stats']['pages_per_second'], job['stats']['eta'])
+            self.after(1000, self.check_job)
+            return
+        self.running = False
+        self.job_id = None
+        self.progress_window.destroy()
+        if job['status'] == Job.failed:
+            tk.messagebox.showinfo(title="HOCR failed", message=job['error'], icon='warning')
+
+    def show_progress(self, done, total, pages_per_second, eta):
+        if total > 0:
+            self.hocr_progress.set(100 * done / total)
+            self.hocr_rate.set("{} of {} pages, {:.2f} pages/s, {}".format(
+                done, total, pages_per_second,
+                "{}:{:02d} left".format(*divmod(int(eta), 60)) if eta is not None else "working"))
 
 
 class ThreadedTask(threading.Thread):
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""Progress events sent by Hocr.run() and Hocr.run_batch() through their pipe.
+
+Every event is a dict with at least:
+
+    event   'document' when a file has been opened, 'page' when a page is done or failed, 'finished'
+            when a file is done with
+    file    the file the event is about
+    done    pages of the file dealt with so far, skipped ones included
+    total   pages in the file
+    time    when it happened, as time.time()
+
+'document' events add output_directory and skipped. 'page' events add page, status ('done' or 'failed'),
+error for failed pages, and for pages done timings (seconds spent in each of render, save_image, ocr and
+write_hocr), page_info (the resolution the page was rendered at and, when blank pages are skipped, its
+ink and whether it was blank), bytes_written, rss and peak_rss (the memory the process that did the page
+has resident and the most it has had, in bytes) and pid. 'finished' events add result, as Document.get_result().
+"""
+import json
+import os
+import sys
+import time
+from collections import deque
+
+try:
+    import resource
+except ImportError:
+    # Not on Windows.
+    resource = None
+
+stages = ('render', 'save_image', 'ocr', 'write_hocr')
+
+
+def timed(timings, stage, func, *args, **kwargs):
+    """Call func, adding the seconds it took to timings[stage]."""
+    started = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - started
+
+
+def peak_rss():
+    """The most memory this process has had resident, in bytes, None where we can't tell."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes, except on macOS.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def current_rss():
+    """The memory this process has resident now, in bytes, the peak where we can't tell."""
+    try:
+        with open('/proc/self/statm', 'r') as fp:
+            return int(fp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return peak_rss()
+
+
+class ProgressStats:
+    """Running totals of the events of a run: pages per second, time left and where the time went.
+
+    Has send() and close() so it can be given to Hocr as the pipe, or be fed events received from one.
+    """
+
+    window = 30.0
+
+    def __init__(self):
+        self.files = {}
+        self.pages = 0
+        self.failed = 0
+        self.blank = 0
+        self.stage_seconds = {stage: 0.0 for stage in stages}
+        self.bytes_written = 0
+        self.peak_rss = {}
+        self.recent = deque()
+        self.started = time.time()
+        self.last = None
+
+    def send(self, event):
+        self.last = event
+        self.files[event['file']] = (event['done'], event['total'])
+        if event['event'] != 'page':
+            return
+        if event['status'] == 'failed':
+            self.failed += 1
+            return
+        self.pages += 1
+        if event.get('page_info', {}).get('blank'):
+            self.blank += 1
+        for (stage, seconds) in event.get('timings', {}).items():
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+        self.bytes_written += event.get('bytes_written', 0)
+        if event.get('peak_rss') is not None:
+            self.peak_rss[event.get('pid')] = event['peak_rss']
+        self.recent.append(event['time'])
+        while len(self.recent) > 2 and self.recent[0] < event['time'] - self.window:
+            self.recent.popleft()
+
+    def close(self):
+        pass
+
+    def get_done(self):
+        return sum(done for (done, total) in self.files.values())
+
+    def get_total(self):
+        return sum(total for (done, total) in self.files.values())
+
+    def pages_per_second(self):
+        """The rate over the last half minute or so, over the whole run until there is that much."""
+        if len(self.recent) == 0:
+            return 0.0
+        if len(self.recent) > 1 and self.recent[-1] - self.recent[0] >= self.window / 2:
+            return (len(self.recent) - 1) / (self.recent[-1] - self.recent[0])
+        elapsed = time.time() - self.started
+        return self.pages / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        """Seconds until the pages known about are done, None until there is a rate to go by."""
+        rate = self.pages_per_second()
+        if rate <= 0:
+            return None
+        return (self.get_total() - self.get_done()) / rate
+
+    def get_stats(self):
+        """The totals as something that can be written out as JSON."""
+        return {
+            'pages': self.pages,
+            'failed_pages': self.failed,
+            'blank_pages': self.blank,
+            'done': self.get_done(),
+            'total': self.get_total(),
+            'seconds': time.time() - self.started,
+            'pages_per_second': self.pages_per_second(),
+            'eta': self.eta(),
+            'stage_seconds': dict(self.stage_seconds),
+            'bytes_written': self.bytes_written,
+            'peak_rss': max(self.peak_rss.values()) if len(self.peak_rss) > 0 else None,
+        }
+
+    def describe(self):
+        """Where the time went, a line per stage."""
+        stats = self.get_stats()
+        busy = sum(stats['stage_seconds'].values())
+        lines = ['{} pages, {} blank, {} failed, {:.2f} pages/s, {:.1f} MB written, peak RSS {}'.format(
+            stats['pages'], stats['blank_pages'], stats['failed_pages'], stats['pages_per_second'], stats['bytes_written'] / 1e6,
+            '{:.0f} MB'.format(stats['peak_rss'] / 1e6) if stats['peak_rss'] is not None else 'unknown')]
+        for (stage, seconds) in stats['stage_seconds'].items():
+            lines.append('{:<12} {:>9.1f}s {:>5.1f}% {:>8.3f}s/page'.format(
+                stage, seconds, 100 * seconds / busy if busy > 0 else 0.0,
+                seconds / stats['pages'] if stats['pages'] > 0 else 0.0))
+        return '\n'.join(lines)
+
+
+class EventLog:
+    """Writes events as JSON lines to a file, - for standard output, as they arrive."""
+
+    def __init__(self, path):
+        self.path = path
+        if path == '-':
+            self.fp = sys.stdout
+        else:
+            self.fp = open(path, 'a', encoding='utf-8')
+
+    def send(self, event):
+        self.fp.write(json.dumps(event) + '\n')
+        self.fp.flush()
+
+    def close(self):
+        if self.fp is not sys.stdout and not self.fp.closed:
+            self.fp.close()
+
+
+class EventTee:
+    """Hands each event to several pipes."""
+
+    def __init__(self, *pipes):
+        self.pipes = [pipe for pipe in pipes if pipe is not None]
+
+    def send(self, event):
+        for pipe in self.pipes:
+            pipe.send(event)
+
+    def close(self):
+        for pipe in self.pipes:
+            pipe.close()
+
+
+def page_resources(outputs):
+    """bytes_written, rss, peak_rss and pid of a page done in this process, outputs as from describe_files."""
+    return {
+        'bytes_written': sum(output['size'] for output in outputs.values()),
+        'rss': current_rss(),
+        'peak_rss': peak_rss(),
+        'pid': os.getpid(),
+    }
@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+
+import sys
+
+if sys.version_info[0] != 3:
+    print("This script requires Python version 3 or greater")
+    sys.exit(1)
+
+import argparse
+import html
+import os
+import os.path
+import struct
+import tempfile
+import zlib
+from array import array
+sys.path.append(os.path.dirname(__file__))
+from hocrdisplayer import find_page_image
+from hocrmanifest import Manifest
+from hocrpage import HocrPage
+
+formats = ('hocr', 'pdf')
+
+
+class Exporter:
+    """Writes the pages of an output directory into one hOCR file and a searchable PDF, in page order.
+
+    Pages are written one at a time as they are handed to ready(), so memory use does not grow with the
+    number of pages. Pages may become ready in any order, those that come early wait (as page numbers
+    only) until the pages before them are written. Either file can be left out by giving no path for it.
+    The files are written under temporary names and moved into place by close().
+    """
+
+    hocr_filename = 'document.hocr'
+    pdf_filename = 'document.pdf'
+
+    def __init__(self, directory, pages, hocr_path=None, pdf_path=None, manifest=None, resolution=300):
+        self.directory = directory
+        self.pages = sorted(pages)
+        self.next = 0
+        self.waiting = set()
+        self.failed = set()
+        # Why each page that could not be exported was left out.
+        self.errors = {}
+        self.manifest = manifest if manifest is not None else Manifest(directory)
+        self.resolution = resolution
+        self.pdf_file = None
+        self.writers = []
+        if hocr_path is not None:
+            self.writers.append(HocrWriter(hocr_path))
+        if pdf_path is not None:
+            self.writers.append(PdfWriter(pdf_path))
+
+    def ready(self, page_number, failed=False):
+        """Page page_number is done with, write it and any pages after it that were waiting for it.
+
+        A failed page is left out of the export, as is a page that can't be read back, see errors.
+        """
+        (self.failed if failed else self.waiting).add(page_number)
+        while self.next < len(self.pages):
+            page_number = self.pages[self.next]
+            if page_number in self.waiting:
+                self.waiting.discard(page_number)
+                self.__write(page_number)
+            elif page_number in self.failed:
+                self.failed.discard(page_number)
+            else:
+                break
+            self.next += 1
+
+    def __write(self, page_number):
+        """Write a page, a page whose files can't be read is left out and noted in errors."""
+        try:
+            self.__write_page(page_number)
+        except (OSError, ValueError) as e:
+            self.errors[page_number] = str(e)
+
+    def __write_page(self, page_number):
+        hocr_file = os.path.join(self.directory, 'Page{}.hocr'.format(page_number))
+        image_file = find_page_image(self.directory, page_number)
+        page = HocrPage.load(hocr_file)
+        # Pages kept without an image are only text in the PDF.
+        image = read_image(image_file) if image_file is not None else None
+        resolution = self.manifest.get_resolution(page_number, self.resolution)
+        size = image.size if image is not None else self.__page_size(page_number, resolution, page)
+        for writer in self.writers:
+            writer.add_page(page_number, page, image, resolution, size,
+                            os.path.basename(image_file) if image_file is not None else None)
+
+    def __page_size(self, page_number, resolution, page):
+        """The size in pixels of a page without an image, from the source PDF if it is still there."""
+        source = self.manifest.get_source()
+        if source is not None and os.path.exists(source):
+            if self.pdf_file is None:
+                import PyPDF2
+                self.pdf_file = PyPDF2.PdfFileReader(source)
+            box = self.pdf_file.getPage(page_number).mediaBox
+            return (int(round(float(box.getWidth()) * resolution / 72)),
+                    int(round(float(box.getHeight()) * resolution / 72)))
+        return page.width, page.height
+
+    def close(self):
+        """Write what is still waiting, in order, skipping pages that never became ready, and finish the files.
+
+        If that fails the files are left as they were and their temporary files removed.
+        """
+        try:
+            for page_number in self.pages[self.next:]:
+                if page_number in self.waiting:
+                    self.__write(page_number)
+        except BaseException:
+            for writer in self.writers:
+                writer.discard()
+            raise
+        finally:
+            self.waiting = set()
+            self.failed = set()
+            self.next = len(self.pages)
+        for writer in self.writers:
+            writer.close()
+
+    def discard(self):
+        """Give up on the export, leaving the files as they were before it started."""
+        for writer in self.writers:
+            writer.discard()
+        self.writers = []
+
+
+class HocrWriter:
+    """One hOCR document of many pages, written a page at a time."""
+
+    header = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+              '<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN"\n'
+              ' "http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">\n'
+              '<html xmlns="http://www.w3.org/1999/xhtml">\n<head>\n'
+              '<meta http-equiv="content-type" content="text/html; charset=utf-8" />\n'
+              '<meta name="ocr-system" content="HocrEditor" />\n'
+              '<meta name="ocr-capabilities" content="ocr_page ocr_line ocrx_word" />\n'
+              '<title>OCR output</title>\n</head>\n<body>\n')
+
+    def __init__(self, path):
+        self.path = path
+        (handle, self.temp_path) = tempfile.mkstemp(prefix='.export', dir=os.path.dirname(os.path.abspath(path)))
+        self.fp = os.fdopen(handle, 'w', encoding='utf-8')
+        self.fp.write(self.header)
+
+    def add_page(self, page_number, page, image, resolution, size, image_name=None):
+        (width, height) = size
+        image_title = 'image {}; '.format(html.escape('"{}"'.format(image_name))) if image_name is not None else ''
+        self.fp.write('<div class="ocr_page" id="page_{0}" title="{1}bbox 0 0 {2} {3}; ppageno {0}; '
+                      'scan_res {4} {4}">\n'.format(page_number, image_title, width, height, resolution))
+        for line in range(page.line_count()):
+            words = ' '.join(
+                '<span class="ocrx_word" id="word_{}_{}" title="bbox {} {} {} {}; x_wconf {}">{}</span>'.format(
+                    page_number, word, page.word_x0[word], page.word_y0[word], page.word_x1[word],
+                    page.word_y1[word], page.word_confidence[word], html.escape(page.word_text[word]))
+                for word in page.get_line_words(line))
+            self.fp.write('<span class="ocr_line" id="line_{}_{}" title="bbox {} {} {} {}">{}</span>\n'.format(
+                page_number, line, *page.get_line_bbox(line), words))
+        self.fp.write('</div>\n')
+
+    def close(self):
+        self.fp.write('</body>\n</html>\n')
+        self.fp.close()
+        os.replace(self.temp_path, self.path)
+
+    def discard(self):
+        self.fp.close()
+        os.unlink(self.temp_path)
+
+
+class PdfWriter:
+    """A PDF of page images with their words as invisible text over them, written a page at a time.
+
+    Each page's objects are written as soon as the page is added. The object listing the pages, which
+    has to know them all, is written last, so only the object offsets are kept until then. The text is
+    in the standard Helvetica font, words are scaled to the width of their boxes, so a PDF viewer's
+    search and selection line up with the image. Characters Helvetica can't show become '?'.
+    """
+
+    catalog = 1
+    pages = 2
+    font = 3
+
+    def __init__(self, path):
+        self.path = path
+        (handle, self.temp_path) = tempfile.mkstemp(prefix='.export', dir=os.path.dirname(os.path.abspath(path)))
+        self.fp = os.fdopen(handle, 'wb')
+        self.offsets = array('q', [0] * 4)
+        self.page_objects = array('i')
+        self.fp.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self.__object(self.catalog, '<< /Type /Catalog /Pages {} 0 R >>'.format(self.pages).encode('ascii'))
+        self.__object(self.font, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+
+    def __new_object(self):
+        self.offsets.append(0)
+        return len(self.offsets) - 1
+
+    def __object(self, number, dictionary, chunks=None):
+        """Write object number, a dictionary followed by a stream of chunks if given."""
+        self.offsets[number] = self.fp.tell()
+        self.fp.write('{} 0 obj\n'.format(number).encode('ascii'))
+        self.fp.write(dictionary)
+        if chunks is not None:
+            self.fp.write(b'\nstream\n')
+            for chunk in chunks:
+                self.fp.write(chunk)
+            self.fp.write(b'\nendstream')
+        self.fp.write(b'\nendobj\n')
+
+    def add_page(self, page_number, page, image, resolution, size, image_name=None):
+        (width, height) = size
+        scale = 72.0 / resolution
+        (page_width, page_height) = (width * scale, height * scale)
+        resources = '/Font << /F1 {} 0 R >>'.format(self.font)
+        content = []
+        if image is not None:
+            image_object = self.__new_object()
+            (dictionary, chunks) = image.pdf_stream()
+            self.__object(image_object, dictionary, chunks)
+            resources += ' /XObject << /Im0 {} 0 R >>'.format(image_object)
+            content.append('q {:.3f} 0 0 {:.3f} 0 0 cm /Im0 Do Q'.format(page_width, page_height))
+        content.append('BT 3 Tr')
+        for line in range(page.line_count()):
+            words = page.get_line_words(line)
+            for word in words:
+                text = page.word_text[word] + (' ' if word != words[-1] else '')
+                size = max(1.0, (page.word_y1[word] - page.word_y0[word]) * scale)
+                # Helvetica is about half an em wide per character on average.
+                natural = max(1.0, len(text) * size * 0.5)
+                stretch = 100.0 * (page.word_x1[word] - page.word_x0[word]) * scale / natural
+                content.append('/F1 {:.2f} Tf {:.1f} Tz 1 0 0 1 {:.2f} {:.2f} Tm ({}) Tj'.format(
+                    size, stretch, page.word_x0[word] * scale, page_height - page.word_y1[word] * scale,
+                    pdf_string(text)))
+        content.append('ET')
+        stream = zlib.compress('\n'.join(content).encode('latin-1'))
+        content_object = self.__new_object()
+        self.__object(content_object, '<< /Length {} /Filter /FlateDecode >>'.format(len(stream)).encode('ascii'),
+                      [stream])
+        page_object = self.__new_object()
+        self.__object(page_object, '<< /Type /Page /Parent {} 0 R /MediaBox [0 0 {:.3f} {:.3f}] /Resources << {} >> '
+                                   '/Contents {} 0 R >>'.format(self.pages, page_width, page_height, resources,
+                                                                content_object).encode('ascii'))
+        self.page_objects.append(page_object)
+
+    def close(self):
+        kids = ' '.join('{} 0 R'.format(number) for number in self.page_objects)
+        self.__object(self.pages, '<< /Type /Pages /Kids [{}] /Count {} >>'.format(
+            kids, len(self.page_objects)).encode('ascii'))
+        xref = self.fp.tell()
+        self.fp.write('xref\n0 {}\n0000000000 65535 f \n'.format(len(self.offsets)).encode('ascii'))
+        for offset in self.offsets[1:]:
+            self.fp.write('{:010d} 00000 n \n'.format(offset).encode('ascii'))
+        self.fp.write('trailer\n<< /Size {} /Root {} 0 R >>\nstartxref\n{}\n%%EOF\n'.format(
+            len(self.offsets), self.catalog, xref).encode('ascii'))
+        self.fp.close()
+        os.replace(self.temp_path, self.path)
+
+    def discard(self):
+        self.fp.close()
+        os.unlink(self.temp_path)
+
+
+def pdf_string(text):
+    """text as the inside of a PDF literal string in WinAnsiEncoding."""
+    escaped = []
+    for byte in text.encode('cp1252', errors='replace'):
+        if byte in b'()\\':
+            escaped.append('\\' + chr(byte))
+        elif byte < 32 or byte > 126:
+            escaped.append('\\{:03o}'.format(byte))
+        else:
+            escaped.append(chr(byte))
+    return ''.join(escaped)
+
+
+class PngImage:
+    """A gray PNG whose compressed pixels can go into a PDF as they are.
+
+    PNG and PDF both compress with Flate and filter rows the same way, so the IDAT data is copied into the
+    PDF with the PNG predictor named, never decoded.
+    """
+
+    signature = b'\x89PNG\r\n\x1a\n'
+
+    def __init__(self, path, size, bits, chunks):
+        self.path = path
+        self.size = size
+        self.bits = bits
+        # (offset, length) of each IDAT chunk's data.
+        self.chunks = chunks
+
+    def pdf_stream(self):
+        dictionary = ('<< /Type /XObject /Subtype /Image /Width {0} /Height {1} /ColorSpace /DeviceGray '
+                      '/BitsPerComponent {2} /Filter /FlateDecode /DecodeParms << /Predictor 15 /Colors 1 '
+                      '/BitsPerComponent {2} /Columns {0} >> /Length {3} >>').format(
+            self.size[0], self.size[1], self.bits, sum(length for (offset, length) in self.chunks))
+        return dictionary.encode('ascii'), self.__read()
+
+    def __read(self):
+        with open(self.path, 'rb') as fp:
+            for (offset, length) in self.chunks:
+                fp.seek(offset)
+                yield fp.read(length)
+
+
+class PilImage:
+    """Any other image PIL can read, compressed again for the PDF."""
+
+    def __init__(self, path):
+        from PIL import Image
+        self.path = path
+        with Image.open(path) as image:
+            self.size = image.size
+
+    def pdf_stream(self):
+        from PIL import Image
+        with Image.open(self.path) as image:
+            if image.mode == '1':
+                (bits, data) = (1, image.tobytes())
+            else:
+                (bits, data) = (8, image.convert('L').tobytes())
+        data = zlib.compress(data)
+        dictionary = ('<< /Type /XObject /Subtype /Image /Width {} /Height {} /ColorSpace /DeviceGray '
+                      '/BitsPerComponent {} /Filter /FlateDecode /Length {} >>').format(
+            self.size[0], self.size[1], bits, len(data))
+        return dictionary.encode('ascii'), [data]
+
+
+def read_image(path):
+    """The page image at path as a PngImage if it can be copied as it is, otherwise as a PilImage."""
+    with open(path, 'rb') as fp:
+        if fp.read(8) == PngImage.signature:
+            size = None
+            chunks = []
+            while True:
+                header = fp.read(8)
+                if len(header) < 8:
+                    break
+                (length, kind) = struct.unpack('>I4s', header)
+                if kind == b'IHDR':
+                    (width, height, bits, colour, compression, filtering, interlace) = struct.unpack(
+                        '>IIBBBBB', fp.read(13))
+                    if colour != 0 or interlace != 0 or bits not in (1, 8):
+                        break
+                    size = (width, height)
+                    fp.seek(4, os.SEEK_CUR)
+                    continue
+                if kind == b'IDAT':
+                    chunks.append((fp.tell(), length))
+                elif kind == b'IEND':
+                    if size is not None and len(chunks) > 0:
+                        return PngImage(path, size, bits, chunks)
+                    break
+                fp.seek(length + 4, os.SEEK_CUR)
+    return PilImage(path)
+
+
+def export_directory(directory, hocr_path=None, pdf_path=None):
+    """Export every PageN.hocr of a directory, see Exporter. Returns the closed Exporter."""
+    from hocrdisplayer import HocrDisplayer
+    displayer = HocrDisplayer(directory)
+    pages = [displayer.get_page_number(index) for index in range(displayer.get_page_count())]
+    exporter = Exporter(directory, pages, hocr_path, pdf_path)
+    for page_number in pages:
+        exporter.ready(page_number)
+    exporter.close()
+    return exporter
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Export an output directory as one HOCR file and a searchable PDF')
+    parser.add_argument('--hocr', default=None,
+                        help='Combined HOCR file (default: {} in the directory)'.format(Exporter.hocr_filename))
+    parser.add_argument('--pdf', default=None,
+                        help='Searchable PDF (default: {} in the directory)'.format(Exporter.pdf_filename))
+    parser.add_argument('--only', choices=formats, default=None, help='Write only this format')
+    parser.add_argument('directory', help='Directory of PageN.hocr files')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        parser.error('Directory {} not found'.format(args.directory))
+    hocr_path = None
+    pdf_path = None
+    if args.only in (None, 'hocr'):
+        hocr_path = args.hocr or os.path.join(args.directory, Exporter.hocr_filename)
+    if args.only in (None, 'pdf'):
+        pdf_path = args.pdf or os.path.join(args.directory, Exporter.pdf_filename)
+    exporter = export_directory(args.directory, hocr_path, pdf_path)
+    for (page_number, error) in sorted(exporter.errors.items()):
+        print('Left out page {}: {}'.format(page_number, error), file=sys.stderr)
+    print('Exported {} pages'.format(len(exporter.pages) - len(exporter.errors)))
+    sys.exit(1 if len(exporter.errors) > 0 else 0)
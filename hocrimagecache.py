@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+import hashlib
+import logging
+import os
+import os.path
+import queue
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from hocrmanifest import Manifest
+from hocrrender import get_renderer
+
+
+class ImageCache:
+    """Page images at several resolutions, the least recently used evicted past a memory cap.
+
+    Level 0 of a page is the image as stored, each further level halves the width and height of the one
+    before, down to smallest pixels on the longest side. Asking for a page at some scale gives the
+    smallest level with at least that resolution, so showing a whole page never touches the full size
+    image once the levels exist. Levels can be saved next to the image (PageN.level1.png ...) so they are
+    only generated once per page rather than once per session. An image that is not there is asked of
+    regenerate, if set, see PageRenderCache.
+    """
+
+    level_name = '{}.level{}.png'
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, smallest=256, persist=False, regenerate=None):
+        self.max_bytes = max_bytes
+        self.smallest = smallest
+        self.persist = persist
+        self.regenerate = regenerate
+        self.images = OrderedDict()
+        self.sizes = {}
+        self.used_bytes = 0
+        self.lock = threading.RLock()
+
+    def set_regenerate(self, regenerate):
+        """Call regenerate with the path of an image that is not there to have it made, None to not."""
+        self.regenerate = regenerate
+
+    def __ensure(self, path):
+        if self.regenerate is not None and not os.path.exists(path):
+            self.regenerate(path)
+
+    def get_size(self, path):
+        """Width and height of the full size image, read from the file header only."""
+        from PIL import Image
+        self.__ensure(path)
+        with self.lock:
+            if path not in self.sizes:
+                with Image.open(path) as image:
+                    self.sizes[path] = image.size
+            return self.sizes[path]
+
+    def level_count(self, path):
+        (width, height) = self.get_size(path)
+        levels = 1
+        while max(width, height) >> levels >= self.smallest:
+            levels += 1
+        return levels
+
+    def level_for(self, path, scale):
+        """The level to use to show the image at scale (displayed pixels per full size pixel)."""
+        level = 0
+        while level + 1 < self.level_count(path) and 1.0 / (1 << (level + 1)) >= scale:
+            level += 1
+        return level
+
+    def get_level(self, path, scale):
+        """The image to show path at scale and the scale of that image relative to the full size."""
+        level = self.level_for(path, scale)
+        image = self.get(path, level)
+        return image, image.width / self.get_size(path)[0]
+
+    def get(self, path, level=0):
+        """The image at a level, loading or generating it if it is not cached."""
+        with self.lock:
+            key = (path, level)
+            if key in self.images:
+                self.images.move_to_end(key)
+                return self.images[key]
+        image = self.__load(path, level)
+        with self.lock:
+            self.__add((path, level), image)
+        return image
+
+    def contains(self, path, level=0):
+        with self.lock:
+            return (path, level) in self.images
+
+    def discard(self, path):
+        """Forget every level of path, for when the file changed."""
+        with self.lock:
+            for key in [key for key in self.images if key[0] == path]:
+                self.used_bytes -= image_bytes(self.images.pop(key))
+            self.sizes.pop(path, None)
+
+    def __load(self, path, level):
+        from PIL import Image
+        if level == 0:
+            self.__ensure(path)
+            with Image.open(path) as image:
+                image.load()
+                # Make the preview grayscale or RGB rather than whatever mode the file is stored in.
+                if image.mode not in ('L', 'RGB'):
+                    return image.convert('L' if image.mode in ('1', 'LA', 'I', 'I;16', 'P') else 'RGB')
+                return image
+        stored = self.level_name.format(os.path.splitext(path)[0], level)
+        if os.path.exists(stored) and os.path.getmtime(stored) >= os.path.getmtime(path):
+            with Image.open(stored) as image:
+                image.load()
+                return image
+        # Halve the closest finer level we have, keeping the levels in between as we go.
+        with self.lock:
+            finer = next((finer for finer in range(level - 1, 0, -1) if (path, finer) in self.images), 0)
+        image = self.get(path, finer)
+        for current in range(finer + 1, level + 1):
+            image = image.reduce(2)
+            self.__store(path, current, image)
+            if current < level:
+                with self.lock:
+                    self.__add((path, current), image)
+        return image
+
+    def __store(self, path, level, image):
+        """Save a generated level next to the image if levels are persisted."""
+        if not self.persist:
+            return
+        try:
+            image.save(self.level_name.format(os.path.splitext(path)[0], level), compress_level=1)
+        except OSError:
+            # A directory we can't write to just means generating the level each session.
+            pass
+
+    def __add(self, key, image):
+        if key in self.images:
+            return
+        self.images[key] = image
+        self.used_bytes += image_bytes(image)
+        while self.used_bytes > self.max_bytes and len(self.images) > 1:
+            (_, evicted) = self.images.popitem(last=False)
+            self.used_bytes -= image_bytes(evicted)
+
+
+def cache_root():
+    """Where pages rasterized again are kept, in the user's cache directory."""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'hocreditor', 'pages')
+
+
+class PageRenderCache:
+    """Images of the pages of an output directory kept without them, rasterized again from the source PDF.
+
+    Give path_for() to HocrDisplayer as its missing_image and make() to ImageCache as its regenerate. Pages
+    are rasterized as they were when processed, at their resolution and mode from the manifest, on first
+    use, and kept under cache_root() by the checksum of the source, so a page is only made once however
+    often it is reviewed.
+    """
+
+    def __init__(self, directory, root=None, renderer='pypdf'):
+        self.directory = directory
+        self.manifest = Manifest(directory)
+        key = self.manifest.get_source_hash() or hashlib.sha256(os.path.realpath(directory).encode('utf-8')).hexdigest()
+        self.cache_dir = os.path.join(root or cache_root(), key[:16])
+        self.renderer_name = renderer
+        self.renderer = None
+        self.paths = {}
+        self.lock = threading.Lock()
+
+    def path_for(self, page_number):
+        """Where the image of a page is, once made."""
+        path = os.path.join(self.cache_dir, 'Page{}-{}.png'.format(page_number,
+                                                                   self.manifest.get_resolution(page_number)))
+        self.paths[path] = page_number
+        return path
+
+    def make(self, path):
+        """Rasterize the page of a path from path_for(), unless it has been already."""
+        page_number = self.paths.get(path)
+        if page_number is None:
+            return
+        # Another thread may be making the same page, and the PDF reader is not thread safe.
+        with self.lock:
+            if os.path.exists(path):
+                return
+            source = self.manifest.get_source()
+            if source is None or not os.path.exists(source):
+                raise OSError("The source PDF of {} is not known or is gone.".format(self.directory))
+            resolution = self.manifest.get_resolution(page_number)
+            if self.renderer is None:
+                settings = (self.manifest.get_page(page_number) or {}).get('settings', {})
+                self.renderer = get_renderer(self.renderer_name, source, resolution, batch=1,
+                                             mode=settings.get('mode', 'gray'))
+            os.makedirs(self.cache_dir, exist_ok=True)
+            (handle, temp_path) = tempfile.mkstemp(prefix='.page', suffix='.png', dir=self.cache_dir)
+            os.close(handle)
+            try:
+                with self.renderer.render(page_number, resolution) as img:
+                    img.save(filename=temp_path)
+                os.replace(temp_path, path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+                raise
+
+    def close(self):
+        if self.renderer is not None:
+            self.renderer.close()
+            self.renderer = None
+
+
+def image_bytes(image):
+    """Memory taken by the pixels of a PIL image."""
+    return image.width * image.height * len(image.getbands())
+
+
+def fit_size(size, max_size):
+    """Width and height of an image of size scaled down to fit in max_size by max_size."""
+    (width, height) = size
+    if width > max_size or height > max_size:
+        if height >= width:
+            return int((max_size / height) * width), max_size
+        return max_size, int((max_size / width) * height)
+    return width, height
+
+
+class PagePrefetcher:
+    """Prepares the preview of the pages around the one shown in a background thread.
+
+    When page N is shown the pages up to distance either side of it are decoded and scaled to the preview
+    size, nearest first, so moving to a neighbouring page finds its preview ready. Showing a page cancels
+    whatever is still waiting from the page shown before, so jumping far away does not wait for work on
+    pages nobody looks at any more.
+    """
+
+    def __init__(self, cache, distance=2, logger=None):
+        self.cache = cache
+        self.distance = distance
+        self.logger = logger if logger is not None else logging.getLogger('HocrEditor')
+        self.ready = {}
+        self.lock = threading.Lock()
+        self.requests = queue.Queue()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.decodes = 0
+        self.decode_time = 0.0
+        self.thread = threading.Thread(target=self.__work, name='prefetch', daemon=True)
+        self.thread.start()
+
+    def show(self, paths, index, max_size):
+        """The preview of paths[index] scaled to fit max_size, and start on its neighbours."""
+        path = paths[index]
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+            image = self.ready.get((path, max_size))
+            wanted = set(paths[max(0, index - self.distance):index + self.distance + 1])
+            for key in [key for key in self.ready if key[0] not in wanted or key[1] != max_size]:
+                del self.ready[key]
+        if image is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            image = self.__prepare(path, max_size)
+        for offset in range(1, self.distance + 1):
+            for neighbour in (index + offset, index - offset):
+                if 0 <= neighbour < len(paths):
+                    self.requests.put((generation, paths[neighbour], max_size))
+        self.logger.debug("Prefetch hit rate {:.0%} ({} of {}), decode {:.1f} ms average over {} pages".format(
+            self.hits / (self.hits + self.misses), self.hits, self.hits + self.misses,
+            self.decode_time * 1000 / self.decodes if self.decodes > 0 else 0.0, self.decodes))
+        return image
+
+    def stop(self):
+        """Stop the background thread."""
+        self.requests.put(None)
+
+    def __work(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            (generation, path, max_size) = request
+            with self.lock:
+                if generation != self.generation or (path, max_size) in self.ready:
+                    continue
+            try:
+                image = self.__prepare(path, max_size)
+            except OSError as e:
+                self.logger.debug("Could not prefetch {}: {}".format(path, e))
+                continue
+            with self.lock:
+                if generation == self.generation:
+                    self.ready[(path, max_size)] = image
+
+    def __prepare(self, path, max_size):
+        """Decode and scale one page for the preview, timing it."""
+        from PIL import Image
+        start = time.perf_counter()
+        size = fit_size(self.cache.get_size(path), max_size)
+        (level_image, level_scale) = self.cache.get_level(path, size[0] / self.cache.get_size(path)[0])
+        image = level_image.resize(size, Image.LANCZOS)
+        self.decode_time += time.perf_counter() - start
+        self.decodes += 1
+        return image
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+import os.path
+import tempfile
+import time
+
+
+class Manifest:
+    """Record of the pages of one document already processed into an output directory.
+
+    For every finished page it keeps the settings the page was produced with and a checksum of each file
+    written, so a later run can skip pages that are still valid and only redo missing or stale ones.
+    """
+
+    filename = 'manifest.json'
+    version = 1
+
+    def __init__(self, directory, save_interval=1.0):
+        self.directory = directory
+        self.path = os.path.join(directory, self.filename)
+        self.save_interval = save_interval
+        self.last_save = 0.0
+        self.dirty = False
+        self.data = {'version': self.version, 'source': None, 'pages': {}}
+        self.__load()
+
+    def __load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as fp:
+                data = json.load(fp)
+        except (OSError, ValueError):
+            # A damaged manifest only costs us reprocessing the pages.
+            return
+        if data.get('version') == self.version:
+            self.data = data
+
+    def set_source(self, the_file, source_hash=None):
+        """Set the document the pages come from, forgetting all pages if its contents changed."""
+        if source_hash is None:
+            source_hash = checksum(the_file)
+        source = self.data.get('source') or {}
+        if source.get('sha256') != source_hash:
+            self.data['pages'] = {}
+        self.data['source'] = {'path': os.path.abspath(the_file), 'sha256': source_hash}
+        self.dirty = True
+
+    def get_source(self):
+        """The path of the source document, None if not known."""
+        source = self.data.get('source') or {}
+        return source.get('path')
+
+    def get_source_hash(self):
+        """The SHA-256 of the source document, None if not known."""
+        source = self.data.get('source') or {}
+        return source.get('sha256')
+
+    def get_page(self, page_number):
+        """The record of a page, None if the page was never finished."""
+        return self.data['pages'].get(str(page_number))
+
+    def get_settings(self, page_number):
+        """The settings a page was produced with, None if the page was never finished."""
+        entry = self.get_page(page_number)
+        return entry.get('settings', {}) if entry is not None else None
+
+    def get_resolution(self, page_number, default=300):
+        """The resolution a page was rasterized at, default if the record does not say."""
+        entry = self.get_page(page_number) or {}
+        if isinstance(entry.get('resolution'), int):
+            return entry['resolution']
+        if isinstance(entry.get('settings', {}).get('resolution'), int):
+            return entry['settings']['resolution']
+        return default
+
+    def is_current(self, page_number, settings, outputs):
+        """Was the page produced with settings, and are all the outputs (file names) still as written?"""
+        entry = self.get_page(page_number)
+        if entry is None or entry.get('settings') != settings:
+            return False
+        for name in outputs:
+            recorded = entry.get('outputs', {}).get(name)
+            if recorded is None:
+                return False
+            path = os.path.join(self.directory, name)
+            if not os.path.exists(path) or os.path.getsize(path) != recorded['size'] \
+                    or checksum(path) != recorded['sha256']:
+                return False
+        return True
+
+    def record_page(self, page_number, settings, outputs, **extra):
+        """Record a finished page, outputs is describe_files() of the files written."""
+        entry = {'settings': settings, 'outputs': outputs}
+        entry.update(extra)
+        self.data['pages'][str(page_number)] = entry
+        self.dirty = True
+        if time.monotonic() - self.last_save >= self.save_interval:
+            self.save()
+
+    def update_outputs(self, page_number, outputs, **extra):
+        """Record files of a finished page written again since, keeping the rest of its record.
+
+        Does nothing for a page that was never finished.
+        """
+        entry = self.get_page(page_number)
+        if entry is None:
+            return
+        entry.setdefault('outputs', {}).update(outputs)
+        entry.update(extra)
+        self.dirty = True
+
+    def forget_page(self, page_number):
+        """Drop the record of a page so the next run processes it again."""
+        if self.data['pages'].pop(str(page_number), None) is not None:
+            self.dirty = True
+
+    def save(self):
+        """Write the manifest if anything changed, replacing the old one atomically."""
+        if not self.dirty:
+            return
+        (handle, temp_path) = tempfile.mkstemp(prefix='.manifest', dir=self.directory)
+        try:
+            with os.fdopen(handle, 'w', encoding='utf-8') as fp:
+                json.dump(self.data, fp, indent=1, sort_keys=True)
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        self.dirty = False
+        self.last_save = time.monotonic()
+
+
+def checksum(path):
+    """SHA-256 of a file as a hex string."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(1048576), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def describe_files(paths):
+    """The outputs entry for Manifest.record_page() describing the files at paths."""
+    return {os.path.basename(path): {'size': os.path.getsize(path), 'sha256': checksum(path)} for path in paths}
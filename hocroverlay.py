@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+import tkinter as tk
+
+
+class BoxOverlay:
+    """Draws the word or line boxes of a HocrPage over the page shown on a canvas.
+
+    Only the boxes inside the visible part of the page get a canvas item, and the items are kept and
+    moved on the next draw rather than deleted and created again, so the canvas holds about as many
+    items as fit on screen however dense the page is. When words would be too small to tell apart the
+    line boxes are drawn instead.
+    """
+
+    tag = 'hocr_overlay'
+
+    def __init__(self, canvas, word_colour='#2a7fff', line_colour='#ff8a00', highlight_colour='#ff1f1f',
+                 min_word_height=10):
+        self.canvas = canvas
+        self.word_colour = word_colour
+        self.line_colour = line_colour
+        self.highlight_colour = highlight_colour
+        self.min_word_height = min_word_height
+        self.page = None
+        self.items = []
+        self.highlight_items = []
+        self.shown = 0
+        self.highlights_shown = 0
+        self.highlighted = []
+        self.visible = True
+        self.word_height = 0
+
+    def set_page(self, page):
+        """Show the boxes of page, None for no boxes."""
+        self.page = page
+        self.highlighted = []
+        if page is not None and page.word_count() > 0:
+            heights = sorted(page.word_y1[word] - page.word_y0[word] for word in range(page.word_count()))
+            self.word_height = heights[len(heights) // 2]
+        else:
+            self.word_height = 0
+
+    def set_visible(self, visible):
+        self.visible = visible
+
+    def highlight(self, words):
+        """Outline the words (numbers of words of the page) in the highlight colour."""
+        self.highlighted = list(words)
+
+    def draw(self, left, top, scale, width, height):
+        """Draw the boxes in view.
+
+        left and top are the page coordinates at the canvas origin, scale is canvas pixels per page pixel
+        and width and height the size of the canvas.
+        """
+        boxes = []
+        colour = self.word_colour
+        highlights = []
+        if self.page is not None and self.visible:
+            view = (int(left), int(top), int(left + width / scale) + 1, int(top + height / scale) + 1)
+            page = self.page
+            if self.word_height * scale >= self.min_word_height:
+                boxes = [(page.word_x0[word], page.word_y0[word], page.word_x1[word], page.word_y1[word])
+                         for word in page.words_in(*view)]
+            else:
+                colour = self.line_colour
+                boxes = [page.get_line_bbox(line) for line in page.lines_in(*view)]
+        if self.page is not None:
+            page = self.page
+            highlights = [(page.word_x0[word], page.word_y0[word], page.word_x1[word], page.word_y1[word])
+                          for word in self.highlighted]
+        self.shown = self.__place(self.items, self.shown, boxes, colour, left, top, scale, 1)
+        self.highlights_shown = self.__place(self.highlight_items, self.highlights_shown, highlights,
+                                             self.highlight_colour, left, top, scale, 2)
+        self.canvas.tag_raise(self.tag)
+
+    def clear(self):
+        """Hide every box, keeping the items for the next page."""
+        self.page = None
+        self.highlighted = []
+        for item in self.items[:self.shown] + self.highlight_items[:self.highlights_shown]:
+            self.canvas.itemconfigure(item, state=tk.HIDDEN)
+        self.shown = 0
+        self.highlights_shown = 0
+
+    def forget(self):
+        """Drop the items, for when the canvas is destroyed."""
+        self.items = []
+        self.highlight_items = []
+        self.shown = 0
+        self.highlights_shown = 0
+
+    def __place(self, items, shown, boxes, colour, left, top, scale, line_width):
+        """Move the pooled items onto boxes, creating items only when the pool runs short.
+
+        shown is how many of the items are showing now, returns how many are showing after.
+        """
+        for (number, (x0, y0, x1, y1)) in enumerate(boxes):
+            coordinates = ((x0 - left) * scale, (y0 - top) * scale, (x1 - left) * scale, (y1 - top) * scale)
+            if number < len(items):
+                self.canvas.coords(items[number], *coordinates)
+                self.canvas.itemconfigure(items[number], state=tk.NORMAL, outline=colour)
+            else:
+                items.append(self.canvas.create_rectangle(*coordinates, outline=colour, width=line_width,
+                                                          tags=(self.tag, )))
+        for item in items[len(boxes):shown]:
+            self.canvas.itemconfigure(item, state=tk.HIDDEN)
+        return len(boxes)
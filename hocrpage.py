@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+import re
+from array import array
+from html.parser import HTMLParser
+
+
+class HocrPage:
+    """The lines and words of one hOCR page.
+
+    Boxes are held column-wise in arrays rather than as an object per word, word i of the page being
+    (word_x0[i], word_y0[i], word_x1[i], word_y1[i]) with its text in word_text[i] and its line in
+    word_line[i]. Line j holds words line_first[j] up to line_first[j + 1]. Which words are at a point
+    or in a rectangle is answered by a grid index built on first use.
+    """
+
+    line_classes = ('ocr_line', 'ocr_textfloat', 'ocr_header', 'ocr_caption')
+    word_classes = ('ocrx_word', )
+
+    def __init__(self):
+        self.word_x0 = array('i')
+        self.word_y0 = array('i')
+        self.word_x1 = array('i')
+        self.word_y1 = array('i')
+        self.word_confidence = array('h')
+        self.word_line = array('i')
+        self.word_text = []
+        self.line_x0 = array('i')
+        self.line_y0 = array('i')
+        self.line_x1 = array('i')
+        self.line_y1 = array('i')
+        self.line_first = array('i')
+        self.width = 0
+        self.height = 0
+        self.index = None
+
+    @classmethod
+    def load(cls, path, chunk_size=65536):
+        """Parse a hOCR file, reading it a chunk at a time rather than building a document tree."""
+        page = cls()
+        parser = HocrParser(page)
+        with open(path, 'r', encoding='utf-8') as fp:
+            for chunk in iter(lambda: fp.read(chunk_size), ''):
+                parser.feed(chunk)
+        parser.close()
+        return page
+
+    @classmethod
+    def from_string(cls, text):
+        page = cls()
+        parser = HocrParser(page)
+        parser.feed(text)
+        parser.close()
+        return page
+
+    def add_line(self, bbox):
+        """Start a new line, words added after belong to it. Returns the line number."""
+        self.line_x0.append(bbox[0])
+        self.line_y0.append(bbox[1])
+        self.line_x1.append(bbox[2])
+        self.line_y1.append(bbox[3])
+        self.line_first.append(len(self.word_text))
+        self.__grow(bbox)
+        self.index = None
+        return len(self.line_first) - 1
+
+    def add_word(self, text, bbox, confidence=0):
+        """Add a word to the last line. Returns the word number."""
+        if len(self.line_first) == 0:
+            self.add_line(bbox)
+        self.word_x0.append(bbox[0])
+        self.word_y0.append(bbox[1])
+        self.word_x1.append(bbox[2])
+        self.word_y1.append(bbox[3])
+        self.word_confidence.append(max(-1, min(int(confidence), 32767)))
+        self.word_line.append(len(self.line_first) - 1)
+        self.word_text.append(text)
+        self.__grow(bbox)
+        self.index = None
+        return len(self.word_text) - 1
+
+    def __grow(self, bbox):
+        self.width = max(self.width, bbox[2])
+        self.height = max(self.height, bbox[3])
+
+    def word_count(self):
+        return len(self.word_text)
+
+    def line_count(self):
+        return len(self.line_first)
+
+    def get_word(self, word):
+        """Word number word as a Word."""
+        return Word(word, self.word_text[word],
+                    (self.word_x0[word], self.word_y0[word], self.word_x1[word], self.word_y1[word]),
+                    self.word_confidence[word], self.word_line[word])
+
+    def get_line_bbox(self, line):
+        return self.line_x0[line], self.line_y0[line], self.line_x1[line], self.line_y1[line]
+
+    def get_line_words(self, line):
+        """The word numbers of a line."""
+        last = self.line_first[line + 1] if line + 1 < len(self.line_first) else len(self.word_text)
+        return range(self.line_first[line], last)
+
+    def get_line_text(self, line):
+        return ' '.join(self.word_text[word] for word in self.get_line_words(line))
+
+    def get_index(self):
+        if self.index is None:
+            self.index = GridIndex(self)
+        return self.index
+
+    def words_in(self, x0, y0, x1, y1):
+        """Numbers of the words whose boxes intersect the rectangle, in reading order."""
+        return self.get_index().words_in(x0, y0, x1, y1)
+
+    def words_at(self, x, y):
+        """Numbers of the words whose boxes contain the point."""
+        return self.get_index().words_in(x, y, x, y)
+
+    def lines_in(self, x0, y0, x1, y1):
+        """Numbers of the lines whose boxes intersect the rectangle."""
+        return [line for line in range(len(self.line_first))
+                if self.line_x0[line] <= x1 and self.line_x1[line] >= x0
+                and self.line_y0[line] <= y1 and self.line_y1[line] >= y0]
+
+    def replace_words(self, replacements):
+        """A new page with the words of regions replaced by other lines of words.
+
+        replacements is a list of (region, lines), region being a box (x0, y0, x1, y1) and lines a list of
+        (bbox, words) with words a list of (text, bbox, confidence). A word is in a region when the centre
+        of its box is. A region that took some of the words of one line, and was found to hold one line,
+        has its words merged into that line in x order. The new lines of any other region go after what
+        is left of the first line that lost words to it, or if it had no words before the first line below
+        it, so the reading order of the page is kept. Lines left without words are dropped.
+        """
+        regions = [region for (region, lines) in replacements]
+
+        def region_of(bbox):
+            x = (bbox[0] + bbox[2]) / 2
+            y = (bbox[1] + bbox[3]) / 2
+            for (number, region) in enumerate(regions):
+                if region[0] <= x <= region[2] and region[1] <= y <= region[3]:
+                    return number
+            return None
+
+        def line_bbox(words):
+            return (min(bbox[0] for (text, bbox, confidence) in words),
+                    min(bbox[1] for (text, bbox, confidence) in words),
+                    max(bbox[2] for (text, bbox, confidence) in words),
+                    max(bbox[3] for (text, bbox, confidence) in words))
+
+        kept = []
+        # Where the new lines of each region go in kept, and the lines each region took words from.
+        positions = {}
+        touched = {}
+        for line in range(self.line_count()):
+            words = []
+            taken = set()
+            for word in self.get_line_words(line):
+                bbox = (self.word_x0[word], self.word_y0[word], self.word_x1[word], self.word_y1[word])
+                region = region_of(bbox)
+                if region is None:
+                    words.append((self.word_text[word], bbox, self.word_confidence[word]))
+                else:
+                    taken.add(region)
+            position = len(kept)
+            if len(words) == len(self.get_line_words(line)):
+                kept.append((self.get_line_bbox(line), words))
+            elif len(words) > 0:
+                kept.append((line_bbox(words), words))
+            for region in taken:
+                touched.setdefault(region, set()).add(position if len(words) > 0 else None)
+                positions.setdefault(region, len(kept))
+        inserted = {}
+        for (number, (region, lines)) in enumerate(replacements):
+            lines = [line for line in lines if len(line[1]) > 0]
+            within = touched.get(number, set())
+            if len(within) == 1 and None not in within and len(lines) <= 1:
+                # Part of one line, the words found go in among the words left on it.
+                position = within.pop()
+                words = sorted(kept[position][1] + [word for (bbox, words) in lines for word in words],
+                               key=lambda word: (word[1][0], word[1][1]))
+                kept[position] = (line_bbox(words), words)
+                continue
+            position = positions.get(number)
+            if position is None:
+                position = next((index for (index, (bbox, words)) in enumerate(kept)
+                                 if bbox[1] >= region[1] and bbox[0] <= region[2] and bbox[2] >= region[0]),
+                                len(kept))
+            inserted.setdefault(position, []).extend(lines)
+
+        page = HocrPage()
+        for position in range(len(kept) + 1):
+            for (bbox, words) in inserted.get(position, []) + kept[position:position + 1]:
+                page.add_line(bbox)
+                for (text, word_bbox, confidence) in words:
+                    page.add_word(text, word_bbox, confidence)
+        return page
+
+
+class Word:
+    """One word of a HocrPage, made on request."""
+
+    __slots__ = ('number', 'text', 'bbox', 'confidence', 'line')
+
+    def __init__(self, number, text, bbox, confidence, line):
+        self.number = number
+        self.text = text
+        self.bbox = bbox
+        self.confidence = confidence
+        self.line = line
+
+    def __repr__(self):
+        return 'Word({}, {!r}, {}, {})'.format(self.number, self.text, self.bbox, self.confidence)
+
+
+class GridIndex:
+    """Uniform grid over a page, each cell listing the words whose boxes touch it.
+
+    Cells are a few words high, so a query looks at the words of the handful of cells it covers rather
+    than every word on the page.
+    """
+
+    def __init__(self, page, cell_size=None):
+        self.page = page
+        if cell_size is None:
+            cell_size = self.__pick_cell_size(page)
+        self.cell_size = cell_size
+        self.cells = {}
+        for word in range(page.word_count()):
+            for cell in self.__cells(page.word_x0[word], page.word_y0[word], page.word_x1[word], page.word_y1[word]):
+                words = self.cells.get(cell)
+                if words is None:
+                    words = self.cells[cell] = array('i')
+                words.append(word)
+
+    @staticmethod
+    def __pick_cell_size(page):
+        """About four times the median word height, which keeps a cell to a few words."""
+        count = page.word_count()
+        if count == 0:
+            return 64
+        heights = sorted(page.word_y1[word] - page.word_y0[word] for word in range(0, count, max(1, count // 256)))
+        return max(16, heights[len(heights) // 2] * 4)
+
+    def __cells(self, x0, y0, x1, y1):
+        size = self.cell_size
+        for cx in range(max(0, x0) // size, max(0, x1) // size + 1):
+            for cy in range(max(0, y0) // size, max(0, y1) // size + 1):
+                yield cx, cy
+
+    def words_in(self, x0, y0, x1, y1):
+        page = self.page
+        found = set()
+        for cell in self.__cells(x0, y0, x1, y1):
+            words = self.cells.get(cell)
+            if words is None:
+                continue
+            for word in words:
+                if page.word_x0[word] <= x1 and page.word_x1[word] >= x0 \
+                        and page.word_y0[word] <= y1 and page.word_y1[word] >= y0:
+                    found.add(word)
+        return sorted(found)
+
+
+class HocrParser(HTMLParser):
+    """Fills a HocrPage from hOCR markup fed to it piece by piece."""
+
+    void_elements = ('area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'source')
+    bbox_regex = re.compile(r'bbox\s+(-?\d+)\s+(-?\d+)\s+(-?\d+)\s+(-?\d+)')
+    confidence_regex = re.compile(r'x_wconf\s+(-?\d+)')
+
+    def __init__(self, page):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.page = page
+        # One entry per open element: 'line', 'word' or None.
+        self.open = []
+        self.word = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.void_elements:
+            return
+        attributes = dict(attrs)
+        classes = (attributes.get('class') or '').split()
+        kind = None
+        title = attributes.get('title') or ''
+        bbox = self.bbox_regex.search(title)
+        if bbox is not None:
+            bbox = tuple(int(value) for value in bbox.groups())
+            if any(name in HocrPage.line_classes for name in classes):
+                kind = 'line'
+                self.page.add_line(bbox)
+            elif any(name in HocrPage.word_classes for name in classes):
+                kind = 'word'
+                confidence = self.confidence_regex.search(title)
+                self.word = [bbox, int(confidence.group(1)) if confidence is not None else 0, []]
+        self.open.append(kind)
+
+    def handle_endtag(self, tag):
+        if tag in self.void_elements or len(self.open) == 0:
+            return
+        kind = self.open.pop()
+        if kind == 'word' and self.word is not None:
+            (bbox, confidence, text) = self.word
+            self.page.add_word(''.join(text).strip(), bbox, confidence)
+            self.word = None
+
+    def handle_data(self, data):
+        if self.word is not None:
+            self.word[2].append(data)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+import queue
+import threading
+import time
+
+
+class Pipeline:
+    """A chain of stages, each running in its own thread and connected by bounded queues.
+
+    Items fed into the pipeline pass through every stage in order, the output of one stage being the
+    input of the next. A full queue blocks the stage feeding it, so at most depth items wait between
+    any two stages no matter how many items there are in total.
+    """
+
+    _finished = object()
+
+    def __init__(self, logger=None):
+        self.logger = logger
+        self.stages = []
+        self.error = None
+        self.abort = threading.Event()
+
+    def add_stage(self, name, func, depth=2, drop=None):
+        """Append a stage calling func on each item, depth is the size of the queue feeding it.
+
+        drop, if given, is called instead of func for items the stage lets go of unprocessed because the
+        pipeline is stopping, to release what they hold.
+        """
+        self.stages.append(Stage(name, func, depth, drop))
+
+    def run(self, items, stop=None):
+        """Push the items through all stages, returns once every stage has finished."""
+        if len(self.stages) == 0:
+            raise PipelineException("A pipeline needs at least one stage.")
+        self.error = None
+        self.abort.clear()
+        threads = []
+        for index, stage in enumerate(self.stages):
+            following = self.stages[index + 1] if index + 1 < len(self.stages) else None
+            thread = threading.Thread(target=self.__work, args=(stage, following, stop), name=stage.name,
+                                      daemon=True)
+            thread.start()
+            threads.append(thread)
+
+        first = self.stages[0]
+        for item in items:
+            if self.abort.is_set() or (stop is not None and stop.is_set()):
+                break
+            first.put(item, self.abort)
+        first.put(self._finished)
+
+        for thread in threads:
+            thread.join()
+        if self.logger is not None:
+            for stage in self.stages:
+                self.logger.info(stage.describe())
+        if self.error is not None:
+            raise self.error
+        return True
+
+    def get_stats(self):
+        """Statistics for each stage keyed by stage name."""
+        return {stage.name: stage.get_stats() for stage in self.stages}
+
+    def __work(self, stage, following, stop=None):
+        """Thread body for one stage."""
+        while True:
+            item = stage.get()
+            if item is self._finished:
+                break
+            if self.abort.is_set() or (stop is not None and stop.is_set()):
+                # Something downstream failed or we were asked to stop, drain the queue so the stage
+                # feeding us is not blocked.
+                stage.drop(item)
+                continue
+            try:
+                result = stage.process(item)
+            except Exception as e:
+                self.error = e
+                self.abort.set()
+                continue
+            if following is not None:
+                stage.blocked_time += following.put(result, self.abort)
+        if following is not None:
+            following.put(self._finished)
+
+
+class Stage:
+    """One step of a Pipeline and the bounded queue in front of it."""
+
+    def __init__(self, name, func, depth=2, drop=None):
+        self.name = name
+        self.func = func
+        self.drop_func = drop
+        self.queue = queue.Queue(maxsize=max(1, depth))
+        self.depth = max(1, depth)
+        self.items = 0
+        self.busy_time = 0.0
+        self.idle_time = 0.0
+        self.blocked_time = 0.0
+        self.queue_samples = 0
+        self.queue_total = 0
+        self.queue_max = 0
+
+    def put(self, item, abort=None):
+        """Queue an item for this stage, blocking while the queue is full. Returns the seconds spent waiting."""
+        start = time.perf_counter()
+        while True:
+            try:
+                self.queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                if abort is not None and abort.is_set():
+                    return time.perf_counter() - start
+        waited = time.perf_counter() - start
+        size = self.queue.qsize()
+        self.queue_samples += 1
+        self.queue_total += size
+        self.queue_max = max(self.queue_max, size)
+        return waited
+
+    def get(self):
+        """Take the next item, blocking until there is one."""
+        start = time.perf_counter()
+        item = self.queue.get()
+        self.idle_time += time.perf_counter() - start
+        return item
+
+    def drop(self, item):
+        """Let go of an item without processing it."""
+        if self.drop_func is not None:
+            self.drop_func(item)
+
+    def process(self, item):
+        """Run the stage function on an item, timing it."""
+        start = time.perf_counter()
+        try:
+            return self.func(item)
+        finally:
+            self.busy_time += time.perf_counter() - start
+            self.items += 1
+
+    def get_stats(self):
+        return {
+            'items': self.items,
+            'busy_seconds': self.busy_time,
+            'idle_seconds': self.idle_time,
+            'blocked_seconds': self.blocked_time,
+            'queue_depth': self.depth,
+            'queue_max': self.queue_max,
+            'queue_average': self.queue_total / self.queue_samples if self.queue_samples > 0 else 0.0,
+        }
+
+    def describe(self):
+        stats = self.get_stats()
+        return "Stage {}: {} items, busy {:.2f}s, idle {:.2f}s, blocked {:.2f}s, queue max {}/{} average {:.2f}".format(
+            self.name, stats['items'], stats['busy_seconds'], stats['idle_seconds'], stats['blocked_seconds'],
+            stats['queue_max'], stats['queue_depth'], stats['queue_average'])
+
+
+class PipelineException(Exception):
+
+    def __init__(self, *args, **kwargs):
+        Exception.__init__(self, *args, **kwargs)
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+import io
+import math
+
+modes = ('gray', 'bilevel')
+# How page images can be kept, by the file extension they are saved with, None for not kept.
+image_formats = {'png': '.png', 'png-fast': '.png', 'tiff-g4': '.tif', 'webp': '.webp', 'none': None}
+image_extensions = ('.png', '.tif', '.webp')
+
+
+class Renderer:
+    """Rasterizes pages of one PDF file into grayscale or bilevel PNG Wand images.
+
+    batch is how many consecutive pages a renderer may rasterize in one go, renderers that work a page
+    at a time ignore it. A batch stops short of pages left out by set_pages(). With adaptive each page
+    gets the resolution choose_resolution() picks for it, up to max_resolution, resolution being used
+    for pages that give nothing to go on.
+    """
+
+    name = None
+    pages = None
+
+    def __init__(self, the_file, resolution=300, pdf_file=None, batch=1, mode='gray', adaptive=False,
+                 max_resolution=400):
+        if mode not in modes:
+            raise RendererException("Mode {} not one of available ({})".format(mode, ', '.join(modes)))
+        self.the_file = the_file
+        self.resolution = resolution
+        self.pdf_file = pdf_file
+        self.batch = max(1, batch)
+        self.mode = mode
+        self.adaptive = adaptive
+        # Pages already looked at by resolution_for(), picking a resolution parses the page.
+        self.resolutions = {}
+        self.max_resolution = max_resolution
+
+    def get_pdf_file(self):
+        """The PyPDF2 reader for the file, opened on first use."""
+        if self.pdf_file is None:
+            import PyPDF2
+            self.pdf_file = PyPDF2.PdfFileReader(self.the_file)
+        return self.pdf_file
+
+    def get_page_count(self):
+        return self.get_pdf_file().getNumPages()
+
+    def set_pages(self, pages):
+        """The pages that will be asked for, None for any, so a batch does not rasterize pages nobody wants."""
+        self.pages = set(pages) if pages is not None else None
+
+    def resolution_for(self, page_number):
+        """The resolution page page_number should be rendered at."""
+        if not self.adaptive:
+            return self.resolution
+        if page_number not in self.resolutions:
+            self.resolutions[page_number] = choose_resolution(self.get_pdf_file().getPage(page_number),
+                                                              self.resolution, self.max_resolution)
+        return self.resolutions[page_number]
+
+    def render(self, page_number, resolution=None):
+        """Return page page_number (counting from 0) as a Wand image, by default at the renderer's resolution."""
+        raise NotImplementedError()
+
+    def read_options(self, resolution):
+        """Options for reading a PDF into a Wand image, asking for gray pixels as it is read rather than after."""
+        return {'resolution': resolution or self.resolution, 'colorspace': 'gray', 'depth': 8}
+
+    def finish_image(self, img):
+        """Make a freshly read page the PNG of the renderer's mode."""
+        img.format = 'png'
+        img.type = 'bilevel' if self.mode == 'bilevel' else 'grayscale'
+        return img
+
+    def close(self):
+        """Release anything held open between pages."""
+        pass
+
+
+class PyPdfRenderer(Renderer):
+    """Copies each page into a single page PDF with PyPDF2 and hands that to ImageMagick."""
+
+    name = 'pypdf'
+
+    def render(self, page_number, resolution=None):
+        import PyPDF2
+        import wand.image
+        dst_pdf = PyPDF2.PdfFileWriter()
+        dst_pdf.addPage(self.get_pdf_file().getPage(page_number))
+
+        with io.BytesIO() as pdf_bytes:
+            dst_pdf.write(pdf_bytes)
+            pdf_bytes.seek(0)
+            return self.finish_image(wand.image.Image(file=pdf_bytes, **self.read_options(resolution)))
+
+
+class WandRenderer(Renderer):
+    """Has Ghostscript rasterize pages straight from the source PDF by index.
+
+    The source is never rewritten, so shared fonts and images are parsed once per Ghostscript run
+    rather than copied into every page. Consecutive pages are rendered batch at a time, a batch of 1
+    renders exactly the requested page which suits workers that are handed scattered pages. With
+    adaptive resolution a batch ends before the first page that wants another resolution, and a page
+    of the batch asked for at another resolution is rendered on its own, leaving the batch as it is.
+    """
+
+    name = 'wand'
+
+    def __init__(self, the_file, resolution=300, pdf_file=None, batch=8, **options):
+        Renderer.__init__(self, the_file, resolution, pdf_file, batch, **options)
+        self.first = None
+        self.frames = []
+        self.frames_resolution = None
+
+    def render(self, page_number, resolution=None):
+        resolution = resolution or self.resolution
+        if self.first is None or not (self.first <= page_number < self.first + len(self.frames)) \
+                or self.frames[page_number - self.first] is None:
+            self.__load(page_number, resolution)
+        elif self.frames_resolution != resolution:
+            frames = self.__render(page_number, page_number, resolution)
+            if len(frames) == 0:
+                raise RendererException("Page {} of {} could not be rendered.".format(page_number, self.the_file))
+            return frames[0]
+        if page_number - self.first >= len(self.frames):
+            raise RendererException("Page {} of {} could not be rendered.".format(page_number, self.the_file))
+        frame = self.frames[page_number - self.first]
+        # Each page is only asked for once, don't keep it alive once handed out.
+        self.frames[page_number - self.first] = None
+        return frame
+
+    def __load(self, page_number, resolution):
+        """Render page_number and up to batch - 1 pages after it at the same resolution in one Ghostscript run."""
+        self.close()
+        last = page_number + self.batch - 1
+        if last > page_number:
+            last = min(last, self.get_page_count() - 1)
+        if self.pages is not None:
+            # Only the run of wanted pages, a resumed document is often missing a page here and there.
+            last = next((number - 1 for number in range(page_number + 1, last + 1) if number not in self.pages), last)
+        if self.adaptive:
+            last = next((number - 1 for number in range(page_number + 1, last + 1)
+                         if self.resolution_for(number) != resolution), last)
+        self.frames = self.__render(page_number, last, resolution)
+        self.first = page_number
+        self.frames_resolution = resolution
+
+    def __render(self, first, last, resolution):
+        """Pages first to last as a list of Wand images."""
+        import wand.image
+        page_range = str(first) if last == first else '{}-{}'.format(first, last)
+        with wand.image.Image(filename='pdf:{}[{}]'.format(self.the_file, page_range),
+                              **self.read_options(resolution)) as pages:
+            return [self.finish_image(wand.image.Image(image=frame)) for frame in pages.sequence]
+
+    def close(self):
+        for frame in self.frames:
+            if frame is not None:
+                frame.close()
+        self.frames = []
+        self.first = None
+
+
+renderers = {
+    PyPdfRenderer.name: PyPdfRenderer,
+    WandRenderer.name: WandRenderer,
+}
+
+
+def get_renderer(name, the_file, resolution=300, pdf_file=None, batch=None, **options):
+    """Create the renderer called name for the_file, batch None uses the renderer's default.
+
+    options are mode, adaptive and max_resolution, as for Renderer.
+    """
+    if name not in renderers:
+        raise RendererException("Renderer {} not one of available ({})".format(name, ', '.join(renderers)))
+    if batch is None:
+        return renderers[name](the_file, resolution, pdf_file, **options)
+    return renderers[name](the_file, resolution, pdf_file, batch, **options)
+
+
+def save_page_image(img, path_base, image_format='png'):
+    """Save a rendered page as path_base with the extension of image_format, returns the path.
+
+    png is ImageMagick's default compression, png-fast the fastest zlib level, tiff-g4 black and white
+    with CCITT group 4 compression (the smallest for text, but thresholds gray) and webp lossless WebP.
+    The image is changed to save it, so save it after its pixels have been handed to the OCR tool.
+    """
+    if image_formats.get(image_format) is None:
+        raise RendererException("Image format {} not one of available ({})".format(
+            image_format, ', '.join(name for name in image_formats if image_formats[name] is not None)))
+    if image_format == 'png-fast':
+        # The tens are the zlib level, the units 5 is adaptive row filtering.
+        img.compression_quality = 15
+    elif image_format == 'tiff-g4':
+        img.format = 'tiff'
+        img.type = 'bilevel'
+        img.compression = 'group4'
+    elif image_format == 'webp':
+        img.format = 'webp'
+        img.options['webp:lossless'] = 'true'
+    path = path_base + image_formats[image_format]
+    img.save(filename=path)
+    return path
+
+
+# Pixels per em of the smallest common text that OCR reads reliably, 10pt text at 300 DPI.
+text_pixels = 42
+min_resolution = 150
+# Largest page image adaptive resolution will make, about a letter page at 600 DPI.
+max_pixels = 36000000
+
+
+def multiply(first, second):
+    """Product of two PDF matrices (a, b, c, d, e, f), first applied first."""
+    (a, b, c, d, e, f) = first
+    (a2, b2, c2, d2, e2, f2) = second
+    return (a * a2 + b * c2, a * b2 + b * d2, c * a2 + d * c2, c * b2 + d * d2,
+            e * a2 + f * c2 + e2, e * b2 + f * d2 + f2)
+
+
+def scale_of(matrix):
+    """How much a matrix scales lengths, on average over its two axes."""
+    (a, b, c, d, e, f) = matrix
+    return math.sqrt(abs(a * d - b * c))
+
+
+def analyse_page(page):
+    """The sizes in points of the text shown on a PyPDF2 page, one per text showing operator, and the
+    resolutions in DPI its images are drawn at."""
+    from PyPDF2.pdf import ContentStream
+    contents = page.getContents()
+    if contents is None:
+        return [], []
+    resources = page.get('/Resources')
+    resources = resources.getObject() if resources is not None else {}
+    xobjects = resources.get('/XObject')
+    xobjects = xobjects.getObject() if xobjects is not None else {}
+    sizes = []
+    resolutions = []
+    identity = (1, 0, 0, 1, 0, 0)
+    ctm = identity
+    stack = []
+    text_matrix = identity
+    font_size = 0
+    for (operands, operator) in ContentStream(contents, page.pdf).operations:
+        if operator == b'q':
+            stack.append(ctm)
+        elif operator == b'Q':
+            ctm = stack.pop() if len(stack) > 0 else identity
+        elif operator == b'cm' and len(operands) == 6:
+            ctm = multiply(tuple(float(value) for value in operands), ctm)
+        elif operator == b'BT':
+            text_matrix = identity
+        elif operator == b'Tm' and len(operands) == 6:
+            text_matrix = tuple(float(value) for value in operands)
+        elif operator == b'Tf' and len(operands) == 2:
+            font_size = abs(float(operands[1]))
+        elif operator in (b'Tj', b'TJ', b"'", b'"'):
+            size = font_size * scale_of(text_matrix) * scale_of(ctm)
+            if size > 0:
+                sizes.append(size)
+        elif operator == b'Do' and len(operands) == 1:
+            xobject = xobjects.get(operands[0])
+            xobject = xobject.getObject() if xobject is not None else None
+            if xobject is not None and xobject.get('/Subtype') == '/Image':
+                # The image is drawn into the unit square, so the CTM scale is its size on the page.
+                width = math.hypot(ctm[0], ctm[1])
+                if width > 0:
+                    resolutions.append(float(xobject.get('/Width', 0)) * 72 / width)
+    return sizes, resolutions
+
+
+def choose_resolution(page, default=300, maximum=400):
+    """The resolution to rasterize a PyPDF2 page at for OCR, between min_resolution and maximum.
+
+    Text gets enough resolution for its smaller sizes to reach text_pixels per em, and scanned images
+    get their own resolution, as rendering above it only adds pixels. Pages with neither use default.
+    The page is also kept under max_pixels.
+    """
+    try:
+        (sizes, resolutions) = analyse_page(page)
+    except Exception:
+        # Anything PyPDF2 can't make sense of is rendered as if adaptive resolution was off.
+        return default
+    candidates = []
+    if len(sizes) > 0:
+        sizes.sort()
+        # Ignore the odd footnote marker, go by the text at the small end of what is common on the page.
+        candidates.append(text_pixels * 72 / sizes[len(sizes) // 10])
+    candidates.extend(resolutions)
+    resolution = max(candidates) if len(candidates) > 0 else default
+    width = float(page.mediaBox.getWidth()) / 72
+    height = float(page.mediaBox.getHeight()) / 72
+    if width > 0 and height > 0:
+        maximum = min(maximum, math.sqrt(max_pixels / (width * height)))
+    resolution = max(min_resolution, min(resolution, maximum))
+    # Steps of 25 DPI, so pages of a document mostly share resolutions.
+    return int(max(25, min(math.ceil(resolution / 25) * 25, maximum // 25 * 25)))
+
+
+def ink_coverage(image, margin=0.05, contrast=32):
+    """The fraction of a page image (a PIL 'L' image) with something on it, for telling blank pages apart.
+
+    The page is shrunk to a thumbnail of about 400 pixels by averaging blocks of pixels, which washes out
+    specks of scanner noise, and blocks at least contrast darker than the paper are counted. The margins,
+    where scans pick up the edges of the sheet, are left out.
+    """
+    factor = max(1, max(image.size) // 400)
+    thumbnail = image.reduce(factor) if factor > 1 else image
+    (width, height) = thumbnail.size
+    thumbnail = thumbnail.crop((int(width * margin), int(height * margin),
+                                width - int(width * margin), height - int(height * margin)))
+    histogram = thumbnail.histogram()
+    total = sum(histogram)
+    if total == 0:
+        return 0.0
+    paper = histogram.index(max(histogram))
+    return sum(histogram[:max(0, paper - contrast)]) / total
+
+
+class RendererException(Exception):
+
+    def __init__(self, *args, **kwargs):
+        Exception.__init__(self, *args, **kwargs)
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+
+import sys
+
+if sys.version_info[0] != 3:
+    print("This script requires Python version 3 or greater")
+    sys.exit(1)
+
+import argparse
+import bisect
+import heapq
+import itertools
+import json
+import mmap
+import os
+import os.path
+import re
+import struct
+import tempfile
+from array import array
+sys.path.append(os.path.dirname(__file__))
+from hocrpage import HocrPage
+
+
+class SearchIndex:
+    """Inverted index of the words of the hOCR pages in a directory.
+
+    Each term (a word, case folded and without surrounding punctuation) maps to where it occurs: page,
+    word number on the page, word box and confidence. The index lives in two files in the directory:
+
+    search.idx, the compacted index: sorted terms followed by fixed size posting records. The terms are
+    loaded and searched with a binary search, postings are read from a memory map only for the terms
+    that match.
+
+    search.log, pages added since the last compaction, one JSON line per page. Appending a page costs
+    the size of the page, not of the index. A page in the log replaces the same page in search.idx.
+
+    compact() folds the log into search.idx.
+    """
+
+    index_filename = 'search.idx'
+    log_filename = 'search.log'
+    magic = b'HOCRIDX1'
+    header = struct.Struct('<8sIIQ')
+    term_header = struct.Struct('<HI')
+    posting = struct.Struct('<iiiiiih')
+    term_regex = re.compile(r'^\W+|\W+$')
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_path = os.path.join(directory, self.index_filename)
+        self.log_path = os.path.join(directory, self.log_filename)
+        self.pages = set()
+        self.terms = []
+        self.starts = array('q')
+        self.file = None
+        self.map = None
+        self.log_pages = {}
+        self.log_terms = {}
+        self.log_size = 0
+        self.__load()
+
+    @classmethod
+    def normalise(cls, text):
+        """The term a word is indexed under, empty if it is nothing but punctuation."""
+        return cls.term_regex.sub('', text).casefold()
+
+    def __load(self):
+        self.close()
+        self.pages = set()
+        self.terms = []
+        self.starts = array('q', [0])
+        if os.path.exists(self.index_path) and os.path.getsize(self.index_path) > 0:
+            self.file = open(self.index_path, 'rb')
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            (magic, page_count, term_count, postings_count) = self.header.unpack_from(self.map, 0)
+            if magic != self.magic:
+                raise SearchIndexException("{} is not a search index.".format(self.index_path))
+            offset = self.header.size
+            self.pages = set(array('i', self.map[offset:offset + 4 * page_count]))
+            offset += 4 * page_count
+            for _ in range(term_count):
+                (length, count) = self.term_header.unpack_from(self.map, offset)
+                offset += self.term_header.size
+                self.terms.append(self.map[offset:offset + length].decode('utf-8'))
+                offset += length
+                self.starts.append(self.starts[-1] + count)
+            self.postings_offset = offset
+        self.log_pages = {}
+        self.log_terms = {}
+        self.log_size = 0
+        self.__read_log()
+
+    def __read_log(self):
+        """Read log entries written since we last looked, by us or another process."""
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, 'r', encoding='utf-8') as fp:
+            fp.seek(self.log_size)
+            while True:
+                line = fp.readline()
+                if not line.endswith('\n'):
+                    # Nothing more, or a line still being written.
+                    break
+                self.log_size = fp.tell()
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                self.__apply(entry['page'], entry['words'])
+
+    def __apply(self, page_number, words):
+        """Make words (lists of text, word number, x0, y0, x1, y1, confidence) the words of a page."""
+        old = self.log_pages.get(page_number)
+        if old is not None:
+            for word in old:
+                postings = self.log_terms.get(self.normalise(word[0]))
+                if postings is not None:
+                    postings.discard((page_number, ) + tuple(word[1:]))
+        self.log_pages[page_number] = words
+        for word in words:
+            term = self.normalise(word[0])
+            if term != '':
+                self.log_terms.setdefault(term, set()).add((page_number, ) + tuple(word[1:]))
+
+    def has_page(self, page_number):
+        return page_number in self.log_pages or page_number in self.pages
+
+    def add_page(self, page_number, page):
+        """Index the words of a HocrPage as page page_number, replacing what was indexed for it before."""
+        words = [[page.word_text[word], word, page.word_x0[word], page.word_y0[word], page.word_x1[word],
+                  page.word_y1[word], page.word_confidence[word]] for word in range(page.word_count())]
+        self.__read_log()
+        with open(self.log_path, 'a', encoding='utf-8') as fp:
+            fp.write(json.dumps({'page': page_number, 'words': words}, ensure_ascii=False) + '\n')
+            self.log_size = fp.tell()
+        self.__apply(page_number, words)
+
+    def add_file(self, page_number, hocr_file):
+        self.add_page(page_number, HocrPage.load(hocr_file))
+
+    def search(self, query, prefix=True, limit=1000):
+        """Occurrences of query (any case), of any term starting with it if prefix, in page order.
+
+        Returns up to limit Hits. The postings of each term are in page order, so they are merged and
+        only read until there are limit hits, however many pages the terms are on.
+        """
+        query = self.normalise(query)
+        if query == '':
+            return []
+        self.__read_log()
+        streams = []
+        position = bisect.bisect_left(self.terms, query)
+        while position < len(self.terms) and (self.terms[position] == query or
+                                              (prefix and self.terms[position].startswith(query))):
+            streams.append(self.__term_hits(position))
+            position += 1
+        for (term, postings) in self.log_terms.items():
+            if term == query or (prefix and term.startswith(query)):
+                streams.append([Hit(term, *record) for record in sorted(postings)])
+        return list(itertools.islice(heapq.merge(*streams, key=lambda hit: (hit.page, hit.word)), limit))
+
+    def __term_hits(self, position):
+        term = self.terms[position]
+        for record in self.__postings(position):
+            # Pages in the log have been indexed again since the compacted index was written.
+            if record[0] not in self.log_pages:
+                yield Hit(term, *record)
+
+    def __postings(self, position):
+        start = self.postings_offset + self.starts[position] * self.posting.size
+        for number in range(self.starts[position + 1] - self.starts[position]):
+            yield self.posting.unpack_from(self.map, start + number * self.posting.size)
+
+    def compact(self):
+        """Fold the log into search.idx, written to a temporary file and moved into place."""
+        self.__read_log()
+        if len(self.log_pages) == 0:
+            return
+        merged = {}
+        for (position, term) in enumerate(self.terms):
+            for record in self.__postings(position):
+                if record[0] not in self.log_pages:
+                    merged.setdefault(term, []).append(record)
+        for (term, postings) in self.log_terms.items():
+            merged.setdefault(term, []).extend(postings)
+        pages = sorted(self.pages | set(self.log_pages))
+        terms = sorted(term for term in merged if len(merged[term]) > 0)
+
+        (handle, temp_path) = tempfile.mkstemp(prefix='.search', dir=self.directory)
+        try:
+            with os.fdopen(handle, 'wb') as fp:
+                fp.write(self.header.pack(self.magic, len(pages), len(terms), sum(len(merged[term]) for term in terms)))
+                fp.write(array('i', pages).tobytes())
+                for term in terms:
+                    encoded = term.encode('utf-8')
+                    fp.write(self.term_header.pack(len(encoded), len(merged[term])))
+                    fp.write(encoded)
+                for term in terms:
+                    for record in sorted(merged[term]):
+                        fp.write(self.posting.pack(*record))
+                fp.flush()
+                os.fsync(fp.fileno())
+            self.close()
+            os.replace(temp_path, self.index_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        os.unlink(self.log_path)
+        self.__load()
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class Hit:
+    """One occurrence of a search term."""
+
+    __slots__ = ('term', 'page', 'word', 'bbox', 'confidence')
+
+    def __init__(self, term, page, word, x0, y0, x1, y1, confidence):
+        self.term = term
+        self.page = page
+        self.word = word
+        self.bbox = (x0, y0, x1, y1)
+        self.confidence = confidence
+
+    def __repr__(self):
+        return 'Hit({!r}, page {}, word {}, {})'.format(self.term, self.page, self.word, self.bbox)
+
+
+def index_directory(directory, index=None):
+    """Add the PageN.hocr files of a directory that are not yet in its index, returns the index."""
+    from hocrdisplayer import HocrDisplayer
+    if index is None:
+        index = SearchIndex(directory)
+    displayer = HocrDisplayer(directory)
+    for position in range(displayer.get_page_count()):
+        page_number = displayer.get_page_number(position)
+        if not index.has_page(page_number):
+            index.add_file(page_number, os.path.join(directory, displayer.get_files(position)['ocr_file']))
+    index.compact()
+    return index
+
+
+class SearchIndexException(Exception):
+
+    def __init__(self, *args, **kwargs):
+        Exception.__init__(self, *args, **kwargs)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Search the HOCR pages of an output directory')
+    parser.add_argument('--exact', action='store_true', help='Match whole words only, not prefixes')
+    parser.add_argument('--limit', type=int, default=100, help='Most hits to show')
+    parser.add_argument('directory', help='Directory of PageN.hocr files')
+    parser.add_argument('query', nargs='?', default=None, help='Word to look for, leave out to only build the index')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        parser.error('Directory {} not found'.format(args.directory))
+    search_index = index_directory(args.directory)
+    if args.query is not None:
+        for hit in search_index.search(args.query, prefix=not args.exact, limit=args.limit):
+            print('Page {}\t{}\t{}\t{}'.format(hit.page + 1, hit.term, ' '.join(str(value) for value in hit.bbox),
+                                               hit.confidence))
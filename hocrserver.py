@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+
+import sys
+
+if sys.version_info[0] != 3:
+    print("This script requires Python version 3 or greater")
+    sys.exit(1)
+
+import argparse
+import heapq
+import itertools
+import json
+import os
+import os.path
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.append(os.path.dirname(__file__))
+from hocr import Hocr, HocrException
+from hocrevents import ProgressStats
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+
+class Job:
+    """One file submitted to the server and its progress.
+
+    A job is handed to Hocr.run_batch() as its pipe, so the progress Hocr sends lands in the job.
+    """
+
+    queued = 'queued'
+    running = 'running'
+    done = 'done'
+    failed = 'failed'
+    cancelled = 'cancelled'
+
+    def __init__(self, job_id, the_file, output_directory, language=None, priority=0):
+        self.job_id = job_id
+        self.the_file = the_file
+        self.output_directory = output_directory
+        self.language = language
+        self.priority = priority
+        self.status = self.queued
+        self.progress = [0, 0]
+        self.stats = ProgressStats()
+        self.result = None
+        self.error = None
+        self.stop = threading.Event()
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    def send(self, message):
+        """Receive a progress event from Hocr, the same way a multiprocessing Pipe would."""
+        self.progress = [message['done'], message['total']]
+        self.stats.send(message)
+
+    def close(self):
+        pass
+
+    def cancel(self):
+        """Stop the job, a queued job will not start and a running one stops after the pages in hand."""
+        self.stop.set()
+        if self.status == self.queued:
+            self.status = self.cancelled
+            self.finished = time.time()
+
+    def get_status(self):
+        """The job as something that can be written out as JSON."""
+        return {
+            'id': self.job_id,
+            'file': self.the_file,
+            'output_directory': self.output_directory,
+            'language': self.language,
+            'priority': self.priority,
+            'status': self.status,
+            'progress': self.progress,
+            'stats': self.stats.get_stats(),
+            'error': self.error,
+            'result': self.result,
+            'submitted': self.submitted,
+            'started': self.started,
+            'finished': self.finished,
+        }
+
+
+class JobQueue:
+    """Jobs waiting to run, highest priority first and in order of submission within a priority.
+
+    Finished jobs are kept for their status until they are max_age seconds old, and only the last
+    max_finished of them, so a server that runs for months does not hold on to every job it ever ran.
+    """
+
+    def __init__(self, max_finished=1000, max_age=24 * 3600):
+        self.heap = []
+        self.jobs = {}
+        self.counter = itertools.count(1)
+        self.condition = threading.Condition()
+        self.closed = False
+        self.max_finished = max_finished
+        self.max_age = max_age
+
+    def submit(self, the_file, output_directory, language=None, priority=0):
+        with self.condition:
+            self.__expire()
+            job = Job(str(next(self.counter)), the_file, output_directory, language, priority)
+            self.jobs[job.job_id] = job
+            heapq.heappush(self.heap, (-priority, int(job.job_id), job))
+            self.condition.notify()
+            return job
+
+    def next(self):
+        """Block until there is a job to run, None once the queue is closed."""
+        with self.condition:
+            while not self.closed:
+                while len(self.heap) > 0:
+                    (_, _, job) = heapq.heappop(self.heap)
+                    if job.status == Job.queued:
+                        return job
+                self.condition.wait()
+            return None
+
+    def __expire(self):
+        """Forget finished jobs that are too old or too many, call holding the condition."""
+        finished = sorted((job for job in self.jobs.values() if job.finished is not None),
+                          key=lambda job: job.finished)
+        too_old = time.time() - self.max_age
+        for (number, job) in enumerate(finished):
+            if job.finished < too_old or number < len(finished) - self.max_finished:
+                del self.jobs[job.job_id]
+        # Cancelled jobs are otherwise only dropped from the heap when they come up.
+        self.heap = [entry for entry in self.heap if entry[2].status == Job.queued]
+        heapq.heapify(self.heap)
+
+    def get(self, job_id):
+        with self.condition:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.condition:
+            self.__expire()
+            return list(self.jobs.values())
+
+    def waiting(self):
+        with self.condition:
+            return sum(1 for (_, _, job) in self.heap if job.status == Job.queued)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class HocrServer(ThreadingHTTPServer):
+    """Local HTTP server that queues OCR jobs for one Hocr with warm workers.
+
+    Jobs run one at a time, each getting every worker, so clients sharing the server never ask for more
+    processes than the machine has cores. The OCR tool is found and the workers started once, when the
+    server starts, instead of for every job.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, hocr, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        ThreadingHTTPServer.__init__(self, (host, port), HocrRequestHandler)
+        self.hocr = hocr
+        # Jobs run with the language they ask for change hocr's, the others get the one it started with.
+        self.language = hocr.get_language()
+        self.queue = JobQueue()
+        self.current = None
+        self.runner = threading.Thread(target=self.__run_jobs, name='jobs', daemon=True)
+
+    def serve_forever(self, poll_interval=0.5):
+        self.hocr.start_workers()
+        self.runner.start()
+        try:
+            ThreadingHTTPServer.serve_forever(self, poll_interval)
+        finally:
+            self.queue.close()
+            if self.current is not None:
+                self.current.stop.set()
+            self.runner.join()
+            self.hocr.stop_workers()
+
+    def __run_jobs(self):
+        while True:
+            job = self.queue.next()
+            if job is None:
+                return
+            self.current = job
+            job.status = Job.running
+            job.started = time.time()
+            try:
+                documents = self.hocr.run_batch([job.the_file], pipe=job, stop=job.stop,
+                                                language=job.language or self.language,
+                                                output_directory=job.output_directory)
+                document = documents[0] if len(documents) > 0 else None
+                job.result = document.get_result() if document is not None else None
+                if document is None:
+                    job.status = Job.cancelled
+                elif document.exception is not None:
+                    job.status = Job.failed
+                    job.error = str(document.exception)
+                elif document.stopped:
+                    job.status = Job.cancelled
+                else:
+                    job.status = Job.done
+            except Exception as e:
+                self.hocr.logger.exception("Job {} failed".format(job.job_id))
+                job.status = Job.failed
+                job.error = str(e)
+            job.finished = time.time()
+            self.current = None
+
+    def submit(self, request):
+        """Validate a job request and queue it."""
+        if not isinstance(request, dict):
+            raise HocrException("A job must be a JSON object.")
+        the_file = request.get('file')
+        output_directory = request.get('output_directory')
+        language = request.get('language')
+        if not isinstance(the_file, str) or not os.path.isfile(the_file):
+            raise HocrException("File {} not found".format(the_file))
+        if not isinstance(output_directory, str) or not os.path.isdir(output_directory) \
+                or not os.access(output_directory, os.W_OK):
+            raise HocrException("Directory {} does not exist or is not writable.".format(output_directory))
+        if language is not None and not isinstance(language, str):
+            raise HocrException("Language {} is not a language name.".format(language))
+        try:
+            priority = int(request.get('priority', 0))
+        except (TypeError, ValueError):
+            raise HocrException("Priority {} is not a number.".format(request.get('priority')))
+        if language is not None and language.lower() not in [item.lower() for item in self.hocr.get_languages()]:
+            raise HocrException("Language {} not one of available ({})".format(
+                language, ', '.join(self.hocr.get_languages())))
+        return self.queue.submit(os.path.realpath(the_file), os.path.realpath(output_directory), language, priority)
+
+    def get_status(self):
+        return {
+            'workers': self.hocr.get_workers(),
+            'languages': self.hocr.get_languages(),
+            'waiting': self.queue.waiting(),
+            'running': self.current.job_id if self.current is not None else None,
+        }
+
+
+class HocrRequestHandler(BaseHTTPRequestHandler):
+    """JSON API of HocrServer.
+
+    GET /status, GET /jobs, POST /jobs, GET /jobs/<id> and DELETE /jobs/<id> to cancel. POST bodies must
+    be sent as application/json, which a web page can only do after a CORS preflight the server does not
+    answer, so pages open in the user's browser can't queue jobs.
+    """
+
+    def do_GET(self):
+        parts = self.__path_parts()
+        if parts == ['status']:
+            self.__reply(200, self.server.get_status())
+        elif parts == ['jobs']:
+            self.__reply(200, [job.get_status() for job in self.server.queue.list()])
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            job = self.server.queue.get(parts[1])
+            if job is None:
+                self.__reply(404, {'error': 'No job {}'.format(parts[1])})
+            else:
+                self.__reply(200, job.get_status())
+        else:
+            self.__reply(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        if self.__path_parts() != ['jobs']:
+            self.__reply(404, {'error': 'Not found'})
+            return
+        if self.headers.get_content_type() != 'application/json':
+            self.__reply(415, {'error': 'Jobs must be sent as application/json'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+            job = self.server.submit(request)
+        except (ValueError, HocrException) as e:
+            self.__reply(400, {'error': str(e)})
+            return
+        self.__reply(201, job.get_status())
+
+    def do_DELETE(self):
+        parts = self.__path_parts()
+        job = self.server.queue.get(parts[1]) if len(parts) == 2 and parts[0] == 'jobs' else None
+        if job is None:
+            self.__reply(404, {'error': 'Not found'})
+            return
+        job.cancel()
+        self.__reply(200, job.get_status())
+
+    def log_message(self, format, *args):
+        self.server.hocr.logger.info("%s - %s", self.address_string(), format % args)
+
+    def __path_parts(self):
+        return [part for part in self.path.split('?')[0].split('/') if part != '']
+
+    def __reply(self, code, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class HocrClient:
+    """Talks to a HocrServer, for scripts and the editor."""
+
+    def __init__(self, url='http://{}:{}'.format(DEFAULT_HOST, DEFAULT_PORT), timeout=None):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def submit(self, the_file, output_directory, language=None, priority=0):
+        """Queue a file, returns the job status."""
+        return self.__request('POST', '/jobs', {'file': os.path.realpath(the_file),
+                                                'output_directory': os.path.realpath(output_directory),
+                                                'language': language, 'priority': priority})
+
+    def job(self, job_id):
+        return self.__request('GET', '/jobs/{}'.format(job_id))
+
+    def jobs(self):
+        return self.__request('GET', '/jobs')
+
+    def cancel(self, job_id):
+        return self.__request('DELETE', '/jobs/{}'.format(job_id))
+
+    def status(self):
+        return self.__request('GET', '/status')
+
+    def wait(self, job_id, interval=1.0):
+        """Poll a job until it is no longer queued or running, returns its final status."""
+        while True:
+            job = self.job(job_id)
+            if job['status'] not in (Job.queued, Job.running):
+                return job
+            time.sleep(interval)
+
+    def __request(self, method, path, body=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        request = urllib.request.Request(self.url + path, data=data, method=method,
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read().decode('utf-8')).get('error')
+            except ValueError:
+                message = e.reason
+            raise HocrException(message)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Local HOCR job server and its client')
+    parser.add_argument('--url', default='http://{}:{}'.format(DEFAULT_HOST, DEFAULT_PORT),
+                        help='Server to talk to (client commands)')
+    commands = parser.add_subparsers(dest='command')
+    serve = commands.add_parser('serve', help='Run the server')
+    serve.add_argument('--host', default=DEFAULT_HOST, help='Address to listen on')
+    serve.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port to listen on')
+    serve.add_argument('-w', '--workers', type=int, default=None, help='Number of worker processes')
+    serve.add_argument('-l', '--lang', dest='language', default=None, help='Default language for jobs')
+    serve.add_argument('--max-worker-pages', dest='max_worker_pages', type=int, default=None,
+                       help='Replace each worker process after it has done this many pages')
+    serve.add_argument('--max-worker-rss', dest='max_worker_rss', type=int, default=None,
+                       help='Replace worker processes that have more than this many MB resident')
+    submit = commands.add_parser('submit', help='Queue a file')
+    submit.add_argument('-o', '--output-dir', dest='output_dir', required=True,
+                        help='Directory to place image and HOCR files')
+    submit.add_argument('-l', '--lang', dest='language', default=None, help='Language to use for HOCR')
+    submit.add_argument('-p', '--priority', type=int, default=0, help='Higher runs sooner')
+    submit.add_argument('--wait', action='store_true', help='Wait for the job to finish')
+    submit.add_argument('file', help='The PDF file to parse.')
+    status = commands.add_parser('status', help='Show the server or one job')
+    status.add_argument('job', nargs='?', default=None, help='Job id')
+    cancel = commands.add_parser('cancel', help='Cancel a job')
+    cancel.add_argument('job', help='Job id')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        hocr = Hocr(workers=args.workers)
+        try:
+            hocr.set_language(args.language or hocr.get_languages()[0])
+            hocr.set_worker_limits(args.max_worker_pages,
+                                   args.max_worker_rss * 1000000 if args.max_worker_rss is not None else None)
+        except HocrException as e:
+            parser.error(e)
+        server = HocrServer(hocr, args.host, args.port)
+        print('Listening on http://{}:{} with {} workers'.format(args.host, args.port, hocr.get_workers()))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    if args.command is None:
+        parser.error('Choose a command')
+    client = HocrClient(args.url)
+    try:
+        if args.command == 'submit':
+            result = client.submit(args.file, args.output_dir, args.language, args.priority)
+            if args.wait:
+                result = client.wait(result['id'])
+        elif args.command == 'status':
+            result = client.status() if args.job is None else client.job(args.job)
+        else:
+            result = client.cancel(args.job)
+    except (HocrException, urllib.error.URLError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(result, indent=2))
+    sys.exit(1 if result.get('status') in (Job.failed, Job.cancelled) else 0)
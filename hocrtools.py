@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+import importlib
+import json
+import os
+import os.path
+import shutil
+import tempfile
+import time
+
+
+class CachedTool:
+    """A pyocr tool as found by find_tool().
+
+    Its name, version and languages come from the discovery cache, the pyocr module itself is only imported
+    when something else, like image_to_string(), is asked of it. __name__ is the module's name, so pool
+    workers can import the tool by name as they would the module.
+    """
+
+    def __init__(self, info, module=None):
+        self.info = info
+        self.module = module
+        self.__name__ = info['module']
+
+    def get_name(self):
+        return self.info['name']
+
+    def get_version(self):
+        return tuple(self.info['version'])
+
+    def get_available_languages(self):
+        return list(self.info['languages'])
+
+    def load(self):
+        """The pyocr tool module, imported on first use."""
+        if self.module is None:
+            self.module = importlib.import_module(self.__name__)
+        return self.module
+
+    def __getstate__(self):
+        # Modules can't be pickled, a process started with spawn imports the tool again.
+        return {'info': self.info, 'module': None, '__name__': self.__name__}
+
+    def __getattr__(self, name):
+        # Only called for what isn't answered above.
+        if name in ('info', 'module'):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+
+cache_version = 1
+# Languages can be added without the tool changing, so look again now and then anyway.
+max_age = 7 * 24 * 3600
+
+
+def cache_path():
+    """Where the discovered tool is kept, in the user's cache directory."""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'hocreditor', 'tools.json')
+
+
+def tool_binary(module_name):
+    """The path and modification time of the program or library a pyocr tool runs, (None, None) if unknown.
+
+    Only the program name is looked up, so this does not import pyocr.
+    """
+    commands = {'pyocr.tesseract': 'tesseract.exe' if os.name == 'nt' else 'tesseract',
+                'pyocr.cuneiform': 'cuneiform'}
+    if module_name in commands:
+        path = shutil.which(commands[module_name])
+        if path is not None:
+            path = os.path.realpath(path)
+            return path, os.stat(path).st_mtime_ns
+    return None, None
+
+
+def is_current(info):
+    """Is a cached tool still the one installed?"""
+    if info.get('cache_version') != cache_version or time.time() - info.get('discovered', 0) > max_age:
+        return False
+    if info.get('tessdata_prefix') != os.environ.get('TESSDATA_PREFIX'):
+        return False
+    (path, mtime) = tool_binary(info['module'])
+    return path == info.get('binary') and mtime == info.get('binary_mtime')
+
+
+def read_cache(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def write_cache(path, info):
+    """Write the cache atomically, a cache we can't write only means discovering again next time."""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        (handle, temp_path) = tempfile.mkstemp(prefix='.tools', dir=os.path.dirname(path))
+        with os.fdopen(handle, 'w', encoding='utf-8') as fp:
+            json.dump(info, fp, indent=1)
+        os.replace(temp_path, path)
+    except OSError:
+        pass
+
+
+def describe_tool(tool):
+    """What the cache keeps of a pyocr tool."""
+    (binary, binary_mtime) = tool_binary(tool.__name__)
+    return {
+        'cache_version': cache_version,
+        'module': tool.__name__,
+        'name': tool.get_name(),
+        'version': list(tool.get_version()),
+        'languages': list(tool.get_available_languages()),
+        'binary': binary,
+        'binary_mtime': binary_mtime,
+        'tessdata_prefix': os.environ.get('TESSDATA_PREFIX'),
+        'discovered': time.time(),
+    }
+
+
+def find_tool(refresh=False, path=None):
+    """The OCR tool pyocr recommends, as a CachedTool, None if there is none.
+
+    pyocr finds tools and their languages by running them, which takes a while, so what it found is
+    cached in path (by default cache_path()) for as long as the tool's program has the same path and
+    modification time. refresh ignores the cache.
+    """
+    if path is None:
+        path = cache_path()
+    if not refresh:
+        info = read_cache(path)
+        if info is not None and is_current(info):
+            return CachedTool(info)
+    import pyocr
+    tools = pyocr.get_available_tools()
+    if len(tools) == 0:
+        return None
+    # The tools are returned in the recommended order of usage
+    tool = tools[0]
+    info = describe_tool(tool)
+    write_cache(path, info)
+    return CachedTool(info, tool)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+import tkinter as tk
+
+
+class VirtualListbox(tk.Frame):
+    """A single selection list that only creates the rows in view.
+
+    Rows are produced on demand by label_for(index), so a list of thousands of pages costs as much as
+    the handful of rows on screen. curselection() and get() take and give indexes into the whole list,
+    as with a tk.Listbox.
+    """
+
+    def __init__(self, master, label_for=None, count=0, height=10, **kwargs):
+        tk.Frame.__init__(self, master)
+        self.label_for = label_for
+        self.count = count
+        self.height = height
+        self.first = 0
+        self.selected = None
+        self.listbox = tk.Listbox(self, selectmode=tk.SINGLE, height=height, exportselection=False, **kwargs)
+        self.scrollbar = tk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=1)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.listbox.bind('<<ListboxSelect>>', self.__selected)
+        self.listbox.bind('<MouseWheel>', self.__wheel)
+        self.listbox.bind('<Button-4>', self.__wheel)
+        self.listbox.bind('<Button-5>', self.__wheel)
+        self.listbox.bind('<Up>', lambda event: self.__step(-1))
+        self.listbox.bind('<Down>', lambda event: self.__step(1))
+        self.__fill()
+
+    def set_items(self, count, label_for=None):
+        """Show count rows, keeping the view and selection where they still exist."""
+        if label_for is not None:
+            self.label_for = label_for
+        self.count = count
+        if self.selected is not None and self.selected >= count:
+            self.selected = None
+        self.first = max(0, min(self.first, count - self.height))
+        self.__fill()
+
+    def size(self):
+        return self.count
+
+    def get(self, index):
+        """The label of row index."""
+        return self.label_for(index)
+
+    def curselection(self):
+        """The selected index as a tuple, empty if there is none."""
+        return () if self.selected is None else (self.selected, )
+
+    def select(self, index):
+        """Select row index and scroll it into view."""
+        self.selected = index
+        self.see(index)
+
+    def selection_clear(self):
+        self.selected = None
+        self.__fill()
+
+    def see(self, index):
+        if index < self.first:
+            self.first = index
+        elif index >= self.first + self.height:
+            self.first = index - self.height + 1
+        self.__fill()
+
+    def yview(self, *args):
+        """Scrollbar command."""
+        if len(args) == 0:
+            return
+        if args[0] == tk.MOVETO:
+            self.first = int(float(args[1]) * self.count)
+        elif args[0] == tk.SCROLL:
+            step = self.height if args[2] == tk.PAGES else 1
+            self.first += int(args[1]) * step
+        self.first = max(0, min(self.first, self.count - self.height))
+        self.__fill()
+
+    def __fill(self):
+        """Put the rows in view in the listbox."""
+        last = min(self.first + self.height, self.count)
+        self.listbox.delete(0, tk.END)
+        for index in range(self.first, last):
+            self.listbox.insert(tk.END, self.label_for(index))
+        self.listbox.selection_clear(0, tk.END)
+        if self.selected is not None and self.first <= self.selected < last:
+            self.listbox.selection_set(self.selected - self.first)
+        if self.count > 0:
+            self.scrollbar.set(self.first / self.count, last / self.count)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def __selected(self, event):
+        rows = self.listbox.curselection()
+        if len(rows) > 0:
+            self.selected = self.first + rows[0]
+
+    def __wheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.yview(tk.SCROLL, -1, tk.UNITS)
+        else:
+            self.yview(tk.SCROLL, 1, tk.UNITS)
+
+    def __step(self, direction):
+        """Move the selection with the arrow keys, scrolling past the rows in view."""
+        current = self.selected if self.selected is not None else self.first - direction
+        self.select(max(0, min(current + direction, self.count - 1)))
+        return 'break'
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+import hocr
+import stubocr
+from hocr import Hocr
+from hocrrender import Renderer, renderers
+from synthetic import write_text_pdf
+
+
+class StubPage:
+    """Stands in for the Wand image of a rendered page."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        pass
+
+
+class StubRenderer(Renderer):
+    """Renders blank pages without ImageMagick, and kills the worker process rendering a page in crash_pages."""
+
+    name = 'stub'
+    crash_pages = ()
+
+    def render(self, page_number, resolution=None):
+        if page_number in self.crash_pages:
+            os._exit(1)
+        return StubPage()
+
+
+def blank_image(png):
+    return Image.new('L', (120, 160), 255)
+
+
+class Progress:
+    """Takes the progress events of a run, and sets stop once stop_after pages are done."""
+
+    def __init__(self, stop=None, stop_after=None):
+        self.events = []
+        self.stop = stop
+        self.stop_after = stop_after
+
+    def send(self, event):
+        self.events.append(event)
+        if self.stop is not None and len(self.pages('done')) >= self.stop_after:
+            self.stop.set()
+
+    def close(self):
+        pass
+
+    def pages(self, status):
+        return [event for event in self.events if event['event'] == 'page' and event['status'] == status]
+
+
+class WorkerPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.pdf = write_text_pdf(os.path.join(self.directory, 'doc.pdf'), 12, lines=2)
+        self.output = os.path.join(self.directory, 'out')
+        os.mkdir(self.output)
+        # Pool workers are forked, so they see the stub renderer and the patched wand_to_pil too.
+        renderers[StubRenderer.name] = StubRenderer
+        patcher = mock.patch.object(hocr, 'wand_to_pil', blank_image)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        StubRenderer.crash_pages = ()
+        del renderers[StubRenderer.name]
+        shutil.rmtree(self.directory)
+
+    def make_hocr(self, workers=2):
+        tool = Hocr(language='eng', output_directory=self.output, workers=workers, renderer=StubRenderer.name,
+                    tool=stubocr)
+        tool.set_image_format('none')
+        return tool
+
+    def test_worker_dying_fails_only_its_page(self):
+        StubRenderer.crash_pages = (5, )
+        progress = Progress()
+        [document] = self.make_hocr().run_batch([self.pdf], pipe=progress)
+        self.assertEqual(sorted(document.failed), [5])
+        self.assertEqual(document.processed, 11)
+        self.assertEqual(sorted(event['page'] for event in progress.pages('done')),
+                         [page_number for page_number in range(12) if page_number != 5])
+
+    def test_workers_are_replaced_after_max_pages(self):
+        tool = self.make_hocr()
+        tool.set_worker_limits(max_pages=2)
+        progress = Progress()
+        [document] = tool.run_batch([self.pdf], pipe=progress)
+        self.assertEqual((document.processed, document.failed), (12, {}))
+        # Each pool of two workers is handed four pages, three pools for twelve pages.
+        self.assertGreaterEqual(len(set(event['pid'] for event in progress.pages('done'))), 3)
+
+    def test_resume_after_stop(self):
+        stop = threading.Event()
+        progress = Progress(stop, stop_after=3)
+        [document] = self.make_hocr().run_batch([self.pdf], pipe=progress, stop=stop)
+        self.assertEqual(document.get_status(), 'stopped')
+        self.assertGreaterEqual(document.processed, 3)
+        self.assertLess(document.processed, 12)
+        done = set(event['page'] for event in progress.pages('done'))
+
+        progress = Progress()
+        [document] = self.make_hocr().run_batch([self.pdf], pipe=progress, stop=threading.Event())
+        self.assertEqual(document.get_status(), 'ok')
+        self.assertEqual(document.skipped, len(done))
+        resumed = set(event['page'] for event in progress.pages('done'))
+        self.assertEqual(resumed, set(range(12)) - done)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import PyPDF2
+from PIL import Image
+
+from hocrexport import Exporter, PngImage, export_directory, read_image
+from hocrmanifest import Manifest
+from hocrpage import HocrPage
+
+hocr_template = ('<html><body><div class="ocr_page" title="bbox 0 0 {width} {height}">\n'
+                 '<span class="ocr_line" title="bbox 10 10 200 40">'
+                 '<span class="ocrx_word" title="bbox 10 10 90 40; x_wconf 90">{first}</span> '
+                 '<span class="ocrx_word" title="bbox 110 10 200 40; x_wconf 80">{second}</span></span>\n'
+                 '</div></body></html>\n')
+
+
+def gray_image(width, height, seed=1):
+    """A gray image with gradients and noise, so the PNG encoder uses all of its row filters."""
+    generator = random.Random(seed)
+    image = Image.new('L', (width, height))
+    image.putdata([(x * 3 + y) % 256 if (x // 50 + y // 50) % 2 else generator.randrange(256)
+                   for y in range(height) for x in range(width)])
+    return image
+
+
+class ExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def add_page(self, page_number, first, second, image=None, size=(600, 400)):
+        with open(os.path.join(self.directory, 'Page{}.hocr'.format(page_number)), 'w', encoding='utf-8') as fp:
+            fp.write(hocr_template.format(width=size[0], height=size[1], first=first, second=second))
+        if image is not None:
+            image.save(os.path.join(self.directory, 'Page{}.png'.format(page_number)))
+
+    def test_png_is_copied_as_it_is(self):
+        image = gray_image(600, 400)
+        self.add_page(0, 'Hello', 'world', image)
+        png = read_image(os.path.join(self.directory, 'Page0.png'))
+        self.assertIsInstance(png, PngImage)
+        self.assertEqual((png.size, png.bits), ((600, 400), 8))
+        self.assertGreater(len(png.chunks), 1)
+
+    def test_pdf_reopens_with_the_original_pixels(self):
+        image = gray_image(600, 400)
+        self.add_page(0, 'Hello', 'world', image)
+        self.add_page(1, 'Second', 'page', Image.new('1', (300, 200), 1), size=(300, 200))
+        self.add_page(2, 'Only', 'text')
+        manifest = Manifest(self.directory)
+        manifest.record_page(0, {}, {}, resolution=150)
+        manifest.save()
+        pdf_path = os.path.join(self.directory, Exporter.pdf_filename)
+        exporter = export_directory(self.directory, None, pdf_path)
+        self.assertEqual(exporter.errors, {})
+
+        with open(pdf_path, 'rb') as fp:
+            pdf = PyPDF2.PdfFileReader(fp)
+            self.assertEqual(pdf.getNumPages(), 3)
+
+            page = pdf.getPage(0)
+            self.assertAlmostEqual(float(page.mediaBox.getWidth()), 600 * 72 / 150, places=2)
+            self.assertAlmostEqual(float(page.mediaBox.getHeight()), 400 * 72 / 150, places=2)
+            xobject = page['/Resources']['/XObject']['/Im0'].getObject()
+            self.assertEqual(xobject['/DecodeParms']['/Predictor'], 15)
+            data = xobject.getData()
+            if isinstance(data, str):
+                data = data.encode('latin-1')
+            self.assertEqual(data, image.tobytes())
+            text = page.extractText()
+            self.assertIn('Hello', text)
+            self.assertIn('world', text)
+
+            xobject = pdf.getPage(1)['/Resources']['/XObject']['/Im0'].getObject()
+            self.assertEqual((xobject['/Width'], xobject['/Height'], xobject['/BitsPerComponent']), (300, 200, 1))
+
+            # Without an image or a source PDF the page is the size of its hOCR, at the default resolution.
+            page = pdf.getPage(2)
+            self.assertNotIn('/XObject', page['/Resources'])
+            self.assertAlmostEqual(float(page.mediaBox.getWidth()), 200 * 72 / 300, places=2)
+            self.assertIn('Only', page.extractText())
+
+    def test_pages_are_written_in_order(self):
+        for page_number in range(4):
+            self.add_page(page_number, 'page', str(page_number))
+        hocr_path = os.path.join(self.directory, Exporter.hocr_filename)
+        exporter = Exporter(self.directory, range(4), hocr_path)
+        exporter.ready(2)
+        exporter.ready(0)
+        exporter.ready(3)
+        exporter.ready(1, failed=True)
+        exporter.close()
+        self.assertEqual([name for name in os.listdir(self.directory) if name.startswith('.export')], [])
+        page = HocrPage.load(hocr_path)
+        self.assertEqual([page.get_line_text(line) for line in range(page.line_count())],
+                         ['page 0', 'page 2', 'page 3'])
+
+    def test_discard_keeps_the_earlier_export(self):
+        self.add_page(0, 'page', '0')
+        hocr_path = os.path.join(self.directory, Exporter.hocr_filename)
+        with open(hocr_path, 'w', encoding='utf-8') as fp:
+            fp.write('complete')
+        exporter = Exporter(self.directory, range(3), hocr_path, os.path.join(self.directory, Exporter.pdf_filename))
+        exporter.ready(0)
+        exporter.discard()
+        with open(hocr_path, 'r', encoding='utf-8') as fp:
+            self.assertEqual(fp.read(), 'complete')
+        self.assertEqual(sorted(name for name in os.listdir(self.directory) if not name.startswith('Page')),
+                         [Exporter.hocr_filename])
+
+    def test_unreadable_image_is_left_out(self):
+        self.add_page(0, 'Good', 'page', gray_image(60, 40))
+        self.add_page(1, 'Bad', 'page')
+        with open(os.path.join(self.directory, 'Page1.png'), 'wb') as fp:
+            fp.write(b'not an image')
+        pdf_path = os.path.join(self.directory, Exporter.pdf_filename)
+        exporter = export_directory(self.directory, None, pdf_path)
+        self.assertEqual(sorted(exporter.errors), [1])
+        with open(pdf_path, 'rb') as fp:
+            self.assertEqual(PyPDF2.PdfFileReader(fp).getNumPages(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
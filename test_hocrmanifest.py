@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import tempfile
+import unittest
+
+from hocrmanifest import Manifest, describe_files
+
+
+class ManifestTest(unittest.TestCase):
+
+    settings = {'language': 'eng', 'resolution': 300}
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, 'source.pdf')
+        self.write('source.pdf', b'%PDF-1.4 source')
+        self.hocr = self.write('Page0.hocr', b'<html>words</html>')
+        self.image = self.write('Page0.png', b'pixels')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as fp:
+            fp.write(data)
+        return path
+
+    def record(self):
+        manifest = Manifest(self.directory)
+        manifest.set_source(self.source)
+        manifest.record_page(0, self.settings, describe_files([self.hocr, self.image]), resolution=300)
+        manifest.save()
+        return manifest
+
+    def is_current(self, settings=None, outputs=('Page0.hocr', 'Page0.png')):
+        manifest = Manifest(self.directory)
+        manifest.set_source(self.source)
+        return manifest.is_current(0, settings or self.settings, list(outputs))
+
+    def test_current_after_reload(self):
+        self.record()
+        self.assertTrue(self.is_current())
+        self.assertEqual(Manifest(self.directory).get_resolution(0), 300)
+
+    def test_changed_output_is_not_current(self):
+        self.record()
+        self.write('Page0.hocr', b'<html>wordz</html>')
+        self.assertFalse(self.is_current())
+
+    def test_resized_or_missing_output_is_not_current(self):
+        self.record()
+        self.write('Page0.png', b'more pixels')
+        self.assertFalse(self.is_current())
+        self.record()
+        os.unlink(self.image)
+        self.assertFalse(self.is_current())
+
+    def test_other_settings_or_outputs_are_not_current(self):
+        self.record()
+        self.assertFalse(self.is_current(settings={'language': 'deu', 'resolution': 300}))
+        self.assertFalse(self.is_current(outputs=('Page0.hocr', 'Page0.webp')))
+        self.assertFalse(Manifest(self.directory).is_current(1, self.settings, ['Page1.hocr']))
+
+    def test_changed_source_forgets_pages(self):
+        self.record()
+        self.write('source.pdf', b'%PDF-1.4 another source')
+        self.assertFalse(self.is_current())
+
+    def test_update_outputs_after_rewrite(self):
+        manifest = self.record()
+        self.write('Page0.hocr', b'<html>new words</html>')
+        manifest.update_outputs(0, describe_files([self.hocr]))
+        manifest.save()
+        self.assertTrue(self.is_current())
+
+    def test_damaged_manifest_is_ignored(self):
+        self.write(Manifest.filename, b'{not json')
+        self.assertIsNone(Manifest(self.directory).get_page(0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+import unittest
+
+from hocrpage import HocrPage
+
+
+def make_page(lines):
+    """A HocrPage of lines, each a list of (text, bbox)."""
+    page = HocrPage()
+    for words in lines:
+        page.add_line((min(bbox[0] for (text, bbox) in words), min(bbox[1] for (text, bbox) in words),
+                       max(bbox[2] for (text, bbox) in words), max(bbox[3] for (text, bbox) in words)))
+        for (text, bbox) in words:
+            page.add_word(text, bbox, 90)
+    return page
+
+
+def texts(page):
+    return [page.get_line_text(line) for line in range(page.line_count())]
+
+
+sample = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN"
+ "http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">
+<html xmlns="http://www.w3.org/1999/xhtml">
+<head><meta http-equiv="content-type" content="text/html; charset=utf-8" /><title>page</title></head>
+<body>
+<div class="ocr_page" title="bbox 0 0 1000 800">
+<span class="ocr_line" title="bbox 10 10 400 40"><span class="ocrx_word" title="bbox 10 10 100 40; x_wconf 91">Caf&eacute;</span>
+<span class="ocrx_word" title="bbox 120 10 400 40; x_wconf 87"><strong>Fish &amp; chips</strong></span></span>
+<br/>
+<span class="ocr_caption" title="bbox 10 700 990 760"><span class="ocrx_word" title="bbox 10 700 990 760">Last</span></span>
+</div>
+</body>
+</html>
+"""
+
+
+class HocrPageTest(unittest.TestCase):
+
+    def setUp(self):
+        (handle, self.path) = tempfile.mkstemp(suffix='.hocr')
+        with os.fdopen(handle, 'w', encoding='utf-8') as fp:
+            fp.write(sample)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def test_load_in_small_chunks(self):
+        # Chunks this small split tags, attributes and entities.
+        for chunk_size in (3, 7, 65536):
+            page = HocrPage.load(self.path, chunk_size)
+            self.assertEqual(texts(page), ['Caf\u00e9 Fish & chips', 'Last'])
+            self.assertEqual(page.line_count(), 2)
+            self.assertEqual(page.get_line_bbox(1), (10, 700, 990, 760))
+            word = page.get_word(1)
+            self.assertEqual((word.text, word.bbox, word.confidence, word.line),
+                             ('Fish & chips', (120, 10, 400, 40), 87, 0))
+            self.assertEqual(page.get_word(2).confidence, 0)
+            self.assertEqual((page.width, page.height), (990, 760))
+
+    def test_words_at_and_in(self):
+        page = HocrPage.load(self.path)
+        self.assertEqual(page.words_at(50, 20), [0])
+        self.assertEqual(page.words_at(110, 20), [])
+        self.assertEqual(page.words_in(0, 0, 1000, 50), [0, 1])
+        self.assertEqual(page.words_in(300, 30, 500, 710), [1, 2])
+        self.assertEqual(page.lines_in(0, 600, 50, 800), [1])
+
+
+class ReplaceWordsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.page = make_page([[('Hello', (0, 0, 90, 20)), ('world', (110, 0, 200, 20))],
+                               [('Next', (0, 40, 90, 60)), ('line', (110, 40, 200, 60))]])
+
+    def test_part_of_a_line_is_merged_in_x_order(self):
+        found = [((110, 0, 200, 20), [('WORLD', (110, 0, 200, 20), 95)])]
+        page = self.page.replace_words([((100, 0, 210, 25), found)])
+        self.assertEqual(texts(page), ['Hello WORLD', 'Next line'])
+        self.assertEqual(page.get_line_bbox(0), (0, 0, 200, 20))
+
+    def test_start_of_a_line_is_merged_in_x_order(self):
+        found = [((0, 0, 90, 20), [('HELLO', (0, 0, 90, 20), 95)])]
+        page = self.page.replace_words([((0, 0, 95, 25), found)])
+        self.assertEqual(texts(page), ['HELLO world', 'Next line'])
+
+    def test_several_lines_go_after_what_is_left_of_the_first(self):
+        found = [((110, 0, 200, 20), [('WORLD', (110, 0, 200, 20), 95)]),
+                 ((110, 40, 200, 60), [('LINE', (110, 40, 200, 60), 95)])]
+        page = self.page.replace_words([((100, 0, 210, 65), found)])
+        self.assertEqual(texts(page), ['Hello', 'WORLD', 'LINE', 'Next'])
+
+    def test_whole_lines_are_replaced_in_place(self):
+        found = [((0, 40, 200, 60), [('NEXT', (0, 40, 90, 60), 95), ('LINE', (110, 40, 200, 60), 95)])]
+        page = self.page.replace_words([((0, 30, 210, 65), found)])
+        self.assertEqual(texts(page), ['Hello world', 'NEXT LINE'])
+
+    def test_region_without_words_goes_before_the_line_below(self):
+        found = [((0, 26, 90, 34), [('between', (0, 26, 90, 34), 95)])]
+        page = self.page.replace_words([((0, 25, 210, 35), found)])
+        self.assertEqual(texts(page), ['Hello world', 'between', 'Next line'])
+
+    def test_nothing_found_drops_the_words(self):
+        page = self.page.replace_words([((0, 30, 210, 65), [])])
+        self.assertEqual(texts(page), ['Hello world'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+import threading
+import time
+import unittest
+
+from hocrpipeline import Pipeline, PipelineException
+
+
+class PipelineTest(unittest.TestCase):
+
+    def test_items_pass_every_stage_in_order(self):
+        done = []
+        pipeline = Pipeline()
+        pipeline.add_stage('double', lambda item: item * 2, 1)
+        pipeline.add_stage('add', lambda item: item + 1, 1)
+        pipeline.add_stage('collect', done.append, 1)
+        self.assertTrue(pipeline.run(range(20)))
+        self.assertEqual(done, [item * 2 + 1 for item in range(20)])
+        stats = pipeline.get_stats()
+        self.assertEqual([stats[name]['items'] for name in ('double', 'add', 'collect')], [20, 20, 20])
+
+    def test_queues_are_bounded(self):
+        started = []
+        release = threading.Event()
+        pipeline = Pipeline()
+        pipeline.add_stage('first', lambda item: started.append(item) or item, 2)
+        pipeline.add_stage('slow', lambda item: release.wait(), 2)
+        thread = threading.Thread(target=pipeline.run, args=(range(50), ))
+        thread.start()
+        time.sleep(0.3)
+        # One item in each stage and a full queue in front of the slow one.
+        self.assertLessEqual(len(started), 5)
+        release.set()
+        thread.join()
+        self.assertEqual(len(started), 50)
+        self.assertLessEqual(pipeline.get_stats()['slow']['queue_max'], 2)
+
+    def test_error_stops_the_pipeline_and_is_raised(self):
+        def fail(item):
+            if item == 3:
+                raise ValueError('bad item')
+            return item
+
+        pipeline = Pipeline()
+        pipeline.add_stage('fail', fail, 1)
+        pipeline.add_stage('collect', lambda item: item, 1)
+        with self.assertRaises(ValueError):
+            pipeline.run(range(1000))
+        self.assertLess(pipeline.get_stats()['fail']['items'], 1000)
+
+    def test_stop_drops_queued_items(self):
+        stop = threading.Event()
+        processed = []
+        dropped = []
+
+        def slow(item):
+            if item == 2:
+                stop.set()
+            time.sleep(0.01)
+            return item
+
+        pipeline = Pipeline()
+        pipeline.add_stage('slow', slow, 4, dropped.append)
+        pipeline.add_stage('collect', processed.append, 4, dropped.append)
+        pipeline.run(range(20), stop)
+        # The item in hand when stop was set gets through its stage and is dropped by the next one, the
+        # items after it are dropped or never fed in.
+        self.assertTrue(set(processed) <= {0, 1})
+        self.assertIn(2, dropped)
+        self.assertEqual(len(processed + dropped), len(set(processed + dropped)))
+        self.assertLess(pipeline.get_stats()['slow']['items'], 20)
+
+    def test_needs_a_stage(self):
+        with self.assertRaises(PipelineException):
+            Pipeline().run([1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import tempfile
+import unittest
+
+from hocrpage import HocrPage
+from hocrsearch import SearchIndex
+
+
+def make_page(*words):
+    """A one line HocrPage of words, laid out left to right."""
+    page = HocrPage()
+    for (number, text) in enumerate(words):
+        page.add_word(text, (number * 100, 0, number * 100 + 90, 20), 80 + number)
+    return page
+
+
+def found(index, query, prefix=True):
+    return [(hit.term, hit.page, hit.word) for hit in index.search(query, prefix)]
+
+
+class SearchIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index = SearchIndex(self.directory)
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.directory)
+
+    def test_search_before_compacting(self):
+        self.index.add_page(0, make_page('Hello,', 'world'))
+        self.index.add_page(1, make_page('hello', 'help'))
+        self.assertEqual(found(self.index, 'HELLO'), [('hello', 0, 0), ('hello', 1, 0)])
+        self.assertEqual(found(self.index, 'hel'), [('hello', 0, 0), ('hello', 1, 0), ('help', 1, 1)])
+        self.assertEqual(found(self.index, 'hel', prefix=False), [])
+        self.assertEqual(found(self.index, '...'), [])
+
+    def test_compact_and_reload(self):
+        self.index.add_page(0, make_page('Hello', 'world'))
+        self.index.add_page(3, make_page('wide', 'World!'))
+        self.index.compact()
+        self.assertFalse(os.path.exists(os.path.join(self.directory, SearchIndex.log_filename)))
+        self.index.close()
+
+        index = SearchIndex(self.directory)
+        try:
+            self.assertTrue(index.has_page(0))
+            self.assertTrue(index.has_page(3))
+            self.assertFalse(index.has_page(1))
+            self.assertEqual(found(index, 'world'), [('world', 0, 1), ('world', 3, 1)])
+            self.assertEqual(found(index, 'w'), [('world', 0, 1), ('wide', 3, 0), ('world', 3, 1)])
+            hit = index.search('wide')[0]
+            self.assertEqual(hit.bbox, (0, 0, 90, 20))
+            self.assertEqual(hit.confidence, 80)
+        finally:
+            index.close()
+
+    def test_log_replaces_a_compacted_page(self):
+        self.index.add_page(0, make_page('old', 'words'))
+        self.index.add_page(1, make_page('other', 'words'))
+        self.index.compact()
+        self.index.add_page(0, make_page('new', 'words'))
+        self.assertEqual(found(self.index, 'old'), [])
+        self.assertEqual(found(self.index, 'new'), [('new', 0, 0)])
+        self.assertEqual(found(self.index, 'words'), [('words', 0, 1), ('words', 1, 1)])
+
+        # Another process reading the same directory sees the log too.
+        other = SearchIndex(self.directory)
+        try:
+            self.assertEqual(found(other, 'old'), [])
+            self.assertEqual(found(other, 'new'), [('new', 0, 0)])
+        finally:
+            other.close()
+
+        self.index.compact()
+        self.index.close()
+        index = SearchIndex(self.directory)
+        try:
+            self.assertEqual(found(index, 'old'), [])
+            self.assertEqual(found(index, 'new'), [('new', 0, 0)])
+            self.assertEqual(found(index, 'words'), [('words', 0, 1), ('words', 1, 1)])
+        finally:
+            index.close()
+
+    def test_limit_keeps_the_first_hits_in_page_order(self):
+        for page_number in range(10):
+            self.index.add_page(page_number, make_page('wa{}'.format(9 - page_number), 'wb', 'other'))
+        self.index.compact()
+        self.index.add_page(3, make_page('wz', 'other'))
+        hits = found(self.index, 'w')
+        self.assertEqual(len(hits), 19)
+        self.assertEqual([(page, word) for (term, page, word) in hits],
+                         sorted((page, word) for (term, page, word) in hits))
+        hits = [(hit.term, hit.page, hit.word) for hit in self.index.search('w', limit=8)]
+        self.assertEqual(hits, [('wa9', 0, 0), ('wb', 0, 1), ('wa8', 1, 0), ('wb', 1, 1), ('wa7', 2, 0),
+                                ('wb', 2, 1), ('wz', 3, 0), ('wa5', 4, 0)])
+
+    def test_log_replaces_a_logged_page(self):
+        self.index.add_page(2, make_page('first'))
+        self.index.add_page(2, make_page('second'))
+        self.assertEqual(found(self.index, 'first'), [])
+        self.assertEqual(found(self.index, 'second'), [('second', 2, 0)])
+        self.index.compact()
+        self.assertEqual(found(self.index, 'first'), [])
+        self.assertEqual(found(self.index, 'second'), [('second', 2, 0)])
+
+
+if __name__ == '__main__':
+    unittest.main()